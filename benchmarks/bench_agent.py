@@ -0,0 +1,311 @@
+"""
+End-to-end benchmark of Agent.answer_question against stubbed backends.
+
+A real Agent graph is built with a fake chat model, an in-memory vector store
+and stub tools, each with a configurable simulated latency, so the numbers
+measure the graph and agent overhead rather than the providers.
+
+Usage:
+    python benchmarks/bench_agent.py --output bench.json
+"""
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from importlib import metadata
+from typing import Any
+from uuid import UUID
+
+import click
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
+
+from the_bot.agents.core import Agent
+from the_bot.runner import run_tasks
+
+STAGES = ("retriever", "assistant", "tools")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering from a script: questions mentioning "tool" first call
+    the stub search tool, every question then gets a short final answer.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages: list[BaseMessage]) -> AIMessage:
+        question = next(m for m in messages if isinstance(m, HumanMessage)).content
+        if "tool" in question and not any(isinstance(m, ToolMessage) for m in messages):
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": "stub_search", "args": {"query": question[:40]}, "id": f"call-{len(messages)}"}],
+                usage_metadata={"input_tokens": 100, "output_tokens": 10, "total_tokens": 110},
+            )
+        return AIMessage(
+            content="Final answer: 42",
+            usage_metadata={"input_tokens": 100, "output_tokens": 5, "total_tokens": 105},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+
+def make_stub_tool(latency: float):
+    @tool
+    def stub_search(query: str) -> str:
+        """Search stub returning a fixed document.
+
+        Args:
+            query: The search query.
+        """
+        if latency:
+            time.sleep(latency)
+        return f"<Document source=\"stub\"/>\nStub result for {query}\n</Document>"
+
+    return stub_search
+
+
+class StageTimer(BaseCallbackHandler):
+    """Collect the wall time of each graph node and tool run."""
+
+    def __init__(self):
+        self.starts: dict[UUID, tuple[str, float]] = {}
+        self.durations: dict[str, list[float]] = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        # A node and the runnable it wraps can share a name, only time the outer one
+        parent = self.starts.get(parent_run_id)
+        if name in STAGES and not (parent and parent[0] == name):
+            self.starts[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        if run_id in self.starts:
+            name, start = self.starts.pop(run_id)
+            self.durations[name].append(time.perf_counter() - start)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self.starts[run_id] = ("tool_run", time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        if run_id in self.starts:
+            name, start = self.starts.pop(run_id)
+            self.durations[name].append(time.perf_counter() - start)
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Latency summary in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": 1000 * statistics.fmean(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+def make_questions(n: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "task_id": f"bench-{i}",
+            "question": f"Question {i}: " + ("use a tool to look this up" if i % 2 else "answer directly"),
+            "file_name": "",
+        }
+        for i in range(n)
+    ]
+
+
+def build_store(documents: int) -> InMemoryVectorStore:
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=768))
+    store.add_texts([f"Question : reference question {i}\n\nFinal answer : {i}" for i in range(documents)])
+    return store
+
+
+def build_agent(llm_latency: float, tool_latency: float, documents: int, store: VectorStore | None = None) -> Agent:
+    # Without a retrieval cache, every question is searched, as on its first run
+    return Agent(
+        llm=FakeChatModel(latency=llm_latency),
+        vector_store=store or build_store(documents),
+        tools=[make_stub_tool(tool_latency)],
+        system_prompt="You are a benchmark assistant.",
+        retrieval_cache_size=0,
+    )
+
+
+def bench_build(repeat: int, llm_latency: float, tool_latency: float, documents: int) -> dict[str, float]:
+    """
+    Time the cold construction of an agent around an already filled vector store.
+
+    Each agent is closed before the next build, so none reuses the shared resources of the previous one.
+    """
+    store = build_store(documents)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        agent = build_agent(llm_latency, tool_latency, documents, store)
+        samples.append(time.perf_counter() - start)
+        agent.close()
+    return summarize(samples)
+
+
+def bench_stages(agent: Agent, questions: list[dict[str, Any]]) -> dict[str, Any]:
+    timer = StageTimer()
+    graph = agent.agent
+    agent.agent = graph.with_config(callbacks=[timer])
+    try:
+        for task in questions:
+            agent.answer_question(task["question"], raise_errors=True)
+    finally:
+        agent.agent = graph
+
+    stages = {name: summarize(timer.durations[name]) for name in STAGES}
+    stages["tool_run"] = summarize(timer.durations["tool_run"])
+    # Time spent in the ToolNode around the tool bodies themselves
+    overhead = [t - r for t, r in zip(timer.durations["tools"], timer.durations["tool_run"], strict=False)]
+    stages["tool_dispatch"] = summarize(overhead)
+    return stages
+
+
+def bench_clean_answer(agent: Agent, iterations: int) -> dict[str, float]:
+    raw = ["The answer is 42", '"Paris"', "Final answer: b, e", 1234.5, 12.0, "  Rd5  "]
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        for answer in raw:
+            agent._clean_answer(answer)
+        samples.append((time.perf_counter() - start) / len(raw))
+    return summarize(samples)
+
+
+def bench_throughput(agent: Agent, questions: list[dict[str, Any]], levels: list[int]) -> list[dict[str, Any]]:
+    def answer(question: str, file_name: str) -> str:
+        return agent.answer_question(question, file_name, raise_errors=True)
+
+    rows = []
+    for workers in levels:
+        start = time.perf_counter()
+        results = run_tasks(answer, questions, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "mode": "threads",
+            "concurrency": workers,
+            "tasks": len(results),
+            "errors": sum(r["status"] != "ok" for r in results),
+            "seconds": elapsed,
+            "tasks_per_second": len(results) / elapsed,
+        })
+
+    for concurrency in levels:
+        start = time.perf_counter()
+        answers = asyncio.run(agent.aanswer_questions(
+            [(task["question"], None) for task in questions], max_concurrency=concurrency
+        ))
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "mode": "asyncio",
+            "concurrency": concurrency,
+            "tasks": len(answers),
+            "errors": sum(a.startswith("Error answering question") for a in answers),
+            "seconds": elapsed,
+            "tasks_per_second": len(answers) / elapsed,
+        })
+    return rows
+
+
+def bench_memory(llm_latency: float, tool_latency: float, documents: int, questions: list[dict[str, Any]]):
+    tracemalloc.start()
+    agent = build_agent(llm_latency, tool_latency, documents)
+    for task in questions:
+        agent.answer_question(task["question"], raise_errors=True)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    agent.close()
+    return {
+        "tracemalloc_peak_mb": peak / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def version() -> str:
+    try:
+        return metadata.version("the_bot")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@click.command()
+@click.option("--questions", default=32, show_default=True, help="Number of questions per measurement.")
+@click.option("--documents", default=1000, show_default=True, help="Documents in the in-memory vector store.")
+@click.option("--llm-latency", default=0.05, show_default=True, help="Simulated latency of each LLM call (s).")
+@click.option("--tool-latency", default=0.02, show_default=True, help="Simulated latency of each tool call (s).")
+@click.option("--concurrency", default="1,2,4,8,16", show_default=True, help="Comma-separated concurrency levels.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the JSON report to this file.")
+def main(
+    questions: int,
+    documents: int,
+    llm_latency: float,
+    tool_latency: float,
+    concurrency: str,
+    output: str | None,
+):
+    """Benchmark Agent.answer_question with stubbed backends and print a JSON report."""
+    levels = [int(level) for level in concurrency.split(",")]
+    tasks = make_questions(questions)
+
+    agent = build_agent(llm_latency, tool_latency, documents)
+    report = {
+        "version": version(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "config": {
+            "questions": questions,
+            "documents": documents,
+            "llm_latency": llm_latency,
+            "tool_latency": tool_latency,
+        },
+        "graph_build": bench_build(5, llm_latency, tool_latency, documents),
+        "stages": bench_stages(agent, tasks),
+        "clean_answer": bench_clean_answer(agent, 1000),
+        "throughput": bench_throughput(agent, tasks, levels),
+        "memory": bench_memory(llm_latency, tool_latency, documents, tasks),
+    }
+    agent.close()
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Sequence
+from typing import Any
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.tools import BaseTool, StructuredTool
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when a call was not recorded."""
+
+
+def message_fingerprint(message: BaseMessage) -> dict[str, Any]:
+    """
+    Return the parts of a message that define a request.
+
+    Message ids, timings and usage metadata change from one run to the next,
+    so they are left out.
+    """
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": [
+            {"name": call["name"], "args": call["args"], "id": call.get("id")}
+            for call in getattr(message, "tool_calls", None) or []
+        ],
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+
+class Cassette:
+    """
+    Record LLM calls and tool invocations to a JSONL file, and replay them.
+
+    In record mode every call goes to the real backend and its response is
+    appended to the cassette. In replay mode responses are served from the
+    cassette, optionally after a simulated latency, so runs are deterministic
+    and work offline. Identical requests are replayed in the order they were
+    recorded.
+
+    Args:
+        path: The cassette file
+        mode: "record" or "replay"
+        latency_scale: In replay mode, sleep for the recorded latency times this factor
+        latency: In replay mode, fixed latency in seconds added to each call
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 0.0, latency: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Invalid cassette mode '{mode}'. Choose 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        self._cursor: dict[str, int] = defaultdict(int)
+
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+        logger.info(f"Loaded {sum(map(len, self._entries.values()))} interactions from {self.path}")
+
+    @staticmethod
+    def _key(kind: str, name: str, request: Any) -> str:
+        payload = json.dumps([kind, name, request], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _append(self, entry: dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _next(self, key: str, kind: str, name: str) -> dict[str, Any]:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(f"No recorded {kind} call for '{name}' ({key[:12]})")
+            # Once all recordings of a request are used, keep serving the last one
+            index = min(self._cursor[key], len(entries) - 1)
+            self._cursor[key] += 1
+            return entries[index]
+
+    def _delay(self, entry: dict[str, Any]) -> float:
+        return self.latency + self.latency_scale * entry.get("elapsed", 0.0)
+
+    @staticmethod
+    def _result(entry: dict[str, Any], decode: Callable[[Any], Any]) -> Any:
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return decode(entry["response"])
+
+    def call(
+        self,
+        kind: str,
+        name: str,
+        request: Any,
+        run: Callable[[], Any],
+        encode: Callable[[Any], Any] = lambda r: r,
+        decode: Callable[[Any], Any] = lambda r: r,
+    ) -> Any:
+        """
+        Record or replay a call.
+
+        Args:
+            kind: Kind of call, "llm" or "tool"
+            name: Name of the model or tool
+            request: JSON-serializable description of the request
+            run: Performs the real call, in record mode
+            encode: Converts the response to JSON-serializable data
+            decode: Converts recorded data back to a response
+
+        Returns:
+            The real or recorded response
+        """
+        key = self._key(kind, name, request)
+        if self.mode == "replay":
+            entry = self._next(key, kind, name)
+            delay = self._delay(entry)
+            if delay > 0:
+                time.sleep(delay)
+            return self._result(entry, decode)
+
+        entry = {"key": key, "kind": kind, "name": name, "request": request}
+        start = time.perf_counter()
+        try:
+            response = run()
+        except Exception as e:
+            self._append({**entry, "error": str(e), "elapsed": time.perf_counter() - start})
+            raise
+        self._append({**entry, "response": encode(response), "elapsed": time.perf_counter() - start})
+        return response
+
+    async def acall(
+        self,
+        kind: str,
+        name: str,
+        request: Any,
+        run: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = lambda r: r,
+        decode: Callable[[Any], Any] = lambda r: r,
+    ) -> Any:
+        """Async version of `call`."""
+        key = self._key(kind, name, request)
+        if self.mode == "replay":
+            entry = self._next(key, kind, name)
+            delay = self._delay(entry)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return self._result(entry, decode)
+
+        entry = {"key": key, "kind": kind, "name": name, "request": request}
+        start = time.perf_counter()
+        try:
+            response = await run()
+        except Exception as e:
+            self._append({**entry, "error": str(e), "elapsed": time.perf_counter() - start})
+            raise
+        self._append({**entry, "response": encode(response), "elapsed": time.perf_counter() - start})
+        return response
+
+    def wrap_llm(self, llm: Runnable, name: str = "llm") -> Runnable:
+        """
+        Wrap a chat model, usually the one with bound tools, so its calls go through the cassette.
+        """
+        def encode(message: BaseMessage) -> dict[str, Any]:
+            return message_to_dict(message)
+
+        def decode(data: dict[str, Any]) -> BaseMessage:
+            return messages_from_dict([data])[0]
+
+        def request(messages: Sequence[BaseMessage]) -> list[dict[str, Any]]:
+            return [message_fingerprint(m) for m in messages]
+
+        def invoke(messages: Sequence[BaseMessage]) -> BaseMessage:
+            return self.call("llm", name, request(messages), lambda: llm.invoke(messages), encode, decode)
+
+        async def ainvoke(messages: Sequence[BaseMessage]) -> BaseMessage:
+            return await self.acall("llm", name, request(messages), lambda: llm.ainvoke(messages), encode, decode)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"cassette_{name}")
+
+    def wrap_tool(self, tool: BaseTool) -> BaseTool:
+        """
+        Wrap a tool so its invocations go through the cassette, keeping its name and schema.
+        """
+        def run(**kwargs: Any) -> Any:
+            return self.call("tool", tool.name, kwargs, lambda: tool.invoke(kwargs))
+
+        async def arun(**kwargs: Any) -> Any:
+            return await self.acall("tool", tool.name, kwargs, lambda: tool.ainvoke(kwargs))
+
+        return StructuredTool.from_function(
+            func=run,
+            coroutine=arun,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+        )
@@ -0,0 +1,281 @@
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from the_bot.agents.local_index import EMBEDDINGS_FILE, LocalVectorStore, _iter_rows, _normalize, _read_manifest
+
+logger = logging.getLogger(__name__)
+
+DTYPES = ("int8", "float16")
+
+# Rows converted to float32 at a time while scoring, bounds the temporary memory
+_BLOCK = 16384
+
+
+class CompactVectorStore(VectorStore):
+    """
+    Memory-compact version of `LocalVectorStore`.
+
+    Vectors are held in one contiguous int8 (with a scale per row) or float16
+    array, texts in a single UTF-8 buffer with offsets and metadata in one
+    column per key, so no `Document` is kept per row. The candidates of the
+    quantized search are rescored with the float32 vectors, read from the
+    memory-mapped index on disk, so the top k is nearly the float32 one.
+    Added rows are buffered and appended to the arrays at once before the
+    next read, so adding many small batches does not copy the store each time.
+
+    Args:
+        embedding: Embeds the queries
+        dtype: "int8" or "float16"
+        rescore: Candidates rescored in float32 per result, 0 disables rescoring
+    """
+
+    def __init__(self, embedding: Embeddings | None, dtype: str = "int8", rescore: int = 4):
+        if dtype not in DTYPES:
+            raise ValueError(f"Invalid dtype '{dtype}'. Choose one of {', '.join(DTYPES)}")
+        self.embedding = embedding
+        self.dtype = dtype
+        self.rescore = rescore
+        self.codes = np.empty((0, 0), dtype=dtype)
+        self.scales = np.empty(0, dtype=np.float32)
+        # Full precision vectors used for rescoring, usually memory-mapped
+        self.full: np.ndarray | None = None
+        self.ids: list[str] = []
+        self._text_data = b""
+        self._text_offsets = np.zeros(1, dtype=np.int64)
+        self._columns: dict[str, list[Any]] = {}
+        # Batches added since the last read: codes, scales, float32 vectors, texts and their lengths
+        self._pending: list[tuple[np.ndarray, np.ndarray, np.ndarray | None, bytes, np.ndarray]] = []
+        self._keep_full = True
+        self._pending_lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        # Symmetric int8 quantization, one scale per row
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def add_vectors(
+        self,
+        vectors: np.ndarray | list[list[float]],
+        texts: list[str],
+        metadatas: list[dict],
+        ids: list[str],
+        keep_full: bool = True,
+    ) -> list[str]:
+        """
+        Add documents with precomputed embeddings.
+
+        Args:
+            keep_full: Keep the float32 vectors for rescoring, only read when the store is empty,
+                later additions follow the existing rows
+        """
+        vectors = _normalize(vectors)
+        codes, scales = self._quantize(vectors)
+        if not len(self.ids):
+            self._keep_full = keep_full
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+        with self._pending_lock:
+            self._pending.append((codes, scales, vectors if self._keep_full else None, b"".join(encoded), lengths))
+
+        start = len(self.ids)
+        for key in {key for metadata in metadatas for key in metadata}:
+            self._columns.setdefault(key, [None] * start)
+        for column in self._columns.values():
+            column.extend([None] * len(texts))
+        for row, metadata in enumerate(metadatas, start=start):
+            for key, value in metadata.items():
+                self._columns[key][row] = value
+
+        self.ids.extend(ids)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        return self.add_vectors(self.embedding.embed_documents(texts), texts, metadatas, ids)
+
+    def _add_pending(self):
+        """Append the buffered batches to the arrays, with a single copy of each."""
+        with self._pending_lock:
+            if not self._pending:
+                return
+            codes, scales, full, texts, lengths = zip(*self._pending, strict=True)
+            self._pending = []
+            previous = [self.codes] if len(self.codes) else []
+            self.codes = np.concatenate(previous + list(codes))
+            self.scales = np.concatenate([self.scales, *scales])
+            if self._keep_full:
+                # Copies memory-mapped vectors into memory, save and reload the index to map them again
+                self.full = np.concatenate(([self.full] if self.full is not None else []) + list(full))
+            self._text_data += b"".join(texts)
+            ends = self._text_offsets[-1] + np.cumsum(np.concatenate(lengths))
+            self._text_offsets = np.concatenate([self._text_offsets, ends])
+
+    def document(self, row: int) -> Document:
+        """Build the document of a row."""
+        self._add_pending()
+        start, end = self._text_offsets[row], self._text_offsets[row + 1]
+        metadata = {key: column[row] for key, column in self._columns.items() if column[row] is not None}
+        return Document(page_content=self._text_data[start:end].decode("utf-8"), metadata=metadata)
+
+    def iter_documents(self) -> Iterator[Document]:
+        for row in range(len(self.ids)):
+            yield self.document(row)
+
+    def nbytes(self) -> int:
+        """Memory held by the vectors, texts and offsets, without the memory-mapped float32 vectors."""
+        self._add_pending()
+        return self.codes.nbytes + self.scales.nbytes + len(self._text_data) + self._text_offsets.nbytes
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate (n_queries, n_rows) cosine similarities from the quantized vectors."""
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), _BLOCK):
+            block = self.codes[start:start + _BLOCK].astype(np.float32)
+            scores[:, start:start + _BLOCK] = (queries @ block.T) * self.scales[start:start + _BLOCK]
+        return scores
+
+    def _top(self, scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _search(self, queries: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        self._add_pending()
+        approximate = self._scores(queries)
+        results = []
+        for query, scores in zip(queries, approximate, strict=True):
+            if self.full is None or not self.rescore:
+                top = self._top(scores, k)
+                results.append([(int(i), float(scores[i])) for i in top])
+                continue
+            candidates = np.sort(self._top(scores, k * self.rescore))
+            exact = np.asarray(self.full[candidates], dtype=np.float32) @ query
+            order = np.argsort(-exact)[:k]
+            results.append([(int(candidates[i]), float(exact[i])) for i in order])
+        return results
+
+    def similarity_search_by_vectors(
+        self, embeddings: list[list[float]] | np.ndarray, k: int = 4
+    ) -> list[list[Document]]:
+        """Search several queries at once, returning the documents of each query."""
+        if not len(self.ids):
+            return [[] for _ in embeddings]
+        return [[self.document(row) for row, _ in hits] for hits in self._search(_normalize(embeddings), k)]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: list[float] | np.ndarray, k: int = 4
+    ) -> list[tuple[Document, float]]:
+        if not len(self.ids):
+            return []
+        hits = self._search(_normalize([embedding]), k)[0]
+        return [(self.document(row), score) for row, score in hits]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def _from_rows(
+        cls,
+        embedding: Embeddings | None,
+        vectors: np.ndarray,
+        rows: Iterable[tuple[str, str, dict]],
+        dtype: str,
+        rescore: int,
+    ) -> "CompactVectorStore":
+        """Build a store from float32 vectors, kept as is for rescoring, and their (id, text, metadata) rows."""
+        compact = cls(embedding, dtype=dtype, rescore=rescore)
+        rows = iter(rows)
+        # By blocks, so the float32 vectors are never all copied in memory
+        for start in range(0, len(vectors), _BLOCK):
+            block = [row for _, row in zip(range(_BLOCK), rows, strict=False)]
+            compact.add_vectors(
+                vectors[start:start + len(block)],
+                [text for _, text, _ in block],
+                [metadata for _, _, metadata in block],
+                [id_ for id_, _, _ in block],
+                keep_full=False,
+            )
+        compact._add_pending()
+        compact.full = vectors if rescore and len(vectors) else None
+        return compact
+
+    @classmethod
+    def from_store(cls, store: LocalVectorStore, dtype: str = "int8", rescore: int = 4) -> "CompactVectorStore":
+        """
+        Build a compact copy of a local store.
+
+        The float32 vectors of the store are kept as is for rescoring, so a
+        memory-mapped store stays on disk.
+        """
+        rows = ((id_, doc.page_content, doc.metadata) for id_, doc in zip(store.ids, store.documents, strict=True))
+        return cls._from_rows(store.embedding, store.vectors, rows, dtype, rescore)
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, dtype: str = "int8", rescore: int = 4) -> "CompactVectorStore":
+        """
+        Load an index written by `LocalVectorStore.save` in compact form.
+
+        The documents are read straight into the text buffer and metadata
+        columns, without building a `LocalVectorStore` and its documents first.
+        """
+        _read_manifest(path)
+        vectors = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        rows = ((row["id"], row["page_content"], row.get("metadata") or {}) for row in _iter_rows(path))
+        compact = cls._from_rows(embedding, vectors, rows, dtype, rescore)
+        logger.info(f"Quantized {len(compact)} vectors to {dtype} ({compact.nbytes() / 2**20:.1f} MiB)")
+        return compact
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> "CompactVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -0,0 +1,128 @@
+import logging
+import math
+from collections.abc import Callable, Sequence
+from typing import Annotated
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token of each provider's tokenizers on English text and tool outputs
+CHARS_PER_TOKEN = {
+    "google": 4.0,
+    "groq": 3.5,
+    "HfApiModel": 3.5,
+}
+
+# Tokens added per message by the chat templates
+MESSAGE_OVERHEAD = 4
+
+HANDLE_PREFIX = "tool-output:"
+
+
+def token_counter(model_type: str) -> Callable[[str], int]:
+    """Approximate token count of a text for a provider, without loading its tokenizer."""
+    chars = CHARS_PER_TOKEN.get(model_type, 3.5)
+    return lambda text: math.ceil(len(text) / chars)
+
+
+def message_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+
+
+@tool
+def read_tool_output(
+    handle: str,
+    offset: int = 0,
+    length: int = 4000,
+    state: Annotated[dict, InjectedState] = None,
+) -> str:
+    """
+    Read part of an earlier tool output that was shortened to save context.
+
+    Args:
+        handle: The handle given in the shortened output, e.g. "tool-output:call_abc"
+        offset: Character where reading starts
+        length: Number of characters to read
+    """
+    call_id = handle.removeprefix(HANDLE_PREFIX)
+    for message in (state or {}).get("messages", []):
+        if isinstance(message, ToolMessage) and message.tool_call_id == call_id:
+            text = message_text(message)
+            end = min(offset + length, len(text))
+            return f"[characters {offset} to {end} of {len(text)}]\n{text[offset:end]}"
+    return f"Error: no tool output with handle {handle}"
+
+
+class ContextManager:
+    """
+    Fit the conversation sent to the model in a token budget.
+
+    The graph state keeps every message as is, only the list sent to the
+    model is shortened. The last `keep_turns` tool rounds are kept verbatim,
+    older tool outputs are cut to their first `excerpt_tokens` tokens and a
+    handle, oldest first, until the conversation fits. The model reads the
+    rest of an output with the `read_tool_output` tool.
+
+    Args:
+        max_tokens: Token budget of the messages sent to the model
+        count_tokens: Counts the tokens of a text, see `token_counter`
+        keep_turns: Most recent tool rounds never shortened
+        excerpt_tokens: Tokens kept from the start of a shortened output
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        count_tokens: Callable[[str], int],
+        keep_turns: int = 2,
+        excerpt_tokens: int = 200,
+    ):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.keep_turns = keep_turns
+        self.excerpt_tokens = excerpt_tokens
+
+    def size(self, messages: Sequence[BaseMessage]) -> int:
+        return sum(self.count_tokens(message_text(m)) + MESSAGE_OVERHEAD for m in messages)
+
+    def _old_tool_outputs(self, messages: Sequence[BaseMessage]) -> list[int]:
+        """Positions of the tool outputs before the last `keep_turns` tool rounds, oldest first."""
+        rounds = [i for i, m in enumerate(messages) if isinstance(m, AIMessage) and m.tool_calls]
+        if len(rounds) <= self.keep_turns:
+            return []
+        end = rounds[-self.keep_turns] if self.keep_turns else len(messages)
+        return [i for i in range(end) if isinstance(messages[i], ToolMessage)]
+
+    def _shorten(self, message: ToolMessage) -> ToolMessage:
+        text = message_text(message)
+        # Characters of the excerpt, from the counter's own ratio
+        chars = max(1, len(text) * self.excerpt_tokens // max(1, self.count_tokens(text)))
+        note = (
+            f"\n[... output shortened from {len(text)} characters. "
+            f"Call read_tool_output with handle '{HANDLE_PREFIX}{message.tool_call_id}' to read the rest]"
+        )
+        return message.model_copy(update={"content": text[:chars] + note})
+
+    def fit(self, messages: Sequence[BaseMessage]) -> list[BaseMessage]:
+        """Return the messages to send to the model, shortened if they exceed the budget."""
+        messages = list(messages)
+        size = self.size(messages)
+        if size <= self.max_tokens:
+            return messages
+        before = size
+        for i in self._old_tool_outputs(messages):
+            shortened = self._shorten(messages[i])
+            saved = self.size([messages[i]]) - self.size([shortened])
+            if saved <= 0:
+                continue
+            messages[i] = shortened
+            size -= saved
+            if size <= self.max_tokens:
+                break
+        logger.debug(f"Context shortened from {before} to {size} tokens (budget {self.max_tokens})")
+        return messages
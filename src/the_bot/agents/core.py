@@ -1,10 +1,20 @@
+import asyncio
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from collections.abc import Callable
 from typing import Any
 
 from langchain_community.vectorstores import SupabaseVectorStore
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import BaseTool
+from langchain_core.vectorstores import VectorStore
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEmbeddings, HuggingFaceEndpoint
@@ -13,6 +23,23 @@ from langgraph.prebuilt import tools_condition
 from langgraph.prebuilt import ToolNode
 from supabase.client import create_client
 
+from the_bot.agents.cassette import Cassette
+from the_bot.agents.compact_index import CompactVectorStore
+from the_bot.agents.context import ContextManager, read_tool_output, token_counter
+from the_bot.agents.embedding_cache import CachedEmbeddings
+from the_bot.agents.episodic import EpisodicMemory, format_episodes, tool_trace
+from the_bot.agents.hybrid import HybridVectorStore
+from the_bot.agents.local_index import LocalVectorStore
+from the_bot.agents.metrics import METRICS, MetricsCallbackHandler
+from the_bot.agents.onnx_embeddings import OnnxEmbeddings
+from the_bot.agents.rate_limit import DEFAULT_LIMITS, RATE_LIMITERS
+from the_bot.agents.resources import REGISTRY
+from the_bot.agents.response_cache import ResponseCache
+from the_bot.agents.retrieval_cache import GENERATION_FILE, RetrievalCache, store_generation
+from the_bot.agents.router import Backend, LLMRouter
+from the_bot.agents.streaming import ANSWER_INSTRUCTION, astream_until_answer, stream_until_answer
+
+
 class Agent:
     def __init__(
         self,
@@ -30,7 +57,38 @@ class Agent:
         system_prompt: str = "",
         supabase_url: str = "",
         supabase_service_key: str = "",
-        embedding_model_name: str = "sentence-transformers/all-mpnet-base-v2"
+        embedding_model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        embedding_cache_path: str | None = None,
+        embedding_cache_size: int = 100_000,
+        embedding_backend: str = "torch",
+        rate_limit: bool = False,
+        rate_limit_rpm: int | None = None,
+        rate_limit_tpm: int | None = None,
+        fallback_backends: list[dict[str, Any]] | None = None,
+        hedge_delay: float | None = 10.0,
+        backend_cooldown: float = 60.0,
+        llm_cache_path: str | None = None,
+        llm_cache_size: int = 10_000,
+        llm_cache_skip_sampled: bool = False,
+        cassette_path: str | None = None,
+        cassette_mode: str = "replay",
+        cassette_latency_scale: float = 0.0,
+        llm: BaseChatModel | None = None,
+        vector_store: VectorStore | None = None,
+        vector_index_path: str | None = None,
+        vector_index_dtype: str = "float32",
+        hybrid_retrieval: bool = False,
+        retrieval_cache_size: int = 1024,
+        retrieval_cache_ttl: float = 3600.0,
+        episodic_memory_size: int = 0,
+        episodic_memory_path: str | None = None,
+        episodic_memory_top_k: int = 2,
+        speculative_retrieval: bool = False,
+        context_budget: int = 0,
+        context_keep_turns: int = 2,
+        streaming: bool = False,
+        tools: list | None = None,
+        metrics: bool = True
     ):
         # Set verbosity
         self.verbose = verbose
@@ -38,44 +96,86 @@ class Agent:
         self.logger.info("Initializing Agent...")
 
         # Model initialization (omitted for brevity)
-        if model_type == 'google':
-            self.llm = ChatGoogleGenerativeAI(
-                model=model_id,
-                temperature=temperature,
-                google_api_key=api_key
-            )
-        elif model_type == 'groq':
-            self.llm = ChatGroq(
-                model=model_id,
-                temperature=temperature
-            )
-        elif model_type == 'HfApiModel':
-            self.llm = ChatHuggingFace(
-                llm=HuggingFaceEndpoint(
-                    repo_id=model_id,
-                    provider="hf-inference",
-                    temperature=temperature,
-                    huggingfacehub_api_token=api_key
-                ),
-                verbose=True
-            )
+        if llm is not None:
+            # Pre-built chat model, e.g. a fake one for tests and benchmarks
+            self.llm = llm
         else:
-            raise  ValueError(" Invalid provider. Choose 'google', ' groq' or 'huggingface'")
+            # A rate-limited model is retried by the limiter, not by its client behind it
+            self.llm = self._init_llm(model_type, model_id, api_key, temperature, max_retries=0 if rate_limit else None)
 
         # Load only core SmolAgents tools
         self.tools = self._load_default_tools()
         # Discover custom tools from specified modules
         if tool_modules:
             self.tools.extend(self._discover_tools(tool_modules))
+        if tools:
+            self.tools.extend(tools)
         self.logger.info(f"Loaded {len(self.tools)} tools")
 
-        # Initialize memory store
-        self._init_memory(
-            supabase_url,
-            supabase_service_key
-        )
+        # Embedding model and vector store are shared with the other agents of the process
+        self._resource_keys: list[tuple] = []
+        self.embeddings = None
+        self._dense_store = self._dense_key = None
+        if vector_store is not None:
+            self._dense_store = vector_store
+        else:
+            self.embeddings = self._init_embeddings(
+                embedding_model_name,
+                embedding_cache_path,
+                embedding_cache_size,
+                embedding_backend
+            )
+            if not vector_index_path:
+                self._init_memory(
+                    supabase_url,
+                    supabase_service_key,
+                    self.embeddings
+                )
+                self._dense_store, self._dense_key = self.vector_store, self._resource_keys[-1]
+
+        # The local index and the BM25 index are rebuilt from the documents of an ingestion,
+        # they are reloaded once `ingest` bumps the generation file
+        self._vector_index_path = vector_index_path if vector_store is None else None
+        self._vector_index_dtype = vector_index_dtype
+        self._hybrid_retrieval = hybrid_retrieval
+        self._reloadable = bool(self._vector_index_path or hybrid_retrieval)
+        self._store_generation = store_generation(GENERATION_FILE) if self._reloadable else None
+        self._store_keys: list[tuple] = []
+        self._store_lock = threading.Lock()
+        self.vector_store = self._load_stores(self._store_generation)
         self.logger.info("Memory store initialized")
 
+        # Retrieval results of repeated questions, shared by the agents with the same settings
+        self.retrieval_cache = None
+        if retrieval_cache_size > 0:
+            self.retrieval_cache = self._acquire(
+                ("retrieval_cache", retrieval_cache_size, retrieval_cache_ttl),
+                lambda: RetrievalCache(retrieval_cache_size, retrieval_cache_ttl, generation_path=GENERATION_FILE)
+            )
+
+        # Retrieve the similar questions into the retrieval cache while the run goes on, instead of before it
+        self.speculative_retrieval = speculative_retrieval and self.retrieval_cache is not None
+        self._retrieval_pool = None
+        if speculative_retrieval and self.retrieval_cache is None:
+            self.logger.warning("Speculative retrieval fills the retrieval cache, it is disabled without one")
+        if self.speculative_retrieval:
+            self._retrieval_pool = ThreadPoolExecutor(thread_name_prefix="speculative-retrieval")
+
+        # Solved questions with their tool trace, recalled for similar new questions
+        self.memory = None
+        self.memory_top_k = episodic_memory_top_k
+        if episodic_memory_size > 0:
+            embeddings = self.embeddings or self.vector_store.embeddings
+            if episodic_memory_path:
+                # One memory per snapshot directory and embedder, shared with the other agents of the process
+                embeddings_id = self._embeddings_key if self.embeddings is not None else id(embeddings)
+                self.memory = self._acquire(
+                    ("episodic_memory", os.path.abspath(episodic_memory_path), episodic_memory_size, embeddings_id),
+                    lambda: EpisodicMemory(embeddings, episodic_memory_size, episodic_memory_path)
+                )
+            else:
+                self.memory = EpisodicMemory(embeddings, episodic_memory_size)
+
         # Set up imports
         self.imports = [
             "csv",
@@ -92,7 +192,66 @@ class Agent:
         if additional_imports:
             self.imports.extend(additional_imports)
 
-        self.llm_with_tools = self.llm.bind_tools(self.tools)
+        # Record or replay every LLM call and tool invocation
+        self.cassette = None
+        if cassette_path:
+            self.cassette = Cassette(cassette_path, cassette_mode, latency_scale=cassette_latency_scale)
+            self.tools = [self.cassette.wrap_tool(t) if isinstance(t, BaseTool) else t for t in self.tools]
+            self.logger.info(f"Cassette {cassette_path} in {cassette_mode} mode")
+
+        # Shorten old tool outputs sent to the model beyond a token budget, the model reads them back by handle
+        self.context = None
+        if context_budget > 0:
+            self.context = ContextManager(context_budget, token_counter(model_type), keep_turns=context_keep_turns)
+            self.tools.append(read_tool_output)
+
+        # Requests and tokens per minute of each model, shared with the other agents and the multimodal tools
+        if rate_limit:
+            RATE_LIMITERS.enable()
+            if rate_limit_rpm or rate_limit_tpm:
+                default_rpm, default_tpm = DEFAULT_LIMITS.get(model_type, (60, 100_000))
+                RATE_LIMITERS.configure(
+                    model_type,
+                    model_id,
+                    rate_limit_rpm or default_rpm,
+                    rate_limit_tpm or default_tpm
+                )
+
+        def bind(chat_model: BaseChatModel, provider: str, model: str):
+            bound = chat_model.bind_tools(self.tools)
+            return RATE_LIMITERS.wrap(bound, provider, model) if rate_limit else bound
+
+        self.llm_with_tools = bind(self.llm, model_type, model_id)
+        # Other providers, hedging the slow calls of the main model and taking over when it fails
+        self.router = None
+        if fallback_backends:
+            backends = [Backend(f"{model_type}:{model_id}", self.llm_with_tools)]
+            for fallback in fallback_backends:
+                fallback_llm = fallback.get("llm") or self._init_llm(
+                    fallback["model_type"],
+                    fallback["model_id"],
+                    fallback.get("api_key"),
+                    temperature,
+                    max_retries=0 if rate_limit else None
+                )
+                backends.append(Backend(
+                    f"{fallback['model_type']}:{fallback['model_id']}",
+                    bind(fallback_llm, fallback["model_type"], fallback["model_id"])
+                ))
+            self.router = LLMRouter(backends, hedge_delay=hedge_delay, cooldown=backend_cooldown)
+            self.llm_with_tools = self.router.as_runnable()
+            self.logger.info(f"Routing model calls to {', '.join(b.name for b in backends)}")
+        # Answer identical conversations from disk, unless responses are sampled and must vary
+        self.llm_cache = None
+        if llm_cache_path and not (llm_cache_skip_sampled and temperature > 0):
+            self.llm_cache = self._acquire(
+                ("llm_cache", os.path.abspath(llm_cache_path), llm_cache_size),
+                lambda: ResponseCache(llm_cache_path, llm_cache_size)
+            )
+            settings = {"provider": model_type, "model_id": model_id, "temperature": temperature}
+            self.llm_with_tools = self.llm_cache.wrap_llm(self.llm_with_tools, settings, self.tools)
+        if self.cassette:
+            self.llm_with_tools = self.cassette.wrap_llm(self.llm_with_tools, name=model_id)
 
         # Initialize CodeAgent
         #self.agent = build_agent(
@@ -104,35 +263,80 @@ class Agent:
         #    verbosity_level=2 if self.verbose else 0,
         #    max_steps=5
         #)
-        with open("system_prompt.txt", "r", encoding="utf-8") as f:
-            system_prompt = f.read()
+        if not system_prompt:
+            with open("system_prompt.txt", "r", encoding="utf-8") as f:
+                system_prompt = f.read()
+
+        # Stream the assistant responses and stop generating once the answer line is received
+        self.streaming = streaming
+        if streaming:
+            system_prompt = f"{system_prompt}\n\n{ANSWER_INSTRUCTION}"
+            if self.cassette:
+                # The response cache, rate limiter and router stream, the cassette keeps whole responses
+                self.logger.warning("The cassette records and replays whole responses, they are not stopped early")
 
         # System message
-        sys_msg = SystemMessage(content=system_prompt)
-
-        self.vector_store = SupabaseVectorStore(
-           client=create_client(
-               supabase_url,
-               supabase_service_key
-           ),
-           embedding=HuggingFaceEmbeddings(model_name=embedding_model_name),
-           table_name="documents",
-           query_name="match_documents"
-        )
+        base_sys_msg = SystemMessage(content=system_prompt)
 
         def assistant(state: MessagesState):
             """Assistant node"""
-            return {"messages": [self.llm_with_tools.invoke(state["messages"])]}
+            messages = self._fit_context(state["messages"])
+            if self.streaming:
+                response = stream_until_answer(self.llm_with_tools, messages)
+            else:
+                response = self.llm_with_tools.invoke(messages)
+            return {"messages": [response]}
+
+        async def aassistant(state: MessagesState):
+            """Assistant node, async version"""
+            messages = self._fit_context(state["messages"])
+            if self.streaming:
+                response = await astream_until_answer(self.llm_with_tools, messages)
+            else:
+                response = await self.llm_with_tools.ainvoke(messages)
+            return {"messages": [response]}
+
+        def with_system_prompt(state: MessagesState, similar_question: list, episodes: list | None = None) -> dict:
+            """Prepend the system prompt, given the documents and episodes found by the retriever"""
+            sys_msg = base_sys_msg
+            if episodes:
+                sys_msg = SystemMessage(content=f"{base_sys_msg.content}\n\n{format_episodes(episodes)}")
+            if similar_question:  # Check if the list is not empty
+                example_msg = HumanMessage(
+                    content="Here I provide a similar question and answer for reference: \n\n"
+                            f"{similar_question[0].page_content}",
+                )
+                messages = [sys_msg] + state["messages"] # + [example_msg]
+
+                for i, m in enumerate(messages):
+                    print(f"-> {i}")
+                    print(m.pretty_print())
+
+                return {"messages": messages}
+                # return {"messages": [sys_msg] + state["messages"] + [example_msg]}
+            else:
+                # Handle the case when no similar questions are found
+                #
+                messages = [sys_msg] + state["messages"]
+
+                for i, m in enumerate(messages):
+                    print(f"-> {i}")
+                    print(m.pretty_print())
+
+                return {"messages": messages}
+                # return {"messages": [sys_msg] + state["messages"]}
 
-        def retriever(state: MessagesState):
+        def retriever(state: MessagesState, config: RunnableConfig):
             """Retriever node"""
             # for message in state["messages"]:
             #     if isinstance(message, HumanMessage):
 
-            similar_question = self.vector_store.similarity_search(
-                state["messages"][0].content,
-                k=1
-            )
+            query = state["messages"][0].content
+            if config.get("configurable", {}).get("speculative"):
+                # Retrieved in the background for the later runs, the run goes on without it
+                similar_question = []
+            else:
+                similar_question = self._retrieve_similar(query)
             # similar_question seems to be a list of Document which page_content contains
             # [
             #   Document(
@@ -153,33 +357,26 @@ class Agent:
             #  )
             #]
 
-            if similar_question:  # Check if the list is not empty
-                example_msg = HumanMessage(
-                    content=f"Here I provide a similar question and answer for reference: \n\n{similar_question[0].page_content}",
-                )
-                messages = [sys_msg] + state["messages"] # + [example_msg]
-
-                for i, m in enumerate(messages):
-                    print(f"-> {i}")
-                    print(m.pretty_print())
+            episodes = self.recall(config.get("configurable", {}).get("question", query), self.memory_top_k)
+            return with_system_prompt(state, similar_question, episodes)
 
-                return {"messages": messages}
-                # return {"messages": [sys_msg] + state["messages"] + [example_msg]}
+        async def aretriever(state: MessagesState, config: RunnableConfig):
+            """Retriever node, async version"""
+            query = state["messages"][0].content
+            if config.get("configurable", {}).get("speculative"):
+                similar_question = []
             else:
-                # Handle the case when no similar questions are found
-                #
-                messages = [sys_msg] + state["messages"]
-
-                for i, m in enumerate(messages):
-                    print(f"-> {i}")
-                    print(m.pretty_print())
-
-                return {"messages": messages}
-                # return {"messages": [sys_msg] + state["messages"]}
+                similar_question = await self._aretrieve_similar(query)
+            episodes = []
+            if self.memory is not None:
+                question = config.get("configurable", {}).get("question", query)
+                episodes = await asyncio.to_thread(self.recall, question, self.memory_top_k)
+            return with_system_prompt(state, similar_question, episodes)
 
+        # Each node has a sync and an async implementation, used by invoke and ainvoke
         builder = StateGraph(MessagesState)
-        builder.add_node(retriever)
-        builder.add_node(assistant)
+        builder.add_node("retriever", RunnableLambda(retriever, afunc=aretriever))
+        builder.add_node("assistant", RunnableLambda(assistant, afunc=aassistant))
         builder.add_node(ToolNode(self.tools))
 
         builder.add_edge(START, "retriever")
@@ -189,11 +386,52 @@ class Agent:
 
         self.agent = builder.compile()
 
+        # Node, tool and token metrics, collected through the graph callbacks
+        self.callbacks = [MetricsCallbackHandler(model=model_id)] if metrics else []
+
         # self.logger.debug(f"Agent prompt:\n{self.agent.prompt_templates['system_prompt']}")
 
         self.verbose = verbose
         self.logger.info("CodeAgent ready")
 
+    def _init_llm(
+        self,
+        model_type: str,
+        model_id: str,
+        api_key: str | None,
+        temperature: float,
+        max_retries: int | None = None
+    ) -> BaseChatModel:
+        """
+        Build the chat model of a provider, with its client's default retries unless max_retries is set.
+        """
+        retries = {} if max_retries is None else {"max_retries": max_retries}
+        if model_type == 'google':
+            return ChatGoogleGenerativeAI(
+                model=model_id,
+                temperature=temperature,
+                google_api_key=api_key,
+                **retries
+            )
+        elif model_type == 'groq':
+            return ChatGroq(
+                model=model_id,
+                temperature=temperature,
+                **retries
+            )
+        elif model_type == 'HfApiModel':
+            return ChatHuggingFace(
+                llm=HuggingFaceEndpoint(
+                    repo_id=model_id,
+                    provider="hf-inference",
+                    temperature=temperature,
+                    huggingfacehub_api_token=api_key
+                ),
+                verbose=True
+            )
+        else:
+            raise  ValueError(" Invalid provider. Choose 'google', ' groq' or 'huggingface'")
+
     def _load_default_tools(self) -> list:
         """
         Returns only the core SmolAgents tools.
@@ -241,73 +479,444 @@ class Agent:
         self.logger.info(f"Collected {len(collected)} tools.")
         return collected
 
+    def _init_embeddings(
+        self,
+        embedding_model_name: str,
+        cache_path: str | None = None,
+        cache_size: int = 100_000,
+        backend: str = "torch"
+    ) -> Embeddings:
+        """
+        Get the shared sentence-transformers embedder, cached on disk if a cache path is given.
+
+        The "onnx" backend runs an int8 ONNX export of the model instead of PyTorch,
+        falling back to PyTorch if it is not installed or fails the parity check.
+        """
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Invalid embedding backend '{backend}'. Choose 'torch' or 'onnx'")
+
+        def build() -> Embeddings:
+            embeddings = None
+            cache_name = embedding_model_name
+            if backend == "onnx":
+                try:
+                    embeddings = OnnxEmbeddings.from_model_name(
+                        embedding_model_name,
+                        reference=lambda: HuggingFaceEmbeddings(model_name=embedding_model_name)
+                    )
+                    # Quantized vectors are close to the reference ones, not equal: cached apart
+                    cache_name = f"{embedding_model_name}:onnx-int8"
+                except (ImportError, ValueError) as e:
+                    self.logger.warning(f"ONNX embeddings unavailable, using PyTorch: {e}")
+            if embeddings is None:
+                embeddings = HuggingFaceEmbeddings(model_name=embedding_model_name)
+            if cache_path:
+                self.logger.info(f"Caching embeddings in {cache_path}")
+                embeddings = CachedEmbeddings(embeddings, cache_name, cache_path, max_entries=cache_size)
+            return embeddings
+
+        self._embeddings_key = ("embeddings", embedding_model_name, cache_path, cache_size, backend)
+        return self._acquire(self._embeddings_key, build)
+
+    def _load_index(self, path: str, dtype: str = "float32") -> VectorStore:
+        """
+        Load a local vector index, quantized to int8 or float16 unless dtype is float32.
+        """
+        if dtype == "float32":
+            return LocalVectorStore.load(path, self.embeddings)
+        return CompactVectorStore.load(path, self.embeddings, dtype=dtype)
+
+    def _load_stores(self, generation: int | None) -> VectorStore:
+        """
+        Acquire the local index and the hybrid store of an ingestion generation, shared by the agents that use them.
+        """
+        keys = []
+        dense, dense_key = self._dense_store, self._dense_key
+        if self._vector_index_path:
+            # Local index exported from Supabase, searched in process
+            path, dtype = self._vector_index_path, self._vector_index_dtype
+            dense_key = ("local_index", os.path.abspath(path), dtype, self._embeddings_key, generation)
+            dense = self._acquire(dense_key, lambda: self._load_index(path, dtype))
+            keys.append(dense_key)
+        store = dense
+        # Fuse the dense search with a BM25 keyword search over the same documents
+        if self._hybrid_retrieval:
+            if dense_key is not None:
+                key = ("hybrid_store", dense_key, generation)
+                store = self._acquire(key, lambda: HybridVectorStore.from_store(dense))
+                keys.append(key)
+            else:
+                store = HybridVectorStore.from_store(dense)
+        self._store_keys = keys
+        # A shared store is identified by its registry key, an injected one by itself
+        self._store_id = keys[-1] if keys else dense_key or store
+        return store
+
+    def _refresh_stores(self):
+        """
+        Reload the local index and rebuild the BM25 index once an ingestion changed the generation file
+
+        Agents of the same generation share the reloaded stores, the previous
+        ones are released and torn down with their last user. Searches already
+        running finish on the previous stores.
+        """
+        if not self._reloadable:
+            return
+        generation = store_generation(GENERATION_FILE)
+        if generation == self._store_generation:
+            return
+        with self._store_lock:
+            if generation == self._store_generation:
+                return
+            previous, acquired = self._store_keys, len(self._resource_keys)
+            try:
+                self.vector_store = self._load_stores(generation)
+            except Exception as e:
+                # Release what the failed reload acquired, the next retrieval tries again
+                for key in self._resource_keys[acquired:]:
+                    REGISTRY.release(key)
+                del self._resource_keys[acquired:]
+                self._store_keys = previous
+                self.logger.warning(f"Failed to reload the vector store after an ingestion: {e}")
+                return
+            self._store_generation = generation
+            for key in previous:
+                self._resource_keys.remove(key)
+                REGISTRY.release(key)
+        self.logger.info("Reloaded the vector store after an ingestion")
+
     def _init_memory(
         self,
         supabase_url: str,
         supabase_service_key: str,
-        embedding_model_name: str = "sentence-transformers/all-mpnet-base-v2"
+        embeddings: Embeddings
     ):
          """
          Initialize vector store memory using FAISS and a sentence-transformers embedder.
          """
-         self.vector_store = SupabaseVectorStore(
-            client=create_client(
+         client = self._acquire(
+            ("supabase_client", supabase_url, supabase_service_key),
+            lambda: create_client(
                 supabase_url,
                 supabase_service_key
-            ),
-            embedding=HuggingFaceEmbeddings(model_name=embedding_model_name),
-            table_name="documents",
-            query_name="match_documents"
+            )
+         )
+         self.vector_store = self._acquire(
+            ("supabase_store", supabase_url, supabase_service_key, self._embeddings_key),
+            lambda: SupabaseVectorStore(
+                client=client,
+                embedding=embeddings,
+                table_name="documents",
+                query_name="match_documents"
+            )
          )
 
-    # def remember(self, text: str, meta: Any = None):
-    #     """
-    #     Embed the text and store in memory with optional metadata.
-    #     """
-    #     emb = self.embedder.encode([text])
-    #     self.vector_index.add(emb)
-    #     self.memory_meta.append({"text": text, "meta": meta})
+    def _acquire(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        """
+        Get a resource from the process-wide registry, released by `close`.
+        """
+        resource = REGISTRY.acquire(key, factory)
+        self._resource_keys.append(key)
+        return resource
 
-    # def recall(self, query: str, top_k: int = 5) -> list[Any]:
-    #     """
-    #     Query memory for most similar stored items.
-    #     """
-    #     q_emb = self.embedder.encode([query])
-    #     D, I = self.vector_index.search(q_emb, top_k)
-    #     return [self.memory_meta[i] for i in I[0]]
+    def close(self):
+        """
+        Release the shared resources of the agent, the last agent using one tears it down.
+        """
+        while self._resource_keys:
+            REGISTRY.release(self._resource_keys.pop())
+        if self._retrieval_pool is not None:
+            self._retrieval_pool.shutdown(wait=False)
+        if self.router is not None:
+            self.router.close()
 
-    def answer_question(self, question: str, task_file_path: str | None = None) -> str:
+    def remember(
+        self,
+        question: str,
+        answer: str,
+        trace: list[dict[str, Any]] | None = None,
+        meta: Any = None,
+        verified: bool = False
+    ) -> str | None:
+        """
+        Store an answered question with the tool calls that answered it, None if the episodic memory is disabled.
+        """
+        if self.memory is None:
+            return None
+        return self.memory.remember(question, answer, trace, meta, verified=verified)
+
+    def recall(self, query: str, top_k: int = 5) -> list[dict[str, Any]]:
+        """
+        Query the episodic memory for the most similar solved questions.
+        """
+        if self.memory is None:
+            return []
+        return self.memory.recall(query, top_k)
+
+    def _remember_run(
+        self,
+        question: str,
+        messages: dict[str, Any],
+        answer: str,
+        reference_answer: str | None = None
+    ):
+        """
+        Remember a run whose answer matches the reference, or without one, a run answered without errors
+        """
+        if self.memory is None or not answer:
+            return
+        if reference_answer is not None:
+            if answer.strip() != reference_answer.strip():
+                return
+        elif not self._answered_cleanly(messages["messages"]):
+            return
+        self.remember(question, answer, tool_trace(messages["messages"]), verified=reference_answer is not None)
+
+    @staticmethod
+    def _answered_cleanly(messages: list) -> bool:
+        """Whether a run ended on an answer, with no tool call failing on the way."""
+        last = messages[-1]
+        if not isinstance(last, AIMessage) or last.tool_calls or not last.content:
+            return False
+        return not any(isinstance(m, ToolMessage) and m.status == "error" for m in messages)
+
+    def _fit_context(self, messages: list) -> list:
+        """
+        Return the messages of the state to send to the model, within the context budget if one is set
+        """
+        if self.context is None:
+            return messages
+        return self.context.fit(messages)
+
+    def _known_similar(self, query: str, k: int = 1) -> list[Document] | None:
+        """
+        Return the similar questions already retrieved for a query, by `prefetch_similar` or an earlier run
+        """
+        if self.retrieval_cache is None:
+            return None
+        return self.retrieval_cache.get(self._store_id, query, k)
+
+    def _cache_similar(self, query: str, similar: list[Document], k: int = 1):
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.put(self._store_id, query, k, similar)
+
+    def _retrieve_similar(self, query: str) -> list[Document]:
+        self._refresh_stores()
+        similar = self._known_similar(query)
+        if similar is None:
+            similar = self.vector_store.similarity_search(query, k=1)
+            self._cache_similar(query, similar)
+        return similar
+
+    async def _aretrieve_similar(self, query: str) -> list[Document]:
+        self._refresh_stores()
+        similar = self._known_similar(query)
+        if similar is None:
+            similar = await self.vector_store.asimilarity_search(query, k=1)
+            self._cache_similar(query, similar)
+        return similar
+
+    def _start_retrieval(self, query: str, config: dict[str, Any], loop: bool = False):
+        """
+        Retrieve the similar questions of a run into the retrieval cache in the background, unless already known
+
+        The retriever node of the run neither searches nor waits for them, so
+        the first assistant call starts at once. The retrieved example is not
+        part of the prompt, the result serves the later runs of the question.
+        """
+        if not self.speculative_retrieval or self._known_similar(query) is not None:
+            return
+        if loop:
+            pending = asyncio.ensure_future(self._aretrieve_similar(query))
+        else:
+            pending = self._retrieval_pool.submit(self._retrieve_similar, query)
+        pending.add_done_callback(self._count_retrieval)
+        config["configurable"]["speculative"] = True
+
+    def _count_retrieval(self, pending):
+        if pending.cancelled():
+            return
+        if pending.exception() is not None:
+            self.logger.warning(f"Speculative retrieval failed: {pending.exception()}")
+            METRICS.speculative_cache_fills.inc(outcome="failed")
+        else:
+            METRICS.speculative_cache_fills.inc(outcome="cached")
+
+    def prefetch_similar(self, questions: list[tuple[str, str | None]], k: int = 1) -> int:
+        """
+        Retrieve the similar questions of a whole question set at once
+
+        The queries are embedded in a single batch and searched together, and
+        the results are stored in the retrieval cache: the retriever node of
+        later runs reuses them instead of searching again. Without a retrieval
+        cache nothing is prefetched, and at most as many queries as the cache
+        holds are.
+
+        Args:
+            questions: (question, task_file_path) pairs, as they will be answered
+            k: Number of similar questions to keep per question
+
+        Returns:
+            The number of queries retrieved
+        """
+        if self.retrieval_cache is None:
+            self.logger.info("No retrieval cache, the similar questions are not pre-retrieved")
+            return 0
+        self._refresh_stores()
+        queries = list(dict.fromkeys(self._build_prompt(q, path) for q, path in questions))
+        queries = [query for query in queries if self._known_similar(query, k) is None]
+        # Beyond the cache size, the first results would be evicted before their runs
+        queries = queries[:self.retrieval_cache.max_entries]
+        if not queries:
+            return 0
+
+        vectors = self.vector_store.embeddings.embed_documents(queries)
+        if isinstance(self.vector_store, HybridVectorStore):
+            results = self.vector_store.similarity_search_batch(queries, vectors, k=k)
+        elif hasattr(self.vector_store, "similarity_search_by_vectors"):
+            # Local stores search all queries with one matrix product
+            results = self.vector_store.similarity_search_by_vectors(vectors, k=k)
+        else:
+            results = [self.vector_store.similarity_search_by_vector(vector, k=k) for vector in vectors]
+
+        for query, similar in zip(queries, results, strict=True):
+            self._cache_similar(query, similar, k)
+        self.logger.info(f"Pre-retrieved similar questions for {len(queries)} queries")
+        return len(queries)
+
+    def answer_question(
+        self,
+        question: str,
+        task_file_path: str | None = None,
+        raise_errors: bool = False,
+        reference_answer: str | None = None
+    ) -> str:
         """
         Process a question and return the answer
 
         Args:
             question: The question to answer
             task_file_path: Optional path to a file associated with the question
+            raise_errors: Re-raise errors instead of returning them as the answer
+            reference_answer: Known answer, only a matching answer is remembered by the episodic memory
 
         Returns:
             The answer to the question
         """
         try:
+            full_prompt = self._build_prompt(question, task_file_path)
+
+            messages = [HumanMessage(content=full_prompt)]
+            print("\n\n=== vvv ===")
+            config = {"callbacks": self.callbacks, "configurable": {"question": question}}
+            self._start_retrieval(full_prompt, config)
+            messages = self.agent.invoke({"messages": messages}, config=config)
+            answer = self._final_answer(messages)
+            self._remember_run(question, messages, answer, reference_answer)
+            return answer
+        except Exception as e:
+            if raise_errors:
+                raise
+            error_msg = f"Error answering question: {e}"
             if self.verbose:
-                print(f"Processing question: {question}")
-                if task_file_path:
-                    print(f"With associated file: {task_file_path}")
+                print(error_msg)
+            return error_msg
+
+    async def aanswer_question(
+        self,
+        question: str,
+        task_file_path: str | None = None,
+        raise_errors: bool = False,
+        reference_answer: str | None = None
+    ) -> str:
+        """
+        Process a question and return the answer, without blocking the event loop
+
+        Args:
+            question: The question to answer
+            task_file_path: Optional path to a file associated with the question
+            raise_errors: Re-raise errors instead of returning them as the answer
+            reference_answer: Known answer, only a matching answer is remembered by the episodic memory
+
+        Returns:
+            The answer to the question
+        """
+        try:
+            full_prompt = self._build_prompt(question, task_file_path)
+
+            messages = [HumanMessage(content=full_prompt)]
+            print("\n\n=== vvv ===")
+            config = {"callbacks": self.callbacks, "configurable": {"question": question}}
+            self._start_retrieval(full_prompt, config, loop=True)
+            messages = await self.agent.ainvoke({"messages": messages}, config=config)
+            answer = self._final_answer(messages)
+            if self.memory is not None:
+                await asyncio.to_thread(self._remember_run, question, messages, answer, reference_answer)
+            return answer
+        except Exception as e:
+            if raise_errors:
+                raise
+            error_msg = f"Error answering question: {e}"
+            if self.verbose:
+                print(error_msg)
+            return error_msg
+
+    async def aanswer_questions(
+        self,
+        questions: list[tuple[str, str | None]],
+        max_concurrency: int = 64,
+        raise_errors: bool = False
+    ) -> list[str]:
+        """
+        Answer many questions concurrently on the event loop
+
+        Args:
+            questions: (question, task_file_path) pairs
+            max_concurrency: Maximum number of questions in flight at the same time
+            raise_errors: Re-raise the first error instead of returning errors as answers
+
+        Returns:
+            The answers, in the order of the questions
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
 
-            # Create a context with file information if available
-            context = question
-            file_content = None
+        async def answer(question: str, task_file_path: str | None) -> str:
+            async with semaphore:
+                return await self.aanswer_question(question, task_file_path, raise_errors=raise_errors)
 
-            # If there's a file, read it and include its content in the context
+        return await asyncio.gather(*(answer(q, path) for q, path in questions))
+
+    def _build_prompt(self, question: str, task_file_path: str | None = None) -> str:
+        """
+        Build the prompt sent to the graph for a question
+
+        Args:
+            question: The question to answer
+            task_file_path: Optional path to a file associated with the question
+
+        Returns:
+            The full prompt
+        """
+        if self.verbose:
+            print(f"Processing question: {question}")
             if task_file_path:
-#                try:
-#                    with open(task_file_path, 'r') as f:
-#                        file_content = f.read()
+                print(f"With associated file: {task_file_path}")
+
+        # Create a context with file information if available
+        context = question
+        file_content = None
+
+        # If there's a file, read it and include its content in the context
+        if task_file_path:
+#            try:
+#                with open(task_file_path, 'r') as f:
+#                    file_content = f.read()
 #
-#                    # Determine file type from extension
-#                    import os
-#                    file_ext = os.path.splitext(task_file_path)[1].lower()
+#                # Determine file type from extension
+#                import os
+#                file_ext = os.path.splitext(task_file_path)[1].lower()
 #
-#                    context = f"""
+#                context = f"""
 #Question: {question}
 #This question has an associated file. Here is the file content:
 #```{file_ext}
@@ -315,62 +924,63 @@ class Agent:
 #```
 #Analyze the file content above to answer the question.
 #"""
-#                except Exception as file_e:
-                    context = f"""
+#            except Exception as file_e:
+                context = f"""
 Question: {question}
 This question has an associated file at path: {task_file_path}
 """
 
-            # Check for special cases that need specific formatting
-            # Reversed text questions
-            if question.startswith(".") or ".rewsna eht sa" in question:
-                context = f"""
+        # Check for special cases that need specific formatting
+        # Reversed text questions
+        if question.startswith(".") or ".rewsna eht sa" in question:
+            context = f"""
 This question appears to be in reversed text. Here's the reversed version:
 {question[::-1]}
 Now answer the question above. Remember to format your answer exactly as requested.
 """
 
-            # Add a prompt to ensure precise answers
-            full_prompt = f"""{context}
+        # Add a prompt to ensure precise answers
+        full_prompt = f"""{context}
 When answering, provide ONLY the precise answer requested.
 Do not include explanations, steps, reasoning, or additional text.
 Be direct and specific.
 For example, if asked "What is the capital of France?", respond simply with "Paris".
 """
 
-            self.logger.debug(full_prompt)
-            # Run the agent with the question
-            # answer = self.agent.run(full_prompt)
+        self.logger.debug(full_prompt)
+        return full_prompt
 
-            messages = [HumanMessage(content=full_prompt)]
-            print("\n\n=== vvv ===")
-            messages = self.agent.invoke({"messages": messages})
-            for m in messages["messages"]:
-                if isinstance(m, AIMessage):
-                    print(m.content)
-                    print(m.tool_calls)
-                    print(m.response_metadata)
-                    m.pretty_print()
-                    print("< --")
-            print("=== ^^^ ===\n\n")
-            answer = messages["messages"][-1].content
-
-            # Clean up the answer to ensure it's in the expected format
-            # Remove common prefixes that models often add
-            answer = self._clean_answer(answer)
+    def _final_answer(self, messages: dict[str, Any]) -> str:
+        """
+        Extract and clean the answer from the final graph state
 
-            if self.verbose:
-                print(f"Generated answer: {answer}")
+        Args:
+            messages: The state returned by the graph
 
-            print(answer)
-            # print(self.agent.memory.steps)
+        Returns:
+            The cleaned answer
+        """
+        for m in messages["messages"]:
+            if isinstance(m, AIMessage):
+                print(m.content)
+                print(m.tool_calls)
+                print(m.response_metadata)
+                m.pretty_print()
+                print("< --")
+        print("=== ^^^ ===\n\n")
+        answer = messages["messages"][-1].content
 
-            return answer
-        except Exception as e:
-            error_msg = f"Error answering question: {e}"
-            if self.verbose:
-                print(error_msg)
-            return error_msg
+        # Clean up the answer to ensure it's in the expected format
+        # Remove common prefixes that models often add
+        answer = self._clean_answer(answer)
+
+        if self.verbose:
+            print(f"Generated answer: {answer}")
+
+        print(answer)
+        # print(self.agent.memory.steps)
+
+        return answer
 
     def _clean_answer(self, answer: Any) -> str:
         """
@@ -0,0 +1,337 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from the_bot.agents.local_index import _normalize, _write_atomic
+
+logger = logging.getLogger(__name__)
+
+EPISODES_FILE = "episodes.jsonl"
+VECTORS_FILE = "vectors.npz"
+# Episodes added and evicted since the snapshot, replayed on load
+LOG_FILE = "episodes.log"
+
+
+class LSHIndex:
+    """
+    Approximate nearest-neighbour index with random hyperplane hashing.
+
+    Each table hashes a vector to the signs of its projections on `n_bits`
+    random hyperplanes, similar vectors tend to share a bucket in at least one
+    table. Candidates from the buckets of a query are rescored exactly.
+
+    Args:
+        dim: Dimension of the vectors
+        n_bits: Hyperplanes per table, more bits give smaller buckets
+        n_tables: Number of hash tables, more tables give a better recall
+        seed: Seed of the hyperplanes, so an index can be rebuilt identically
+    """
+
+    def __init__(self, dim: int, n_bits: int = 12, n_tables: int = 8, seed: int = 0):
+        self.dim = dim
+        self.planes = np.random.default_rng(seed).normal(size=(n_tables, n_bits, dim)).astype(np.float32)
+        self._weights = 1 << np.arange(n_bits)
+        self._tables: list[dict[int, set[str]]] = [defaultdict(set) for _ in range(n_tables)]
+        self._vectors: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def _hashes(self, vector: np.ndarray) -> list[int]:
+        bits = (self.planes @ vector) > 0
+        return [int(h) for h in bits @ self._weights]
+
+    def add(self, key: str, vector: np.ndarray):
+        vector = _normalize(vector)
+        self._vectors[key] = vector
+        for table, h in zip(self._tables, self._hashes(vector), strict=True):
+            table[h].add(key)
+
+    def remove(self, key: str):
+        vector = self._vectors.pop(key)
+        for table, h in zip(self._tables, self._hashes(vector), strict=True):
+            table[h].discard(key)
+            if not table[h]:
+                del table[h]
+
+    def vector(self, key: str) -> np.ndarray:
+        return self._vectors[key]
+
+    def search(self, vector: np.ndarray, k: int = 4) -> list[tuple[str, float]]:
+        """Return the k best (key, cosine similarity) pairs among the candidates of a vector."""
+        vector = _normalize(vector)
+        candidates: set[str] = set()
+        for table, h in zip(self._tables, self._hashes(vector), strict=True):
+            candidates |= table.get(h, set())
+        if len(candidates) < k:
+            # Too few neighbours share a bucket, fall back on an exact search
+            candidates = set(self._vectors)
+        if not candidates:
+            return []
+        keys = list(candidates)
+        scores = np.stack([self._vectors[key] for key in keys]) @ vector
+        order = np.argsort(-scores)[:k]
+        return [(keys[i], float(scores[i])) for i in order]
+
+
+class EpisodicMemory:
+    """
+    Bounded memory of answered questions, with their tool trace and answer.
+
+    Episodes are recalled by similarity of their question through an LSH
+    index. Beyond `max_episodes`, the episodes recalled the least, then the
+    least recently used, are evicted. The episode just remembered is never
+    the one evicted, and the use counts are halved every `max_episodes` new
+    episodes, so episodes recalled long ago make room for new ones instead of
+    freezing the memory.
+
+    With a path, the memory is loaded from a directory. New and evicted
+    episodes are appended to a log, which is compacted into a snapshot once
+    it holds as many records as the memory has episodes.
+
+    Args:
+        embeddings: Embeds the questions
+        max_episodes: Maximum number of episodes kept
+        path: Snapshot directory, or None to keep the memory in process only
+        min_compaction: Fewest log records compacted into a snapshot
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_episodes: int = 1000,
+        path: str | None = None,
+        min_compaction: int = 64,
+    ):
+        self.embeddings = embeddings
+        self.max_episodes = max_episodes
+        self.path = path
+        self.min_compaction = min_compaction
+        self.episodes: dict[str, dict[str, Any]] = {}
+        self.index: LSHIndex | None = None
+        self._remembered = 0
+        self._logged = 0
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.episodes)
+
+    def _add(self, episode: dict[str, Any], vector: np.ndarray):
+        if self.index is None:
+            self.index = LSHIndex(len(vector))
+        self.episodes[episode["id"]] = episode
+        self.index.add(episode["id"], vector)
+
+    def _age(self):
+        self._remembered += 1
+        if self._remembered % max(1, self.max_episodes) == 0:
+            for episode in self.episodes.values():
+                episode["uses"] //= 2
+
+    def _evict(self, keep: str | None = None) -> list[str]:
+        evicted = []
+        while len(self.episodes) > self.max_episodes:
+            candidates = [e for e in self.episodes.values() if e["id"] != keep] or list(self.episodes.values())
+            victim = min(candidates, key=lambda e: (e["uses"], e["last_used"]))
+            del self.episodes[victim["id"]]
+            self.index.remove(victim["id"])
+            evicted.append(victim["id"])
+        return evicted
+
+    def remember(
+        self,
+        question: str,
+        answer: str,
+        trace: list[dict[str, Any]] | None = None,
+        meta: Any = None,
+        verified: bool = False,
+    ) -> str:
+        """
+        Store an answered question.
+
+        Args:
+            question: The question
+            answer: Its final answer
+            trace: The tool calls that led to the answer
+            meta: Optional metadata
+            verified: Whether the answer was checked against a reference
+
+        Returns:
+            The episode id
+        """
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        now = time.time()
+        episode = {
+            "id": str(uuid.uuid4()),
+            "question": question,
+            "answer": answer,
+            "trace": trace or [],
+            "meta": meta,
+            "verified": verified,
+            "created": now,
+            "last_used": now,
+            "uses": 0,
+        }
+        with self._lock:
+            self._add(episode, vector)
+            self._age()
+            evicted = self._evict(keep=episode["id"] if self.max_episodes > 0 else None)
+            if self.path:
+                self._log(episode, evicted)
+        return episode["id"]
+
+    def recall(self, query: str, top_k: int = 3, min_score: float = 0.0) -> list[dict[str, Any]]:
+        """
+        Return the episodes most similar to a question, best first.
+
+        Args:
+            query: The new question
+            top_k: Maximum number of episodes
+            min_score: Minimum cosine similarity of a recalled episode
+        """
+        if not self.episodes:
+            return []
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        now = time.time()
+        recalled = []
+        with self._lock:
+            for key, score in self.index.search(vector, top_k):
+                if score < min_score or key not in self.episodes:
+                    continue
+                episode = self.episodes[key]
+                episode["uses"] += 1
+                episode["last_used"] = now
+                recalled.append({**episode, "score": score})
+        return recalled
+
+    def _log(self, episode: dict[str, Any], evicted: list[str]):
+        records = [{"add": episode, "vector": self.index.vector(episode["id"]).tolist()}]
+        records += [{"remove": key} for key in evicted]
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOG_FILE), "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._logged += len(records)
+        # Compacting costs one write of the memory per as many appended records
+        if self._logged >= max(self.min_compaction, len(self.episodes)):
+            self._save()
+
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        keys = list(self.episodes)
+        vectors = np.stack([self.index.vector(key) for key in keys]) if keys else np.empty((0, 0), np.float32)
+
+        def write_episodes(f):
+            for key in keys:
+                f.write((json.dumps(self.episodes[key], ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+
+        # The vectors are stored with their episode ids, a crash between the two writes cannot misalign them
+        _write_atomic(os.path.join(self.path, VECTORS_FILE), lambda f: np.savez(f, ids=np.array(keys), vectors=vectors))
+        _write_atomic(os.path.join(self.path, EPISODES_FILE), write_episodes)
+        # Replaying the log onto the snapshot it was compacted into changes nothing, a crash here is harmless
+        _write_atomic(os.path.join(self.path, LOG_FILE), lambda f: None)
+        self._logged = 0
+
+    def save(self):
+        """Snapshot the memory to its directory."""
+        if self.path:
+            with self._lock:
+                self._save()
+
+    def _load(self):
+        if os.path.exists(os.path.join(self.path, EPISODES_FILE)):
+            self._load_snapshot()
+        replayed = self._replay()
+        self._evict()
+        if replayed:
+            # Also drops a line torn by a crash, which later records would be appended to
+            self._save()
+        logger.info(f"Loaded {len(self.episodes)} episodes from {self.path}")
+
+    def _load_snapshot(self):
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        if not os.path.exists(vectors_path):
+            logger.warning(f"Episodic memory snapshot in {self.path} has no vectors, starting empty")
+            return
+        with np.load(vectors_path) as data:
+            vectors = dict(zip(data["ids"].tolist(), data["vectors"], strict=True))
+        with open(os.path.join(self.path, EPISODES_FILE), encoding="utf-8") as f:
+            episodes = [json.loads(line) for line in f if line.strip()]
+        missing = 0
+        for episode in episodes:
+            if episode["id"] not in vectors:
+                missing += 1
+                continue
+            self._add(episode, vectors[episode["id"]])
+        if missing:
+            logger.warning(f"Skipped {missing} episodes without vectors in {self.path}")
+
+    def _replay(self) -> int:
+        """Apply the log records written since the snapshot, return their number."""
+        try:
+            with open(os.path.join(self.path, LOG_FILE), encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return 0
+        replayed = 0
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn by a crash while appending
+                continue
+            replayed += 1
+            if "add" in record:
+                episode = record["add"]
+                if episode["id"] in self.episodes:
+                    self.index.remove(episode["id"])
+                self._add(episode, np.asarray(record["vector"], dtype=np.float32))
+            elif record.get("remove") in self.episodes:
+                del self.episodes[record["remove"]]
+                self.index.remove(record["remove"])
+        return replayed
+
+    def close(self):
+        self.save()
+
+
+def tool_trace(messages: list, max_result: int = 200) -> list[dict[str, Any]]:
+    """
+    Extract the tool calls of a graph run, with the start of their results.
+
+    Args:
+        messages: The messages of the final graph state
+        max_result: Characters of each tool result kept
+    """
+    results = {
+        m.tool_call_id: str(m.content)[:max_result]
+        for m in messages if getattr(m, "type", None) == "tool"
+    }
+    return [
+        {"tool": call["name"], "args": call["args"], "result": results.get(call.get("id"), "")}
+        for m in messages if getattr(m, "type", None) == "ai"
+        for call in getattr(m, "tool_calls", None) or []
+    ]
+
+
+def format_episodes(episodes: list[dict[str, Any]]) -> str:
+    """Describe recalled episodes for the system prompt."""
+    lines = ["Similar questions were solved before, reuse their approach when it applies:"]
+    for episode in episodes:
+        lines.append(f"\nQuestion: {episode['question']}")
+        for step in episode["trace"]:
+            args = ", ".join(f"{k}={v!r}" for k, v in step["args"].items())
+            lines.append(f"Tool: {step['tool']}({args}) -> {step['result']}")
+        checked = "checked against the reference" if episode.get("verified") else "not checked, may be wrong"
+        lines.append(f"Answer ({checked}): {episode['answer']}")
+    return "\n".join(lines)
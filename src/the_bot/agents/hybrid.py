@@ -0,0 +1,191 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from typing import Any
+
+from langchain_community.vectorstores import SupabaseVectorStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
+
+from the_bot.agents.compact_index import CompactVectorStore
+from the_bot.agents.local_index import LocalVectorStore, iter_supabase_rows
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and identifiers such as "80GSFC21M0002", "Rd5" or "sales_2023.xlsx"
+_TOKEN = re.compile(r"\w+(?:[.\-/]\w+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split a text into lowercase terms for keyword search.
+
+    Compound identifiers are kept whole and also split into their parts, so
+    "sales_2023.xlsx" matches both itself and "xlsx".
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        parts = re.split(r"[._\-/]", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part)
+    return terms
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring.
+
+    Documents can be added at any time, the collection statistics are read at
+    query time so nothing has to be rebuilt.
+
+    Args:
+        k1: Term frequency saturation
+        b: Document length normalization
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._lengths: list[int] = []
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, texts: Iterable[str]) -> list[int]:
+        """Index texts, returning their document numbers."""
+        added = []
+        with self._lock:
+            for text in texts:
+                doc = len(self._lengths)
+                terms = Counter(tokenize(text))
+                for term, count in terms.items():
+                    self._postings[term][doc] = count
+                length = sum(terms.values())
+                self._lengths.append(length)
+                self._total_length += length
+                added.append(doc)
+        return added
+
+    def search(self, query: str, k: int = 10) -> list[tuple[int, float]]:
+        """Return the k best (document number, score) pairs for a query."""
+        scores: dict[int, float] = defaultdict(float)
+        with self._lock:
+            n = len(self._lengths)
+            if not n:
+                return []
+            average_length = self._total_length / n
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc] / average_length)
+                    scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def store_documents(store: VectorStore) -> list[Document]:
+    """
+    Return every document of a vector store, to build the keyword index.
+
+    Raises:
+        TypeError: If the store does not support listing its documents
+    """
+    if isinstance(store, LocalVectorStore):
+        return list(store.documents)
+    if isinstance(store, CompactVectorStore):
+        return list(store.iter_documents())
+    if isinstance(store, InMemoryVectorStore):
+        return [Document(page_content=d["text"], metadata=d.get("metadata") or {}) for d in store.store.values()]
+    if isinstance(store, SupabaseVectorStore):
+        rows = iter_supabase_rows(store._client, store.table_name, columns="id, content, metadata")
+        return [Document(page_content=row["content"], metadata=row.get("metadata") or {}) for row in rows]
+    raise TypeError(f"Cannot list the documents of a {type(store).__name__}")
+
+
+class HybridVectorStore(VectorStore):
+    """
+    Dense vector search fused with BM25 keyword search.
+
+    Both searches rank `fetch_k` candidates, the candidates are merged with
+    reciprocal rank fusion: each document scores the sum of 1 / (rrf_k + rank)
+    over the rankings it appears in. Exact identifiers that embed poorly are
+    still found by the keyword search.
+
+    Args:
+        dense: The vector store searched by embedding
+        documents: The documents of the dense store, indexed for keyword search
+        fetch_k: Candidates taken from each search before fusion
+        rrf_k: Rank offset of the fusion, higher values flatten the ranks
+    """
+
+    def __init__(self, dense: VectorStore, documents: list[Document], fetch_k: int = 20, rrf_k: int = 60):
+        self.dense = dense
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.documents: list[Document] = []
+        self.keywords = BM25Index()
+        self._add_keywords(documents)
+
+    @classmethod
+    def from_store(cls, dense: VectorStore, **kwargs: Any) -> "HybridVectorStore":
+        """Build the keyword index over the current documents of a vector store."""
+        documents = store_documents(dense)
+        logger.info(f"Indexed {len(documents)} documents for keyword search")
+        return cls(dense, documents, **kwargs)
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self.dense.embeddings
+
+    def _add_keywords(self, documents: list[Document]):
+        self.keywords.add(doc.page_content for doc in documents)
+        self.documents.extend(documents)
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = self.dense.add_texts(texts, metadatas, **kwargs)
+        self._add_keywords([Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas, strict=True)])
+        return ids
+
+    def _fuse(self, query: str, dense_docs: list[Document], k: int) -> list[Document]:
+        scores: dict[str, float] = defaultdict(float)
+        by_content: dict[str, Document] = {}
+        for rank, doc in enumerate(dense_docs):
+            scores[doc.page_content] += 1 / (self.rrf_k + rank + 1)
+            by_content.setdefault(doc.page_content, doc)
+        for rank, (number, _) in enumerate(self.keywords.search(query, self.fetch_k)):
+            doc = self.documents[number]
+            scores[doc.page_content] += 1 / (self.rrf_k + rank + 1)
+            by_content.setdefault(doc.page_content, doc)
+        ranked = sorted(scores, key=lambda content: -scores[content])
+        return [by_content[content] for content in ranked[:k]]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return self._fuse(query, self.dense.similarity_search(query, k=self.fetch_k), k)
+
+    def similarity_search_batch(
+        self, queries: list[str], embeddings: list[list[float]], k: int = 4
+    ) -> list[list[Document]]:
+        """Search several queries whose embeddings are already computed."""
+        if hasattr(self.dense, "similarity_search_by_vectors"):
+            dense = self.dense.similarity_search_by_vectors(embeddings, k=self.fetch_k)
+        else:
+            dense = [self.dense.similarity_search_by_vector(vector, k=self.fetch_k) for vector in embeddings]
+        return [self._fuse(query, docs, k) for query, docs in zip(queries, dense, strict=True)]
+
+    @classmethod
+    def from_texts(
+        cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None, **kwargs: Any
+    ) -> "HybridVectorStore":
+        return cls.from_store(LocalVectorStore.from_texts(texts, embedding, metadatas))
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_FILE = "documents.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(path: str) -> dict[str, Any]:
+    """Read the manifest of an index directory, written last by `LocalVectorStore.save`."""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No vector index in {path}")
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _iter_rows(path: str) -> Iterator[dict[str, Any]]:
+    """Yield the documents of an index directory as parsed JSON rows, in the order of the embeddings."""
+    with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store: a matrix of normalized embeddings searched with a dot product.
+
+    The index is a directory holding the embeddings as a `.npy` matrix, memory
+    mapped when loaded, the documents as JSONL and a manifest. Searching it is a
+    single matrix-vector product, without any network round-trip.
+
+    Args:
+        embedding: Embeds the queries, it must be the model used to build the index.
+            Not needed to save an index built from precomputed embeddings.
+        vectors: (n, dim) embeddings of the documents
+        documents: The documents, in the order of the vectors
+        ids: The document ids, in the order of the vectors
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings | None,
+        vectors: np.ndarray | None = None,
+        documents: list[Document] | None = None,
+        ids: list[str] | None = None,
+    ):
+        self.embedding = embedding
+        self.documents = list(documents or [])
+        self.ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in self.documents]
+        if vectors is None:
+            vectors = np.empty((0, 0), dtype=np.float32)
+        self.vectors = vectors
+        if len(self.vectors) != len(self.documents) or len(self.ids) != len(self.documents):
+            raise ValueError(
+                f"Got {len(self.vectors)} vectors, {len(self.documents)} documents and {len(self.ids)} ids"
+            )
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        return self.add_vectors(self.embedding.embed_documents(texts), texts, metadatas, ids)
+
+    def add_vectors(
+        self,
+        vectors: np.ndarray | list[list[float]],
+        texts: list[str],
+        metadatas: list[dict],
+        ids: list[str],
+    ) -> list[str]:
+        """
+        Add documents with precomputed embeddings.
+
+        The matrix is copied into memory, call `save` to write it back to disk.
+        """
+        vectors = _normalize(vectors)
+        if len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, vectors])
+        else:
+            self.vectors = vectors
+        self.documents.extend(Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas, strict=True))
+        self.ids.extend(ids)
+        return ids
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: list[float] | np.ndarray, k: int = 4
+    ) -> list[tuple[Document, float]]:
+        if not len(self.documents):
+            return []
+        query = _normalize(embedding)
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        # Only sort the k best candidates
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+    def similarity_search_by_vectors(
+        self, embeddings: list[list[float]] | np.ndarray, k: int = 4
+    ) -> list[list[Document]]:
+        """Search several queries with one matrix product, returning the documents of each query."""
+        if not len(self.documents):
+            return [[] for _ in embeddings]
+        scores = _normalize(embeddings) @ self.vectors.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(scores))[:, None]
+        top = np.take_along_axis(top, np.argsort(-scores[rows, top], axis=1), axis=1)
+        return [[self.documents[i] for i in row] for row in top]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def save(self, path: str, embedding_model: str = ""):
+        """
+        Write the index to a directory.
+
+        Args:
+            path: The index directory, created if needed
+            embedding_model: Name of the embedding model, recorded in the manifest
+        """
+        os.makedirs(path, exist_ok=True)
+        vectors = np.ascontiguousarray(self.vectors, dtype=np.float32)
+
+        def write_documents(f):
+            for id_, doc in zip(self.ids, self.documents, strict=True):
+                line = {"id": id_, "page_content": doc.page_content, "metadata": doc.metadata}
+                f.write((json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        manifest = {
+            "count": len(self.documents),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "embedding_model": embedding_model,
+            "created": time.time(),
+        }
+        _write_atomic(os.path.join(path, EMBEDDINGS_FILE), lambda f: np.save(f, vectors))
+        _write_atomic(os.path.join(path, DOCUMENTS_FILE), write_documents)
+        # Written last, a missing manifest marks an incomplete index
+        _write_atomic(
+            os.path.join(path, MANIFEST_FILE), lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8"))
+        )
+        logger.info(f"Saved {manifest['count']} documents to {path}")
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, mmap: bool = True) -> "LocalVectorStore":
+        """
+        Load an index written by `save`.
+
+        Args:
+            path: The index directory
+            embedding: Embeds the queries
+            mmap: Memory-map the embeddings instead of reading them into memory
+
+        Raises:
+            FileNotFoundError: If the directory holds no complete index
+        """
+        manifest = _read_manifest(path)
+        vectors = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        documents, ids = [], []
+        for row in _iter_rows(path):
+            ids.append(row["id"])
+            documents.append(Document(page_content=row["page_content"], metadata=row.get("metadata") or {}))
+
+        model = manifest.get("embedding_model") or "unknown model"
+        logger.info(f"Loaded {len(documents)} documents from {path} ({model})")
+        return cls(embedding, vectors=vectors, documents=documents, ids=ids)
+
+
+def iter_supabase_rows(
+    client,
+    table_name: str = "documents",
+    page_size: int = 500,
+    columns: str = "id, content, metadata, embedding",
+) -> Iterator[dict[str, Any]]:
+    """Yield the rows of a Supabase vector table, a page at a time."""
+    start = 0
+    while True:
+        response = (
+            client.table(table_name)
+            .select(columns)
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+        )
+        yield from response.data
+        if len(response.data) < page_size:
+            return
+        start += page_size
+
+
+def export_supabase(
+    client,
+    path: str,
+    embedding_model: str = "",
+    table_name: str = "documents",
+    page_size: int = 500,
+) -> int:
+    """
+    Snapshot a Supabase vector table into a local index.
+
+    The stored embeddings are reused, so the documents are not embedded again.
+
+    Args:
+        client: Supabase client
+        path: The index directory to write
+        embedding_model: Name of the embedding model of the table, recorded in the manifest
+        table_name: The Supabase table, with id, content, metadata and embedding columns
+        page_size: Rows fetched per request
+
+    Returns:
+        The number of exported documents
+    """
+    vectors, texts, metadatas, ids = [], [], [], []
+    for row in iter_supabase_rows(client, table_name, page_size):
+        vector = row["embedding"]
+        # pgvector columns come back as their text representation
+        if isinstance(vector, str):
+            vector = json.loads(vector)
+        vectors.append(vector)
+        texts.append(row["content"])
+        metadatas.append(row.get("metadata") or {})
+        ids.append(str(row["id"]))
+
+    store = LocalVectorStore(None)
+    if vectors:
+        store.add_vectors(np.asarray(vectors, dtype=np.float32), texts, metadatas, ids)
+    store.save(path, embedding_model=embedding_model)
+    return len(store)
@@ -0,0 +1,283 @@
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast local nodes to slow LLM and tool calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: dict[str, str] | None = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[Labels, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Histogram with labels and cumulative buckets."""
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts, then sum and count
+        self._values: dict[Labels, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._values.get(tuple(sorted(labels.items())))
+            return int(series[-1]) if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._values.items()):
+                cumulative = 0.0
+                for bound, n in zip(self.buckets, series, strict=False):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_format_labels(labels, {'le': f'{bound:g}'})} {cumulative:g}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels, {'le': '+Inf'})} {series[-1]:g}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]:g}")
+        return lines
+
+
+class AgentMetrics:
+    """The metrics collected for the agent graph."""
+
+    def __init__(self):
+        self.question_latency = Histogram(
+            "the_bot_question_latency_seconds", "End-to-end latency of a graph run.")
+        self.questions = Counter(
+            "the_bot_questions_total", "Graph runs by status.")
+        self.node_latency = Histogram(
+            "the_bot_node_latency_seconds", "Latency of each graph node run.")
+        self.node_errors = Counter(
+            "the_bot_node_errors_total", "Graph node runs that raised.")
+        self.tool_latency = Histogram(
+            "the_bot_tool_latency_seconds", "Latency of each tool call.")
+        self.tool_calls = Counter(
+            "the_bot_tool_calls_total", "Tool calls by tool.")
+        self.tool_errors = Counter(
+            "the_bot_tool_errors_total", "Tool calls that raised.")
+        self.llm_tokens = Counter(
+            "the_bot_llm_tokens_total", "LLM tokens by model and direction (input or output).")
+        self.llm_throttled = Counter(
+            "the_bot_llm_throttled_total", "LLM calls rejected with a 429 by provider and model.")
+        self.llm_backend_calls = Counter(
+            "the_bot_llm_backend_calls_total",
+            "LLM calls of the router by backend and outcome (primary or fallback answer, error).")
+        self.speculative_cache_fills = Counter(
+            "the_bot_speculative_cache_fills_total",
+            "Similar-question searches run in the background into the retrieval cache by outcome (cached, failed).")
+        self.stream_early_stops = Counter(
+            "the_bot_stream_early_stops_total", "Streamed responses closed once their answer line was received.")
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in vars(self).values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide metrics, shared by every agent
+METRICS = AgentMetrics()
+
+
+def token_usage(message: AIMessage) -> tuple[int, int]:
+    """
+    Return the (input, output) token counts reported for an LLM response.
+
+    Uses the standard usage metadata when the provider fills it, and falls back
+    on the provider specific `response_metadata` otherwise.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    metadata = message.response_metadata or {}
+    # OpenAI compatible providers (Groq, xAI, DashScope)
+    if "token_usage" in metadata:
+        usage = metadata["token_usage"] or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    # Gemini
+    if "usage_metadata" in metadata:
+        usage = metadata["usage_metadata"] or {}
+        return usage.get("prompt_token_count", 0), usage.get("candidates_token_count", 0)
+    return 0, 0
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Record node, tool and token metrics from the callbacks of a graph run.
+
+    Args:
+        metrics: Where to record, the process-wide metrics by default
+        nodes: Names of the graph nodes to time
+        model: Model name used to label token counts
+    """
+
+    def __init__(
+        self,
+        metrics: AgentMetrics = METRICS,
+        nodes: tuple[str, ...] = ("retriever", "assistant", "tools"),
+        model: str = "",
+    ):
+        self.metrics = metrics
+        self.nodes = nodes
+        self.model = model
+        self._runs: dict[UUID, tuple[str, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, kind: str, name: str):
+        with self._lock:
+            self._runs[run_id] = (kind, name, time.perf_counter())
+
+    def _stop(self, run_id: UUID) -> tuple[str, str, float] | None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        kind, name, start = run
+        return kind, name, time.perf_counter() - start
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or ""
+        if parent_run_id is None:
+            self._start(run_id, "graph", name)
+            return
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+        # A node and the runnable it wraps can share a name, only time the outer one
+        if name in self.nodes and not (parent and parent[:2] == ("node", name)):
+            self._start(run_id, "node", name)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        run = self._stop(run_id)
+        if run is None:
+            return
+        kind, name, elapsed = run
+        if kind == "graph":
+            self.metrics.question_latency.observe(elapsed)
+            self.metrics.questions.inc(status="ok")
+            return
+        self.metrics.node_latency.observe(elapsed, node=name)
+        if name == "assistant" and isinstance(outputs, dict):
+            for message in outputs.get("messages", []):
+                if isinstance(message, AIMessage):
+                    tokens_in, tokens_out = token_usage(message)
+                    model = self.model or message.response_metadata.get("model_name", "")
+                    self.metrics.llm_tokens.inc(tokens_in, model=model, direction="input")
+                    self.metrics.llm_tokens.inc(tokens_out, model=model, direction="output")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._stop(run_id)
+        if run is None:
+            return
+        kind, name, elapsed = run
+        if kind == "graph":
+            self.metrics.question_latency.observe(elapsed)
+            self.metrics.questions.inc(status="error")
+            return
+        self.metrics.node_latency.observe(elapsed, node=name)
+        self.metrics.node_errors.inc(node=name)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or ""
+        self._start(run_id, "tool", name)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs):
+        run = self._stop(run_id)
+        if run is not None:
+            _, name, elapsed = run
+            self.metrics.tool_latency.observe(elapsed, tool=name)
+            self.metrics.tool_calls.inc(tool=name)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._stop(run_id)
+        if run is not None:
+            _, name, elapsed = run
+            self.metrics.tool_latency.observe(elapsed, tool=name)
+            self.metrics.tool_calls.inc(tool=name)
+            self.metrics.tool_errors.inc(tool=name)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", metrics: AgentMetrics = METRICS) -> ThreadingHTTPServer:
+    """
+    Serve the metrics on http://<host>:<port>/metrics from a daemon thread.
+
+    Returns:
+        The running server, call its `shutdown` method to stop it
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import shutil
+from collections.abc import Callable
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from the_bot.agents.local_index import _normalize
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+QUANTIZED_FILE = "model_quantized.onnx"
+
+# Questions shaped like the GAIA ones, embedded by both models for the parity check
+PARITY_TEXTS = (
+    "What is the capital of France?",
+    "How many studio albums were published by Mercedes Sosa between 2000 and 2009 (included)?",
+    "The attached Excel file contains the sales of menu items for a local fast-food chain. "
+    "What were the total sales that the chain made from food (not including drinks)?",
+    "In chess, what is the best move for black in the position shown in the attached image?",
+    ".rewsna eht sa \"tfel\" drow eht fo etisoppo eht etirw ,ecnetnes siht dnatsrednu uoy fI",
+    "Under which NASA award number was the work of R. G. Arendt supported?",
+)
+
+
+def _require_onnx():
+    try:
+        import optimum.onnxruntime  # noqa: F401
+        import transformers  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The ONNX embedding backend needs: pip install 'the_bot[onnx]'") from e
+
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Average the token vectors of each text, ignoring padding, as sentence-transformers does."""
+    mask = attention_mask[..., None].astype(np.float32)
+    return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def export_onnx(model_name: str, path: str, arch: str = "avx2"):
+    """
+    Export a transformers model to ONNX, with dynamic int8 quantization of its weights.
+
+    Args:
+        model_name: Hugging Face model id, e.g. "sentence-transformers/all-mpnet-base-v2"
+        path: Directory receiving the quantized model and its tokenizer
+        arch: CPU instruction set targeted by the quantization: "avx2", "avx512", "avx512_vnni" or "arm64"
+    """
+    _require_onnx()
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    config = getattr(AutoQuantizationConfig, arch)(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=path, quantization_config=config)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(path)
+    logger.info(f"Exported {model_name} to {path} with int8 {arch} quantization")
+
+
+def check_parity(
+    embeddings: Embeddings,
+    reference: Embeddings,
+    texts: tuple[str, ...] | list[str] = PARITY_TEXTS,
+    min_cosine: float = 0.98,
+) -> float:
+    """
+    Compare the vectors of two embedding models on the same texts.
+
+    Vectors of the documents and of the queries must stay comparable, so a
+    faster backend can only replace the model a vector store was built with if
+    each of its vectors points in nearly the same direction.
+
+    Returns:
+        The lowest cosine similarity between the vectors of a text
+
+    Raises:
+        ValueError: If a cosine similarity is below `min_cosine`
+    """
+    texts = list(texts)
+    candidate = _normalize(embeddings.embed_documents(texts))
+    expected = _normalize(reference.embed_documents(texts))
+    worst = float((candidate * expected).sum(axis=1).min())
+    if worst < min_cosine:
+        raise ValueError(f"Embeddings differ from the reference model: cosine similarity {worst:.4f} < {min_cosine}")
+    return worst
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed by an int8 ONNX model with onnxruntime on CPU.
+
+    The exported model gives mean-pooled, normalized vectors like the
+    sentence-transformers model it comes from (see `check_parity`), at a
+    fraction of the cost of full precision PyTorch.
+
+    Args:
+        path: Directory written by `export_onnx`
+        batch_size: Texts run through the model at a time
+        max_length: Tokens kept per text
+    """
+
+    def __init__(self, path: str, batch_size: int = 32, max_length: int = 384):
+        _require_onnx()
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.path = path
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(path, file_name=QUANTIZED_FILE)
+
+    @classmethod
+    def from_model_name(
+        cls,
+        model_name: str,
+        cache_dir: str = ".cache/onnx",
+        reference: Callable[[], Embeddings] | None = None,
+        arch: str = "avx2",
+        min_cosine: float = 0.98,
+    ) -> "OnnxEmbeddings":
+        """
+        Load the quantized export of a model, exporting it on first use.
+
+        Args:
+            model_name: Hugging Face model id
+            cache_dir: Directory holding the exports, one per model
+            reference: Builds the reference model, the export is kept only if `check_parity` passes against it
+            arch: CPU instruction set targeted by the quantization
+            min_cosine: Minimum cosine similarity of the parity check
+
+        Raises:
+            ValueError: If the export fails the parity check
+        """
+        path = os.path.join(cache_dir, model_name.replace("/", "--"))
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            return cls(path)
+
+        shutil.rmtree(path, ignore_errors=True)
+        export_onnx(model_name, path, arch)
+        embeddings = cls(path)
+        manifest = {"model_name": model_name, "arch": arch, "parity": None}
+        if reference is not None:
+            try:
+                manifest["parity"] = check_parity(embeddings, reference(), min_cosine=min_cosine)
+            except ValueError:
+                shutil.rmtree(path, ignore_errors=True)
+                raise
+            logger.info(f"ONNX export of {model_name} passed the parity check (cosine >= {manifest['parity']:.4f})")
+        # Written last, marks the export as complete
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return embeddings
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            vectors.append(_normalize(mean_pool(np.asarray(hidden), inputs["attention_mask"])))
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(list(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text])[0]
@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable
+
+from the_bot.agents.context import message_text, token_counter
+from the_bot.agents.metrics import METRICS, token_usage
+from the_bot.agents.streaming import StreamingLambda
+
+logger = logging.getLogger(__name__)
+
+# Free tier (requests per minute, tokens per minute) of each provider, used unless configured
+DEFAULT_LIMITS = {
+    "google": (10, 250_000),
+    "groq": (30, 6_000),
+    "HfApiModel": (60, 100_000),
+}
+
+# Output tokens reserved per request until the response reports its usage
+OUTPUT_ESTIMATE = 256
+
+# Seconds between two admission attempts while the concurrency limit is reached
+_POLL = 0.05
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether a provider error is a 429, whatever the client library raising it."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status == 429:
+        return True
+    name = type(error).__name__
+    return "RateLimit" in name or "ResourceExhausted" in name or "429" in str(error)
+
+
+def retry_after(error: BaseException) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refills `rate` units per second up to `capacity`.
+
+    Not thread-safe, `RateLimiter` holds its lock around it.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available, requests larger than the bucket wait for a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        # Large requests may take the level below zero, later ones wait for the debt.
+        # A negative amount gives back what was reserved but not used
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Client-side limit of the requests and tokens sent to one model.
+
+    Two token buckets enforce the requests and tokens per minute of the
+    provider. On top of them, the number of requests in flight follows AIMD:
+    it grows by one per limit of successful requests, and is halved by a 429,
+    which also pauses every request for the Retry-After delay. It is also
+    reduced when latency climbs well above the best latency seen, the sign of
+    a queue building up at the provider. Throughput settles just under the
+    real limit instead of oscillating between overload and idle.
+
+    Args:
+        rpm: Requests per minute
+        tpm: Tokens per minute, input and output
+        max_concurrency: Highest number of requests in flight
+        min_concurrency: Lowest number of requests in flight
+        latency_factor: Latency above this multiple of the best latency reduces concurrency
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        latency_factor: float = 3.0,
+    ):
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_factor = latency_factor
+        self.limit = float(min(4, max_concurrency))
+        self.in_flight = 0
+        self.throttled = 0
+        self._paused_until = 0.0
+        self._latency: float | None = None
+        self._best_latency: float | None = None
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Admit a request and return 0, or return the seconds to wait before trying again."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= int(self.limit):
+                return _POLL
+            wait = max(self.requests.wait(1, now), self.tokens.wait(tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, tokens: int):
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def release(
+        self,
+        reserved: int,
+        used: int | None = None,
+        latency: float | None = None,
+        error: BaseException | None = None,
+    ):
+        """
+        End a request admitted by `acquire`.
+
+        Args:
+            reserved: Tokens reserved by `acquire`
+            used: Tokens reported by the response, corrects the reservation
+            latency: Seconds the request took, if it succeeded
+            error: The error raised by the request, if any
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if used is not None:
+                self.tokens.take(used - reserved)
+            if error is not None and is_rate_limit_error(error):
+                self.throttled += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                pause = retry_after(error) or 60 / self.requests.capacity
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                logger.info(f"Rate limited, pausing {pause:.1f}s with at most {int(self.limit)} requests in flight")
+                return
+            if latency is None:
+                return
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self._best_latency = min(self._best_latency or self._latency, self._latency)
+            if self._latency > self.latency_factor * self._best_latency:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+
+class RateLimiters:
+    """
+    The rate limiters of the process, one per provider and model, shared by every agent and tool.
+
+    Until `enable` is called, `wrap` returns the models unchanged.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._limits: dict[tuple[str, str], tuple[int, int]] = {}
+        self._limiters: dict[tuple[str, str], RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def configure(self, provider: str, model: str, rpm: int, tpm: int):
+        """Set the limits of a model, before its limiter is first used."""
+        with self._lock:
+            self._limits[provider, model] = (rpm, tpm)
+            self._limiters.pop((provider, model), None)
+
+    def get(self, provider: str, model: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get((provider, model))
+            if limiter is None:
+                rpm, tpm = self._limits.get((provider, model), DEFAULT_LIMITS.get(provider, (60, 100_000)))
+                limiter = self._limiters[provider, model] = RateLimiter(rpm, tpm)
+            return limiter
+
+    def client_retries(self, retries: int) -> int:
+        """Retries of a wrapped model's own client: none once enabled, so every retry goes through the limiter."""
+        return 0 if self.enabled else retries
+
+    def clear(self):
+        with self._lock:
+            self.enabled = False
+            self._limits.clear()
+            self._limiters.clear()
+
+    def wrap(self, llm: Runnable, provider: str, model: str, max_retries: int = 3) -> Runnable:
+        """
+        Wrap a chat model so its calls go through the limiter of its provider and model.
+
+        Calls rejected with a 429 are retried up to `max_retries` times, once the limiter allows it.
+        A stream is only retried if it failed before its first chunk.
+        """
+        if not self.enabled:
+            return llm
+        limiter = self.get(provider, model)
+        count = token_counter(provider)
+
+        def estimate(messages: Sequence[BaseMessage]) -> int:
+            return sum(count(message_text(m)) for m in messages) + OUTPUT_ESTIMATE
+
+        def finish(reserved: int, response: Any, start: float):
+            used = sum(token_usage(response)) if hasattr(response, "response_metadata") else 0
+            limiter.release(reserved, used or None, time.perf_counter() - start)
+
+        def failed(reserved: int, error: Exception, attempt: int) -> bool:
+            limiter.release(reserved, error=error)
+            if not is_rate_limit_error(error):
+                return False
+            METRICS.llm_throttled.inc(provider=provider, model=model)
+            return attempt < max_retries
+
+        def invoke(messages: Sequence[BaseMessage]) -> Any:
+            reserved = estimate(messages)
+            for attempt in range(max_retries + 1):
+                limiter.acquire(reserved)
+                start = time.perf_counter()
+                try:
+                    response = llm.invoke(messages)
+                except Exception as e:
+                    if failed(reserved, e, attempt):
+                        continue
+                    raise
+                except BaseException:
+                    # Cancelled, e.g. the losing call of a hedge: free the slot without counting a failure
+                    limiter.release(reserved)
+                    raise
+                finish(reserved, response, start)
+                return response
+
+        async def ainvoke(messages: Sequence[BaseMessage]) -> Any:
+            reserved = estimate(messages)
+            for attempt in range(max_retries + 1):
+                await limiter.aacquire(reserved)
+                start = time.perf_counter()
+                try:
+                    response = await llm.ainvoke(messages)
+                except Exception as e:
+                    if failed(reserved, e, attempt):
+                        continue
+                    raise
+                except BaseException:
+                    # Cancelled, e.g. the losing call of a hedge: free the slot without counting a failure
+                    limiter.release(reserved)
+                    raise
+                finish(reserved, response, start)
+                return response
+
+        def stream(messages: Sequence[BaseMessage]) -> Iterator[Any]:
+            reserved = estimate(messages)
+            for attempt in range(max_retries + 1):
+                limiter.acquire(reserved)
+                start = time.perf_counter()
+                response = None
+                try:
+                    for chunk in llm.stream(messages):
+                        response = chunk if response is None else response + chunk
+                        yield chunk
+                except Exception as e:
+                    if failed(reserved, e, attempt) and response is None:
+                        continue
+                    raise
+                except BaseException:
+                    # Closed early by the consumer, or cancelled
+                    limiter.release(reserved)
+                    raise
+                finish(reserved, response, start)
+                return
+
+        async def astream(messages: Sequence[BaseMessage]) -> AsyncIterator[Any]:
+            reserved = estimate(messages)
+            for attempt in range(max_retries + 1):
+                await limiter.aacquire(reserved)
+                start = time.perf_counter()
+                response = None
+                try:
+                    async for chunk in llm.astream(messages):
+                        response = chunk if response is None else response + chunk
+                        yield chunk
+                except Exception as e:
+                    if failed(reserved, e, attempt) and response is None:
+                        continue
+                    raise
+                except BaseException:
+                    limiter.release(reserved)
+                    raise
+                finish(reserved, response, start)
+                return
+
+        return StreamingLambda(invoke, ainvoke, stream, astream, name=f"rate_limited_{model}")
+
+
+# Process-wide limiters, shared by every agent and tool
+RATE_LIMITERS = RateLimiters()
@@ -0,0 +1,125 @@
+import logging
+import threading
+from collections.abc import Callable, Hashable
+from typing import Any, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def close_resource(resource: Any):
+    """Default teardown: call the resource's `close` method if it has one."""
+    close = getattr(resource, "close", None)
+    if callable(close):
+        close()
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resource: Any = None
+        self.created = False
+        self.refs = 0
+        self.teardown: Callable[[Any], None] = close_resource
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of heavy resources shared by config key.
+
+    Embedding models, Supabase clients and vector stores are created on first
+    `acquire` and shared by every later `acquire` of the same key. Each acquire
+    is matched by a `release`, the resource is torn down once the last user
+    releases it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[Hashable, _Entry] = {}
+
+    def acquire(
+        self,
+        key: Hashable,
+        factory: Callable[[], T],
+        teardown: Callable[[T], None] = close_resource,
+    ) -> T:
+        """
+        Return the resource for a key, creating it with `factory` if needed.
+
+        Args:
+            key: Identifies the resource, usually a tuple of its kind and config
+            factory: Creates the resource
+            teardown: Releases the resource once it is no longer used
+
+        Returns:
+            The shared resource
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry())
+            entry.refs += 1
+
+        # Created outside the registry lock, so a slow model load does not block other keys
+        try:
+            with entry.lock:
+                if not entry.created:
+                    logger.info(f"Creating shared {key[0] if isinstance(key, tuple) else 'resource'}")
+                    entry.resource = factory()
+                    entry.teardown = teardown
+                    entry.created = True
+                return entry.resource
+        except Exception:
+            self._unref(key, entry)
+            raise
+
+    def _unref(self, key: Hashable, entry: _Entry) -> bool:
+        """Drop a reference, return True if it was the last one."""
+        with self._lock:
+            entry.refs -= 1
+            if entry.refs > 0:
+                return False
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            return True
+
+    def release(self, key: Hashable):
+        """
+        Release a resource acquired with `acquire`, tearing it down if it was the last reference.
+
+        Raises:
+            KeyError: If the key is not held
+        """
+        with self._lock:
+            entry = self._entries[key]
+        if self._unref(key, entry) and entry.created:
+            self._teardown(key, entry)
+
+    def refcount(self, key: Hashable) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.refs if entry else 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        """Tear down every resource, whatever its reference count."""
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for key, entry in entries:
+            if entry.created:
+                self._teardown(key, entry)
+
+    @staticmethod
+    def _teardown(key: Hashable, entry: _Entry):
+        try:
+            entry.teardown(entry.resource)
+        except Exception as e:
+            logger.warning(f"Failed to tear down {key[0] if isinstance(key, tuple) else 'resource'}: {e}")
+        entry.resource = None
+
+
+# Process-wide registry, shared by every agent
+REGISTRY = ResourceRegistry()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any
+
+from langchain_core.messages import BaseMessage, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from the_bot.agents.cassette import message_fingerprint
+from the_bot.agents.streaming import StreamingLambda
+
+logger = logging.getLogger(__name__)
+
+
+def tool_schema(tool: Any) -> Any:
+    """JSON schema of a bound tool, part of the cache key: a changed tool changes the responses."""
+    try:
+        return convert_to_openai_tool(tool)
+    except Exception:
+        return getattr(tool, "name", repr(tool))
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of chat model responses.
+
+    Responses are stored in SQLite, keyed by a hash of the model settings,
+    the bound tool schemas and the messages, so an identical conversation is
+    answered from the cache by every run and every process using the same
+    file. Full messages are stored, tool calls included. The least recently
+    used entries are evicted beyond `max_entries`.
+
+    Args:
+        path: The SQLite cache file
+        max_entries: Maximum number of cached responses
+    """
+
+    def __init__(self, path: str = ".cache/responses.sqlite", max_entries: int = 10_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL lets other processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, message TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(settings: dict[str, Any], tools: Sequence[Any], messages: Sequence[BaseMessage]) -> str:
+        """
+        Hash a request.
+
+        Args:
+            settings: Model settings that change the responses, e.g. provider, model id and temperature
+            tools: The tools bound to the model
+            messages: The messages sent to the model
+        """
+        payload = json.dumps(
+            [settings, [tool_schema(t) for t in tools], [message_fingerprint(m) for m in messages]],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> BaseMessage | None:
+        with self._lock:
+            row = self._conn.execute("SELECT message FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return messages_from_dict([json.loads(row[0])])[0]
+
+    def put(self, key: str, message: BaseMessage):
+        data = json.dumps(message_to_dict(message), ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, data, time.time()))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                logger.debug(f"Evicted {count - self.max_entries} responses from {self.path}")
+            self._conn.commit()
+
+    def wrap_llm(self, llm: Runnable, settings: dict[str, Any], tools: Sequence[Any] = ()) -> Runnable:
+        """
+        Wrap a chat model, usually the one with bound tools, so identical requests are answered from the cache.
+
+        Errors are not cached. A streamed response is stored once the stream
+        ends, also when the consumer closes it early: the streaming agent
+        stops at its answer line, which is all a replay of the same request
+        needs, and its system prompt keeps its requests apart from the
+        requests of a non-streaming agent.
+        """
+        def invoke(messages: Sequence[BaseMessage]) -> BaseMessage:
+            key = self.key(settings, tools, messages)
+            response = self.get(key)
+            if response is None:
+                response = llm.invoke(messages)
+                self.put(key, response)
+            return response
+
+        async def ainvoke(messages: Sequence[BaseMessage]) -> BaseMessage:
+            key = self.key(settings, tools, messages)
+            response = self.get(key)
+            if response is None:
+                response = await llm.ainvoke(messages)
+                self.put(key, response)
+            return response
+
+        def store(key: str, response: Any):
+            if response is not None:
+                self.put(key, message_chunk_to_message(response))
+
+        def stream(messages: Sequence[BaseMessage]) -> Iterator[Any]:
+            key = self.key(settings, tools, messages)
+            response = self.get(key)
+            if response is not None:
+                yield response
+                return
+            try:
+                for chunk in llm.stream(messages):
+                    response = chunk if response is None else response + chunk
+                    yield chunk
+            except GeneratorExit:
+                store(key, response)
+                raise
+            store(key, response)
+
+        async def astream(messages: Sequence[BaseMessage]) -> AsyncIterator[Any]:
+            key = self.key(settings, tools, messages)
+            response = self.get(key)
+            if response is not None:
+                yield response
+                return
+            try:
+                async for chunk in llm.astream(messages):
+                    response = chunk if response is None else response + chunk
+                    yield chunk
+            except GeneratorExit:
+                store(key, response)
+                raise
+            store(key, response)
+
+        return StreamingLambda(invoke, ainvoke, stream, astream, name="response_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Every live cache of the process, for `invalidate_all`
+_caches: "weakref.WeakSet[RetrievalCache]" = weakref.WeakSet()
+
+# Touched after ingestion, so the caches of other processes drop their entries too
+GENERATION_FILE = os.path.join(".cache", "retrieval.generation")
+
+
+def store_generation(path: str) -> int | None:
+    """Modification time of a generation file, None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def bump_generation(path: str = GENERATION_FILE):
+    """Touch a generation file, invalidating the caches that watch it in every process."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    previous = store_generation(path)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    # Coarse file system clocks can give two quick ingestions the same modification time
+    if previous is not None and store_generation(path) <= previous:
+        os.utime(path, ns=(previous + 1, previous + 1))
+
+
+def normalize_query(query: str) -> str:
+    """Unicode NFC with whitespace runs collapsed, so formatting differences share an entry."""
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results with a time to live.
+
+    Entries are keyed by store identity, k and normalized query. Ingestion in
+    this process invalidates the caches (see `invalidate_all`). Ingestion in
+    another process touches the generation file, whose change clears the
+    cache on its next lookup. The time to live bounds how stale results get
+    when documents are written some other way.
+
+    Args:
+        max_entries: Maximum number of cached results, 0 disables the cache
+        ttl: Seconds a result stays valid
+        generation_path: Generation file watched by the cache, None to only rely on the TTL
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, generation_path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation_path = generation_path
+        self._generation = store_generation(generation_path) if generation_path else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[float, list[Document]]] = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    @staticmethod
+    def _key(store: Hashable, query: str, k: int) -> tuple:
+        return store, k, normalize_query(query)
+
+    def _check_generation(self):
+        # Called with the lock held, a stat is cheap next to a vector search
+        if self.generation_path is None:
+            return
+        generation = store_generation(self.generation_path)
+        if generation != self._generation:
+            self._generation = generation
+            self._entries.clear()
+            logger.debug(f"{self.generation_path} changed, cleared the retrieval cache")
+
+    def get(self, store: Hashable, query: str, k: int) -> list[Document] | None:
+        key = self._key(store, query, k)
+        with self._lock:
+            self._check_generation()
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, store: Hashable, query: str, k: int, documents: list[Document]):
+        if self.max_entries <= 0:
+            return
+        key = self._key(store, query, k)
+        with self._lock:
+            self._check_generation()
+            self._entries[key] = (time.monotonic(), list(documents))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, store: Hashable | None = None):
+        """Drop the entries of a store, or every entry."""
+        with self._lock:
+            if store is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == store]:
+                    del self._entries[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def invalidate_all(generation_path: str | None = None):
+    """
+    Drop the entries of every retrieval cache of the process, after new documents are written.
+
+    Args:
+        generation_path: Generation file also touched, for the caches of the other processes
+    """
+    for cache in list(_caches):
+        cache.invalidate()
+    if generation_path:
+        bump_generation(generation_path)
+    logger.debug("Invalidated the retrieval caches")
@@ -0,0 +1,296 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable
+
+from the_bot.agents.metrics import METRICS
+from the_bot.agents.streaming import StreamingLambda
+
+logger = logging.getLogger(__name__)
+
+
+class Backend:
+    """
+    A chat model of the router, with the health of its recent calls.
+
+    Args:
+        name: Label of the backend, e.g. "groq:qwen-qwq-32b"
+        llm: The chat model, usually with bound tools
+        window: Recent latencies kept to estimate the tail latency
+    """
+
+    def __init__(self, name: str, llm: Runnable, window: int = 100):
+        self.name = name
+        self.llm = llm
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def succeeded(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.failures = 0
+
+    def failed(self, threshold: int, cooldown: float):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= threshold:
+                self.cooldown_until = time.monotonic() + cooldown
+                self.failures = 0
+                logger.warning(f"Backend {self.name} failed {threshold} times in a row, skipped for {cooldown:.0f}s")
+
+
+class LLMRouter:
+    """
+    Send each call to an ordered list of chat models, hedging slow calls and failing over on errors.
+
+    A call goes to the first healthy backend. If it has not answered after
+    its p95 latency, the same call is also sent to the next backend and the
+    first answer wins. If it fails with no other request in flight, the next
+    backend is called at once.
+    A backend failing `failure_threshold` times in a row is skipped for
+    `cooldown` seconds, unless every backend is cooling down.
+    Streams are not hedged, a stream failing before its first chunk fails
+    over to the next backend.
+
+    Losing calls run to their end in the background, so the latency of the
+    slow calls that were hedged still feeds the hedge delay. The hedge delay
+    runs from the submission of a call, so time a rate-limited backend spends
+    waiting for its limiter counts towards it.
+
+    Args:
+        backends: The backends, by order of preference
+        hedge_quantile: Latency quantile of a backend after which its call is hedged
+        hedge_delay: Hedging delay until a backend has `min_samples` latencies, None disables hedging
+        min_samples: Latencies needed before the quantile is used
+        max_hedges: Most extra requests sent for a slow call
+        failure_threshold: Consecutive failures that put a backend in cooldown
+        cooldown: Seconds a failing backend is skipped
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[Backend],
+        hedge_quantile: float = 0.95,
+        hedge_delay: float | None = 10.0,
+        min_samples: int = 20,
+        max_hedges: int = 1,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+    ):
+        if not backends:
+            raise ValueError("The router needs at least one backend")
+        self.backends = list(backends)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._pool = ThreadPoolExecutor(thread_name_prefix="llm-router")
+        # Losing async calls, referenced until they finish
+        self._losers: set[asyncio.Task] = set()
+
+    def _order(self) -> list[Backend]:
+        now = time.monotonic()
+        healthy = [b for b in self.backends if b.healthy(now)]
+        return healthy or list(self.backends)
+
+    def _delay(self, backend: Backend) -> float | None:
+        """Seconds to wait for a backend before hedging, None to never hedge."""
+        if self.hedge_delay is None:
+            return None
+        if len(backend.latencies) < self.min_samples:
+            return self.hedge_delay
+        return backend.quantile(self.hedge_quantile)
+
+    def _record(self, backend: Backend, start: float, error: BaseException | None = None):
+        if error is None:
+            backend.succeeded(time.perf_counter() - start)
+        elif not isinstance(error, asyncio.CancelledError):
+            backend.failed(self.failure_threshold, self.cooldown)
+            METRICS.llm_backend_calls.inc(backend=backend.name, outcome="error")
+            logger.warning(f"Backend {backend.name} failed: {error}")
+
+    def _call(self, backend: Backend, messages: Sequence[BaseMessage]) -> Any:
+        start = time.perf_counter()
+        try:
+            response = backend.llm.invoke(messages)
+        except Exception as e:
+            self._record(backend, start, e)
+            raise
+        self._record(backend, start)
+        return response
+
+    async def _acall(self, backend: Backend, messages: Sequence[BaseMessage]) -> Any:
+        start = time.perf_counter()
+        try:
+            response = await backend.llm.ainvoke(messages)
+        except BaseException as e:
+            self._record(backend, start, e)
+            raise
+        self._record(backend, start)
+        return response
+
+    def _next_timeout(self, order: list[Backend], launched: int, hedges: int, pending: dict) -> float | None:
+        if launched >= len(order) or hedges >= self.max_hedges or not pending:
+            return None
+        return self._delay(order[launched - 1])
+
+    def _forget(self, task: asyncio.Task):
+        self._losers.discard(task)
+        if not task.cancelled():
+            # Already recorded by `_acall`
+            task.exception()
+
+    def _won(self, backend: Backend, launched: int):
+        outcome = "primary" if backend is self.backends[0] else "fallback"
+        METRICS.llm_backend_calls.inc(backend=backend.name, outcome=outcome)
+        if launched > 1:
+            logger.debug(f"Call answered by {backend.name} after {launched} requests")
+
+    def invoke(self, messages: Sequence[BaseMessage]) -> Any:
+        order = self._order()
+        pending: dict = {}
+        launched = hedges = 0
+        error: BaseException | None = None
+
+        def launch():
+            nonlocal launched
+            backend = order[launched]
+            launched += 1
+            # Each call runs in a copy of the caller context, which carries the callbacks of the run
+            context = contextvars.copy_context()
+            pending[self._pool.submit(context.run, self._call, backend, messages)] = backend
+
+        launch()
+        while pending:
+            done, _ = wait(pending, timeout=self._next_timeout(order, launched, hedges, pending),
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                # Slow call: hedge with the next backend, the first answer wins
+                hedges += 1
+                launch()
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                if future.exception() is None:
+                    # Calls still running finish in the background, their latency feeds the health
+                    self._won(backend, launched)
+                    return future.result()
+                error = future.exception()
+            if not pending and launched < len(order):
+                launch()
+        raise error
+
+    async def ainvoke(self, messages: Sequence[BaseMessage]) -> Any:
+        order = self._order()
+        pending: dict = {}
+        launched = hedges = 0
+        error: BaseException | None = None
+
+        def launch():
+            nonlocal launched
+            backend = order[launched]
+            launched += 1
+            pending[asyncio.ensure_future(self._acall(backend, messages))] = backend
+
+        launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self._next_timeout(order, launched, hedges, pending),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        self._won(backend, launched)
+                        return task.result()
+                    error = task.exception()
+                if not pending and launched < len(order):
+                    launch()
+            raise error
+        except asyncio.CancelledError:
+            # Nobody waits for the answer anymore
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            for task in pending:
+                if not task.done():
+                    self._losers.add(task)
+                    task.add_done_callback(self._forget)
+
+    def stream(self, messages: Sequence[BaseMessage]) -> Iterator[Any]:
+        error: BaseException | None = None
+        for tried, backend in enumerate(self._order(), start=1):
+            start = time.perf_counter()
+            started = False
+            try:
+                for chunk in backend.llm.stream(messages):
+                    if not started:
+                        started = True
+                        self._won(backend, tried)
+                    yield chunk
+            except Exception as e:
+                self._record(backend, start, e)
+                if started:
+                    raise
+                error = e
+                continue
+            # Streams closed early by the consumer are not timed, their latency would be too low
+            self._record(backend, start)
+            return
+        raise error
+
+    async def astream(self, messages: Sequence[BaseMessage]) -> AsyncIterator[Any]:
+        error: BaseException | None = None
+        for tried, backend in enumerate(self._order(), start=1):
+            start = time.perf_counter()
+            started = False
+            try:
+                async for chunk in backend.llm.astream(messages):
+                    if not started:
+                        started = True
+                        self._won(backend, tried)
+                    yield chunk
+            except Exception as e:
+                self._record(backend, start, e)
+                if started:
+                    raise
+                error = e
+                continue
+            self._record(backend, start)
+            return
+        raise error
+
+    def as_runnable(self) -> Runnable:
+        return StreamingLambda(self.invoke, self.ainvoke, self.stream, self.astream, name="llm_router")
+
+    def close(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,142 @@
+import re
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from typing import Any
+
+from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from the_bot.agents.metrics import METRICS
+
+# Added to the system prompt, so the end of the answer can be detected while it streams
+ANSWER_INSTRUCTION = 'When you know the answer, write it on a single line starting with "FINAL ANSWER:" and stop.'
+
+_THINK = re.compile(r"<think>.*?</think>", re.S)
+_ANSWER = re.compile(r"FINAL ANSWER:[ \t]*(?P<answer>[^\n]*?)[ \t]*(?:\n|$)", re.I)
+
+
+class StreamingLambda(RunnableLambda):
+    """
+    A RunnableLambda around a chat model that also streams through the model.
+
+    A plain RunnableLambda streams by invoking its function, so a wrapper
+    around a chat model would deliver the whole response as one chunk.
+
+    Args:
+        func: Invokes the model
+        afunc: Invokes the model, async version
+        stream: Yields the chunks of the model response
+        astream: Yields the chunks of the model response, async version
+        name: Name of the runnable
+    """
+
+    def __init__(
+        self,
+        func: Callable[[Any], Any],
+        afunc: Callable[[Any], Any],
+        stream: Callable[[Any], Iterator[Any]],
+        astream: Callable[[Any], AsyncIterator[Any]],
+        name: str | None = None,
+    ):
+        super().__init__(func, afunc=afunc, name=name)
+        self._stream_func = stream
+        self._astream_func = astream
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        def transform(inputs: Iterator[Any]) -> Iterator[Any]:
+            for messages in inputs:
+                yield from self._stream_func(messages)
+
+        # Runs with the callbacks of the config, like invoke
+        yield from self._transform_stream_with_config(iter([input]), transform, config)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async def inputs() -> AsyncIterator[Any]:
+            yield input
+
+        async def transform(inputs: AsyncIterator[Any]) -> AsyncIterator[Any]:
+            async for messages in inputs:
+                async for chunk in self._astream_func(messages):
+                    yield chunk
+
+        async for chunk in self._atransform_stream_with_config(inputs(), transform, config):
+            yield chunk
+
+
+def visible_text(text: str) -> str:
+    """The text of a response without its reasoning, an unclosed <think> block hides everything after it."""
+    text = _THINK.sub("", text)
+    return text.split("<think>", 1)[0]
+
+
+def marked_answer(text: str, complete: bool = False) -> str | None:
+    """
+    Return the answer of a "FINAL ANSWER:" line once the line is complete.
+
+    Args:
+        text: The response so far
+        complete: Whether the response is over, which also ends its last line
+    """
+    for match in _ANSWER.finditer(visible_text(text)):
+        if match.group(0).endswith("\n") or complete:
+            if match.group("answer"):
+                return match.group("answer")
+    return None
+
+
+def _finish(response, stopped: bool) -> AIMessage:
+    if response is None:
+        # The model streamed nothing
+        return AIMessage(content="")
+    message = message_chunk_to_message(response) if hasattr(response, "tool_call_chunks") else response
+    if getattr(message, "tool_calls", None) or not isinstance(message.content, str):
+        return message
+    answer = marked_answer(message.content, complete=True)
+    if answer is None:
+        return message
+    if stopped:
+        METRICS.stream_early_stops.inc()
+    return AIMessage(content=answer, id=message.id, response_metadata=message.response_metadata,
+                     usage_metadata=getattr(message, "usage_metadata", None))
+
+
+def _can_stop(response) -> bool:
+    # Tool calls must be received whole, the answer line only ends a response without them
+    if getattr(response, "tool_call_chunks", None) or getattr(response, "tool_calls", None):
+        return False
+    return isinstance(response.content, str) and marked_answer(response.content) is not None
+
+
+def stream_until_answer(llm: Runnable, messages: Sequence[BaseMessage]) -> AIMessage:
+    """
+    Stream a response, closing the stream as soon as a complete "FINAL ANSWER:" line is received.
+
+    Closing the stream ends the request, so the provider stops generating.
+    A response with tool calls is streamed to its end.
+
+    Returns:
+        The answer alone if the response has an answer line, the whole response otherwise
+    """
+    stream = llm.stream(messages)
+    response = None
+    try:
+        for chunk in stream:
+            response = chunk if response is None else response + chunk
+            if _can_stop(response):
+                return _finish(response, stopped=True)
+    finally:
+        stream.close()
+    return _finish(response, stopped=False)
+
+
+async def astream_until_answer(llm: Runnable, messages: Sequence[BaseMessage]) -> AIMessage:
+    """Async version of `stream_until_answer`."""
+    stream = llm.astream(messages)
+    response = None
+    try:
+        async for chunk in stream:
+            response = chunk if response is None else response + chunk
+            if _can_stop(response):
+                return _finish(response, stopped=True)
+    finally:
+        await stream.aclose()
+    return _finish(response, stopped=False)
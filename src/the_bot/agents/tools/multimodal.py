@@ -8,6 +8,8 @@ from langchain_core.messages import HumanMessage
 from langchain_core.tools import tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from the_bot.agents.rate_limit import RATE_LIMITERS
+
 @tool
 def image_analysis_tool(
     question: str,
@@ -33,9 +35,10 @@ def image_analysis_tool(
         llm = ChatGoogleGenerativeAI(
             model=model_id,
             temperature=0,
-            max_retries=2,
+            max_retries=RATE_LIMITERS.client_retries(2),
             google_api_key=google_api_key
         )
+        llm = RATE_LIMITERS.wrap(llm, "google", model_id)
 
         with open(file_path, "rb") as image_file:
             encoded_image = base64.b64encode(image_file.read()).decode("utf-8")
@@ -78,9 +81,10 @@ def audio_analysis_tool(
         llm = ChatGoogleGenerativeAI(
             model=model_id,
             temperature=0,
-            max_retries=2,
+            max_retries=RATE_LIMITERS.client_retries(2),
             google_api_key=google_api_key,
         )
+        llm = RATE_LIMITERS.wrap(llm, "google", model_id)
 
         with open(file_path, "rb") as image_file:
             encoded_audio = base64.b64encode(image_file.read()).decode("utf-8")
@@ -127,9 +131,10 @@ def video_analysis_tool(
         llm = ChatGoogleGenerativeAI(
             model=model_id,
             temperature=0,
-            max_retries=2,
+            max_retries=RATE_LIMITERS.client_retries(2),
             google_api_key=google_api_key
         )
+        llm = RATE_LIMITERS.wrap(llm, "google", model_id)
 
         with open(file_path, "rb") as image_file:
             encoded_video = base64.b64encode(image_file.read()).decode("utf-8")
@@ -189,9 +194,10 @@ def youtube_analysis_tool(
         llm = ChatGoogleGenerativeAI(
             model=model_id,
             temperature=0,
-            max_retries=2,
+            max_retries=RATE_LIMITERS.client_retries(2),
             google_api_key=google_api_key
         )
+        llm = RATE_LIMITERS.wrap(llm, "google", model_id)
 
         try:
             # Configure yt-dlp with minimal extraction
@@ -0,0 +1,252 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any
+
+from the_bot.agents.core import Agent
+
+logger = logging.getLogger(__name__)
+
+
+def debug_environment():
+    """Print which API vars are set (values redacted)."""
+    for var in [
+        "HF_TOKEN", "HUGGINGFACEHUB_API_TOKEN",
+        "OPENAI_API_KEY", "XAI_API_KEY",
+        "AGENT_MODEL_TYPE", "AGENT_MODEL_ID",
+        "AGENT_TEMPERATURE", "AGENT_VERBOSE",
+        "AGENT_MAX_WORKERS", "AGENT_JOURNAL", "AGENT_RESUME",
+        "AGENT_FILE_CACHE", "AGENT_PREFETCH_WORKERS", "AGENT_PRELOAD",
+        "AGENT_CASSETTE", "AGENT_CASSETTE_MODE", "AGENT_METRICS_PORT",
+        "AGENT_VECTOR_INDEX", "AGENT_EMBEDDING_CACHE", "AGENT_HYBRID_RETRIEVAL",
+        "AGENT_LLM_CACHE", "AGENT_RATE_LIMIT", "AGENT_FALLBACK_BACKENDS",
+        "DASHSCOPE_API_KEY", "GEMINI_API_KEY",
+        "SUPABASE_URL", "SUPABASE_SERVICE_KEY"
+    ]:
+        status = "[SET]" if os.getenv(var) else "[NOT SET]"
+        print(f"{var}: {status}")
+
+
+def load_env(override: bool = False):
+    """Load .env if available."""
+    try:
+        import dotenv
+        dotenv.load_dotenv(override=override)
+        print("Loaded .env")
+    except ImportError:
+        pass
+
+
+def fallback_backends_from_env(api_keys: dict[str, str | None]) -> list[dict[str, Any]]:
+    """
+    Parse AGENT_FALLBACK_BACKENDS, a comma separated list of provider:model_id.
+
+    Args:
+        api_keys: API key of each provider, providers reading their key from the environment are left out
+    """
+    backends = []
+    for entry in os.getenv("AGENT_FALLBACK_BACKENDS", "").split(","):
+        if not entry.strip():
+            continue
+        model_type, _, model_id = entry.strip().partition(":")
+        if not model_id:
+            raise RuntimeError(f"Invalid fallback backend '{entry}', expected provider:model_id")
+        backends.append({"model_type": model_type, "model_id": model_id, "api_key": api_keys.get(model_type)})
+    return backends
+
+
+def agent_kwargs_from_env() -> dict[str, Any]:
+    """
+    Build the Agent constructor arguments from the environment.
+
+    Returns:
+        The keyword arguments for `Agent`
+
+    Raises:
+        RuntimeError: If no credentials are found for the configured model type
+    """
+    # Gather config from env
+    hf_token = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    openai_key = os.getenv("OPENAI_API_KEY")
+    xai_key = os.getenv("XAI_API_KEY")
+    dashscope_key = os.getenv("DASHSCOPE_API_KEY")
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    model_type = os.getenv("AGENT_MODEL_TYPE", "HfApiModel")
+    # model_id = os.getenv("AGENT_MODEL_ID", "gpt-4o")
+    temperature = float(os.getenv("AGENT_TEMPERATURE", "0.2"))
+    verbose = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
+    system_prompt=os.getenv("SYSTEM_PROMPT")
+    hedge_delay = os.getenv("AGENT_HEDGE_DELAY", "10")
+
+    # Decide which credentials to use
+    agent_kwargs = {
+        "model_type": model_type,
+        "temperature": temperature,
+        "executor_type": "local",
+        "verbose": verbose,
+        "tool_modules": ["the_bot.agents.tools"],
+        "system_prompt": system_prompt,
+        "supabase_url": supabase_url,
+        "supabase_service_key": supabase_service_key,
+        "vector_index_path": os.getenv("AGENT_VECTOR_INDEX"),
+        "vector_index_dtype": os.getenv("AGENT_VECTOR_INDEX_DTYPE", "float32"),
+        "hybrid_retrieval": os.getenv("AGENT_HYBRID_RETRIEVAL", "false").lower() == "true",
+        "speculative_retrieval": os.getenv("AGENT_SPECULATIVE_RETRIEVAL", "false").lower() == "true",
+        "streaming": os.getenv("AGENT_STREAMING", "false").lower() == "true",
+        "context_budget": int(os.getenv("AGENT_CONTEXT_BUDGET", "0")),
+        "context_keep_turns": int(os.getenv("AGENT_CONTEXT_KEEP_TURNS", "2")),
+        "retrieval_cache_size": int(os.getenv("AGENT_RETRIEVAL_CACHE_SIZE", "1024")),
+        "retrieval_cache_ttl": float(os.getenv("AGENT_RETRIEVAL_CACHE_TTL", "3600")),
+        "episodic_memory_size": int(os.getenv("AGENT_MEMORY_SIZE", "0")),
+        "episodic_memory_path": os.getenv("AGENT_MEMORY_PATH") or None,
+        "embedding_cache_path": os.getenv("AGENT_EMBEDDING_CACHE", ".cache/embeddings.sqlite"),
+        "embedding_cache_size": int(os.getenv("AGENT_EMBEDDING_CACHE_SIZE", "100000")),
+        "embedding_backend": os.getenv("AGENT_EMBEDDING_BACKEND", "torch"),
+        "rate_limit": os.getenv("AGENT_RATE_LIMIT", "false").lower() == "true",
+        "rate_limit_rpm": int(os.getenv("AGENT_RATE_LIMIT_RPM", "0")) or None,
+        "rate_limit_tpm": int(os.getenv("AGENT_RATE_LIMIT_TPM", "0")) or None,
+        "fallback_backends": fallback_backends_from_env({"google": gemini_key, "HfApiModel": hf_token}),
+        "hedge_delay": None if hedge_delay.lower() == "none" else float(hedge_delay),
+        "backend_cooldown": float(os.getenv("AGENT_BACKEND_COOLDOWN", "60")),
+        "llm_cache_path": os.getenv("AGENT_LLM_CACHE") or None,
+        "llm_cache_size": int(os.getenv("AGENT_LLM_CACHE_SIZE", "10000")),
+        "llm_cache_skip_sampled": os.getenv("AGENT_LLM_CACHE_SKIP_SAMPLED", "false").lower() == "true",
+        "cassette_path": os.getenv("AGENT_CASSETTE"),
+        "cassette_mode": os.getenv("AGENT_CASSETTE_MODE", "replay"),
+        "cassette_latency_scale": float(os.getenv("AGENT_CASSETTE_LATENCY_SCALE", "0"))
+    }
+    if model_type == "groq":
+        # OpenAI | xai | dashscope
+        if dashscope_key:
+            agent_kwargs["api_key"] = dashscope_key
+            agent_kwargs["api_base"] = os.getenv("DASHSCOPE_API_BASE", "https://dashscope-intl.aliyuncs.com/compatible-mode/v1")
+            agent_kwargs["model_id"] = os.getenv("AGENT_MODEL_ID")
+        elif xai_key:
+            agent_kwargs["api_key"] = xai_key
+            agent_kwargs["api_base"] = os.getenv("XAI_API_BASE", "https://api.x.ai/v1")
+        elif openai_key:
+            agent_kwargs["api_key"] = openai_key
+            agent_kwargs["api_base"] = os.getenv("AGENT_API_BASE", None)
+        else:
+            raise RuntimeError("No API credentials found for OpenAI")
+    elif gemini_key and model_type == "google":
+        agent_kwargs["api_key"] = gemini_key
+        agent_kwargs["model_id"] = os.getenv("AGENT_MODEL_ID", "gemini-2.5-flash-preview-04-17")
+    elif hf_token and model_type == "HfApiModel":
+        agent_kwargs["api_key"] = hf_token
+        agent_kwargs["model_id"] = os.getenv("AGENT_MODEL_ID", "meta-llama/Llama-3.3-70B-Instruct")
+    else:
+        raise RuntimeError("No API credentials found for Hugging Face or OpenAI compatible services")
+
+    return agent_kwargs
+
+
+class AgentWrapper:
+    def __init__(self, agent_kwargs: dict[str, Any] | None = None):
+        if agent_kwargs is None:
+            load_env()
+            debug_environment()
+            agent_kwargs = agent_kwargs_from_env()
+
+        # Instantiate
+        logger.info(f"Initializing Agent with: {agent_kwargs}")
+        self.agent_kwargs = agent_kwargs
+        self.agent = Agent(**agent_kwargs)
+        logger.info(f"Initialized Agent: {agent_kwargs}")
+        print(f"Initialized Agent: {agent_kwargs}")
+        # Calls and runs in flight, a retired agent is closed once they are done
+        self._in_flight = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        """
+        Keep the agent open for a whole run, across a reload between two of its calls.
+
+        Example:
+            agent = get_agent()
+            with agent.session():
+                for task in tasks:
+                    agent(task["question"], task["file_name"])
+        """
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                close = self._retired and self._in_flight == 0
+            if close:
+                self.agent.close()
+
+    def retire(self):
+        """Close the agent once the calls and runs in flight are done, or now if there are none."""
+        with self._lock:
+            self._retired = True
+            close = self._in_flight == 0
+        if close:
+            self.agent.close()
+
+    def __call__(self, question: str, file_name: str, raise_errors: bool = False) -> str:
+        if not question.strip():
+            return "Please provide a question."
+        with self.session():
+            try:
+                return self.agent.answer_question(question, file_name, raise_errors=raise_errors)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logger.debug("Error in agent:", e)
+                return "Agent error—see logs."
+
+    def prefetch_similar(self, questions: list[tuple[str, str]]):
+        """Retrieve the similar questions of a question set in one batch, ahead of answering it."""
+        with self.session():
+            try:
+                self.agent.prefetch_similar(questions)
+            except Exception as e:
+                # The retriever node searches each question on its own instead
+                logger.warning(f"Batch pre-retrieval failed: {e}")
+
+
+# Process-wide warm agent, shared by every evaluation run
+_warm_agent: AgentWrapper | None = None
+_warm_lock = threading.Lock()
+
+
+def get_agent() -> AgentWrapper:
+    """
+    Return the process-wide agent, building it on first use.
+
+    Building an agent loads the LLM client, the tools, the embedding model and
+    compiles the graph, so it is done once and reused across requests.
+    """
+    global _warm_agent
+    with _warm_lock:
+        if _warm_agent is None:
+            _warm_agent = AgentWrapper()
+        return _warm_agent
+
+
+def reload_agent() -> AgentWrapper:
+    """
+    Rebuild the process-wide agent from the current environment and .env file.
+
+    The previous agent keeps serving until the new one is ready, so a failed
+    reload leaves it in place. It is closed once its runs in flight are done.
+    """
+    global _warm_agent
+    load_env(override=True)
+    debug_environment()
+    agent = AgentWrapper(agent_kwargs_from_env())
+    with _warm_lock:
+        previous, _warm_agent = _warm_agent, agent
+    # Resources the new agent shares with the previous one stay alive
+    if previous is not None:
+        previous.retire()
+    return agent
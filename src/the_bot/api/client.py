@@ -1,4 +1,5 @@
 import requests
+from collections.abc import Iterator
 from typing import Any
 
 class GAIAApiClient:
@@ -20,11 +21,17 @@ class GAIAApiClient:
         response.raise_for_status()
         return response.json()
 
-    def get_file(self, task_id: str) -> bytes:
+    def get_file(self, task_id: str, timeout: float | None = None) -> bytes:
         """Download a file for a specific task"""
-        response = requests.get(f"{self.files_url}/{task_id}")
-        response.raise_for_status()
-        return response.content
+        return b"".join(self.iter_file(task_id, timeout=timeout))
+
+    def iter_file(self, task_id: str, chunk_size: int = 64 * 1024, timeout: float | None = None) -> Iterator[bytes]:
+        """Stream a file for a specific task in chunks, without holding it in memory"""
+        with requests.get(f"{self.files_url}/{task_id}", stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size):
+                if chunk:
+                    yield chunk
 
     def submit_answers(self, username: str, agent_code: str, answers: list[dict[str, Any]]) -> dict[str, Any]:
         """Submit agent answers and get score"""
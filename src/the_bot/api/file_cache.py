@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from the_bot.api.client import GAIAApiClient
+
+logger = logging.getLogger(__name__)
+
+
+class FileCache:
+    """
+    Content-addressed on-disk cache of task attachments.
+
+    Files are streamed to disk in chunks and stored under the SHA-256 of their
+    content, keeping their original name so tools can rely on the extension:
+
+        <cache_dir>/objects/<sha[:2]>/<sha>/<file_name>
+
+    An index maps each task id to its object, so attachments downloaded by a
+    previous run are reused without hitting the API again.
+    """
+
+    def __init__(
+        self,
+        client: GAIAApiClient,
+        cache_dir: str = ".cache/gaia_files",
+        max_workers: int = 4,
+        timeout: float = 30,
+        chunk_size: int = 64 * 1024,
+    ):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._index = self._load_index()
+
+    def __enter__(self) -> "FileCache":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stop the prefetch workers, waiting for running downloads to finish."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _load_index(self) -> dict[str, dict[str, Any]]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable file cache index {self.index_path}: {e}")
+            return {}
+
+    def _save_index(self):
+        # Called with the lock held; write then rename so the index is never half-written
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, sha256: str, file_name: str) -> str:
+        return os.path.join(self.cache_dir, "objects", sha256[:2], sha256, os.path.basename(file_name))
+
+    def path_for(self, task_id: str) -> str | None:
+        """
+        Returns:
+            The cached path of the task attachment, or None if it is not cached
+        """
+        with self._lock:
+            entry = self._index.get(task_id)
+        if entry and os.path.exists(entry["path"]):
+            return entry["path"]
+        return None
+
+    def fetch(self, task_id: str, file_name: str) -> str:
+        """
+        Return the local path of a task attachment, downloading it if needed.
+
+        Args:
+            task_id: The task the file is attached to
+            file_name: Original file name of the attachment
+
+        Returns:
+            The path of the cached file
+        """
+        path = self.path_for(task_id)
+        if path:
+            logger.debug(f"File cache hit for task {task_id}: {path}")
+            return path
+
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self.client.iter_file(task_id, chunk_size=self.chunk_size, timeout=self.timeout):
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            path = self._object_path(digest, file_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._index[task_id] = {"file_name": file_name, "sha256": digest, "size": size, "path": path}
+            self._save_index()
+        logger.info(f"Downloaded {file_name} for task {task_id} ({size} bytes)")
+        return path
+
+    def prefetch(self, tasks: Iterable[dict[str, Any]]) -> dict[str, Future]:
+        """
+        Start downloading the attachments of several tasks in the background.
+
+        Args:
+            tasks: Tasks as returned by the scoring API
+
+        Returns:
+            A future resolving to the local file path, for each task with an attachment
+        """
+        return {
+            task["task_id"]: self._executor.submit(self.fetch, task["task_id"], task["file_name"])
+            for task in tasks
+            if task.get("task_id") and task.get("file_name")
+        }
@@ -0,0 +1,334 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+import click
+
+from the_bot.agents.embedding_cache import CachedEmbeddings
+from the_bot.agents.local_index import export_supabase
+from the_bot.agents.metrics import start_metrics_server
+from the_bot.agents.retrieval_cache import GENERATION_FILE
+from the_bot.agents.utils import get_score
+from the_bot.agents.wrapper import get_agent, load_env
+from the_bot.api.client import GAIAApiClient
+from the_bot.api.file_cache import FileCache
+from the_bot.ingest import LocalIndexSink, SupabaseSink, ingest, iter_jsonl
+from the_bot.journal import RunJournal
+from the_bot.runner import run_task, run_tasks
+
+logger = logging.getLogger(__name__)
+
+
+def load_tasks(input_path: str | None, api_url: str) -> list[dict[str, Any]]:
+    """
+    Load the question set, from a local JSONL file or from the scoring API.
+
+    Each JSONL line holds a task with `task_id`, `question` and an optional
+    `file_name`, which for local tasks is the path of the attachment.
+    """
+    if input_path is None:
+        return GAIAApiClient(api_url).get_questions()
+
+    tasks = []
+    with open(input_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                tasks.append(json.loads(line))
+    return tasks
+
+
+def _init_worker():
+    """Build the warm agent of a worker process before it receives tasks."""
+    load_env()
+    get_agent()
+
+
+def _answer(question: str, file_name: str) -> str:
+    return get_agent()(question, file_name, raise_errors=True)
+
+
+def _downloaded_path(task: dict[str, Any], download: Future | None) -> str:
+    """Return the local path of a task attachment, falling back to its file name."""
+    if download is None:
+        return task.get("file_name", "")
+    try:
+        return download.result()
+    except Exception as e:
+        logger.warning(f"Failed to retrieve the file for task {task['task_id']}: {e}")
+        return task.get("file_name", "")
+
+
+def _answer_task(task: dict[str, Any]) -> dict[str, Any]:
+    """Answer one task in a worker process with its warm agent."""
+    return run_task(_answer, task)
+
+
+def _failed_result(task: dict[str, Any], error: BaseException) -> dict[str, Any]:
+    """Result record of a task whose worker process failed, in the format of `run_task`."""
+    return {
+        "task_id": task["task_id"],
+        "question": task.get("question", ""),
+        "answer": f"Agent error: {error}",
+        "status": "error",
+        "elapsed": 0.0,
+    }
+
+
+def run_in_processes(
+    tasks: list[dict[str, Any]],
+    downloads: dict[str, Future],
+    processes: int,
+    journal: RunJournal,
+    initializer: Callable[[], None] = _init_worker,
+    answer_task: Callable[[dict[str, Any]], dict[str, Any]] = _answer_task,
+) -> list[dict[str, Any]]:
+    """
+    Spread tasks across worker processes, each with its own warm agent.
+
+    Tasks without an attachment are dispatched right away, the others as soon
+    as their attachment is downloaded. Results are journaled as they arrive.
+
+    A worker process dying, e.g. out of memory, breaks the pool and every task
+    in flight with it. Those tasks are retried one at a time afterwards, so
+    only the task that kills its worker is recorded as failed.
+    """
+    results: dict[str, dict[str, Any]] = {}
+    # spawn avoids forking a parent that runs download threads
+    context = multiprocessing.get_context("spawn")
+
+    def new_pool(workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initializer)
+
+    def record(future: Future):
+        # Journal each result as soon as it arrives, not when the progress loop gets to it
+        if not future.cancelled() and future.exception() is None:
+            journal.record(future.result())
+
+    def submit(pool: ProcessPoolExecutor, task: dict[str, Any]) -> Future:
+        future = pool.submit(answer_task, task)
+        future.add_done_callback(record)
+        return future
+
+    def failed(task: dict[str, Any], error: BaseException) -> dict[str, Any]:
+        logger.error(f"Task {task['task_id']} failed in its worker process: {error}")
+        result = _failed_result(task, error)
+        journal.record(result)
+        return result
+
+    retry: list[dict[str, Any]] = []
+    with new_pool(processes) as pool:
+        futures: dict[Future, dict[str, Any]] = {}
+
+        def dispatch(task: dict[str, Any]):
+            try:
+                futures[submit(pool, task)] = task
+            except BrokenProcessPool:
+                retry.append(task)
+
+        for task in tasks:
+            if task["task_id"] not in downloads:
+                dispatch(task)
+
+        by_download = {downloads[task["task_id"]]: task for task in tasks if task["task_id"] in downloads}
+        for download in as_completed(by_download):
+            task = by_download[download]
+            dispatch({**task, "file_name": _downloaded_path(task, download)})
+
+        with click.progressbar(as_completed(futures), length=len(futures), label="Answering") as bar:
+            for future in bar:
+                task = futures[future]
+                try:
+                    results[task["task_id"]] = future.result()
+                except BrokenProcessPool:
+                    retry.append(task)
+                except Exception as e:
+                    results[task["task_id"]] = failed(task, e)
+
+    if retry:
+        logger.warning(f"A worker process died, retrying {len(retry)} tasks one at a time")
+        pool = new_pool(1)
+        try:
+            for task in retry:
+                try:
+                    results[task["task_id"]] = submit(pool, task).result()
+                except BrokenProcessPool as e:
+                    results[task["task_id"]] = failed(task, e)
+                    pool.shutdown()
+                    pool = new_pool(1)
+                except Exception as e:
+                    results[task["task_id"]] = failed(task, e)
+        finally:
+            pool.shutdown()
+
+    return [results[task["task_id"]] for task in tasks]
+
+
+@click.group()
+@click.option("--verbose", "-v", is_flag=True, help="Enable debug logging.")
+def cli(verbose: bool):
+    """Headless tools for the_bot."""
+    logging.basicConfig(
+        level=logging.DEBUG if verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    load_env()
+
+
+@cli.command()
+@click.option("--input", "input_path", type=click.Path(exists=True, dir_okay=False),
+              help="JSONL file of tasks. Defaults to the questions of the scoring API.")
+@click.option("--api-url", default="https://agents-course-unit4-scoring.hf.space", show_default=True,
+              help="Scoring API used to fetch questions and attachments.")
+@click.option("--output", default="answers.jsonl", show_default=True,
+              help="JSONL journal where answers and timings are written.")
+@click.option("--processes", default=1, show_default=True,
+              help="Number of worker processes, each with its own agent.")
+@click.option("--threads", default=1, show_default=True,
+              help="Number of concurrent tasks when running in a single process.")
+@click.option("--resume", is_flag=True, help="Skip tasks already answered successfully in the output journal.")
+@click.option("--file-cache", default=".cache/gaia_files", show_default=True,
+              help="Directory where API attachments are cached.")
+@click.option("--score", is_flag=True, help="Score the answers against the local reference answers.")
+@click.option("--metrics-port", type=int,
+              help="Serve Prometheus metrics on this port while running (single-process mode only).")
+def run(
+    input_path: str | None,
+    api_url: str,
+    output: str,
+    processes: int,
+    threads: int,
+    resume: bool,
+    file_cache: str,
+    score: bool,
+    metrics_port: int | None,
+):
+    """Answer a question set and write the answers to a JSONL journal."""
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+
+    tasks = [task for task in load_tasks(input_path, api_url) if task.get("task_id") and task.get("question")]
+    journal = RunJournal(output)
+    done = journal.completed() if resume else {}
+    pending = [task for task in tasks if task["task_id"] not in done]
+    click.echo(f"{len(tasks)} tasks, {len(done)} already answered, {len(pending)} to run")
+
+    start = time.perf_counter()
+    answered: dict[str, dict[str, Any]] = {}
+    if pending:
+        # Attachments of local tasks are already on disk
+        cache = FileCache(GAIAApiClient(api_url), cache_dir=file_cache)
+        with cache:
+            downloads = cache.prefetch(pending) if input_path is None else {}
+
+            if processes > 1:
+                records = run_in_processes(pending, downloads, processes, journal)
+            else:
+                agent = get_agent()
+                with agent.session():
+                    # The retrieval query holds the attachment path, only known once downloaded
+                    agent.prefetch_similar([
+                        (task["question"], task.get("file_name", ""))
+                        for task in pending if task["task_id"] not in downloads
+                    ])
+
+                    def answer(question: str, file_name: str) -> str:
+                        return agent(question, file_name, raise_errors=True)
+
+                    def resolve_file(task: dict[str, Any]) -> str:
+                        return _downloaded_path(task, downloads.get(task["task_id"]))
+
+                    records = run_tasks(
+                        answer, pending, max_workers=threads, on_result=journal.record, resolve_file=resolve_file
+                    )
+        answered = {record["task_id"]: record for record in records}
+    elapsed = time.perf_counter() - start
+
+    records = [done.get(task["task_id"]) or answered[task["task_id"]] for task in tasks]
+    failed = sum(1 for record in records if record.get("status") != "ok")
+    click.echo(f"Answered {len(answered)} tasks in {elapsed:.1f}s, {failed} failed. Journal: {output}")
+
+    if score:
+        res = get_score({
+            "username": None,
+            "answers": [{"task_id": r["task_id"], "submitted_answer": r["answer"]} for r in records],
+        })
+        click.echo(
+            f"Score: {res.get('score')}%  "
+            f"Correct: {res.get('correct_count')}/{res.get('total_attempted')}"
+        )
+
+
+@cli.command("export-index")
+@click.option("--output", default=".cache/vector_index", show_default=True,
+              help="Directory where the local vector index is written.")
+@click.option("--table", default="documents", show_default=True, help="Supabase table to export.")
+@click.option("--embedding-model", default="sentence-transformers/all-mpnet-base-v2", show_default=True,
+              help="Embedding model the table was built with, recorded in the index manifest.")
+@click.option("--page-size", default=500, show_default=True, help="Rows fetched per request.")
+def export_index(output: str, table: str, embedding_model: str, page_size: int):
+    """Snapshot the Supabase vector table into a local index (see AGENT_VECTOR_INDEX)."""
+    from supabase.client import create_client
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
+    if not supabase_url or not supabase_service_key:
+        raise click.UsageError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+
+    count = export_supabase(
+        create_client(supabase_url, supabase_service_key),
+        output,
+        embedding_model=embedding_model,
+        table_name=table,
+        page_size=page_size,
+    )
+    click.echo(f"Exported {count} documents from '{table}' to {output}")
+
+
+@cli.command("ingest")
+@click.argument("input_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--target", type=click.Choice(["local", "supabase"]), default="local", show_default=True,
+              help="Write to the local vector index or to the Supabase table.")
+@click.option("--index-path", default=".cache/vector_index", show_default=True,
+              help="Local vector index directory, for --target local.")
+@click.option("--table", default="documents", show_default=True, help="Supabase table, for --target supabase.")
+@click.option("--batch-size", default=64, show_default=True, help="Documents embedded and written at a time.")
+@click.option("--embedding-model", default="sentence-transformers/all-mpnet-base-v2", show_default=True,
+              help="Embedding model, it must be the one the agent retrieves with.")
+def ingest_command(input_path: str, target: str, index_path: str, table: str, batch_size: int, embedding_model: str):
+    """Ingest Q&A records from a JSONL file into the documents the retriever searches."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+    cache_path = os.getenv("AGENT_EMBEDDING_CACHE", ".cache/embeddings.sqlite")
+    if cache_path:
+        embeddings = CachedEmbeddings(
+            embeddings, embedding_model, cache_path, max_entries=int(os.getenv("AGENT_EMBEDDING_CACHE_SIZE", "100000"))
+        )
+
+    if target == "local":
+        sink = LocalIndexSink(index_path, embedding_model=embedding_model)
+    else:
+        from supabase.client import create_client
+
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
+        if not supabase_url or not supabase_service_key:
+            raise click.UsageError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+        sink = SupabaseSink(create_client(supabase_url, supabase_service_key), table_name=table)
+
+    # The generation file tells the serving agents to drop their cached retrieval results
+    stats = ingest(iter_jsonl(input_path), embeddings, sink, batch_size=batch_size, generation_path=GENERATION_FILE)
+    click.echo(
+        f"Read {stats['read']} records: {stats['added']} added, "
+        f"{stats['duplicates']} already ingested or duplicated, {stats['invalid']} invalid"
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections.abc import Iterable, Iterator
+from typing import Any, Protocol
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from the_bot.agents.local_index import LocalVectorStore, iter_supabase_rows
+from the_bot.agents.retrieval_cache import invalidate_all
+
+logger = logging.getLogger(__name__)
+
+# Field names accepted for each part of a record, the GAIA metadata names first
+QUESTION_FIELDS = ("Question", "question")
+ANSWER_FIELDS = ("Final answer", "final_answer", "answer")
+SOURCE_FIELDS = ("task_id", "source", "id")
+
+
+def iter_jsonl(path: str) -> Iterator[dict[str, Any]]:
+    """Stream the records of a JSONL file, skipping lines that are not JSON objects."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"{path}:{number}: invalid JSON, skipped ({e})")
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def _first(record: dict[str, Any], fields: tuple[str, ...]) -> Any:
+    for field in fields:
+        if record.get(field) not in (None, ""):
+            return record[field]
+    return None
+
+
+def normalize_text(text: Any) -> str:
+    """Unicode NFC, Unix line endings, no trailing spaces and no surrounding blank lines."""
+    text = unicodedata.normalize("NFC", str(text)).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(re.sub(r"[ \t]+", " ", line).rstrip() for line in text.split("\n")).strip()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def document_hash(content: str, metadata: dict[str, Any] | None) -> str:
+    """Content hash of a stored document, computed for documents written without one."""
+    return (metadata or {}).get("content_hash") or content_hash(normalize_text(content))
+
+
+def normalize_record(record: dict[str, Any]) -> tuple[str, dict[str, Any]] | None:
+    """
+    Build the document of a Q&A record, in the format the retriever expects.
+
+    Returns:
+        (page content, metadata), or None if the record has no question or answer
+    """
+    question, answer = _first(record, QUESTION_FIELDS), _first(record, ANSWER_FIELDS)
+    if question is None or answer is None:
+        return None
+    content = f"Question : {normalize_text(question)}\n\nFinal answer : {normalize_text(answer)}"
+    metadata = {"content_hash": content_hash(content)}
+    source = _first(record, SOURCE_FIELDS)
+    if source is not None:
+        metadata["source"] = str(source)
+    return content, metadata
+
+
+class Sink(Protocol):
+    """Where ingested documents are written."""
+
+    def existing_hashes(self) -> set[str]:
+        ...
+
+    def write(self, texts: list[str], metadatas: list[dict[str, Any]], vectors: list[list[float]]):
+        ...
+
+    def close(self):
+        ...
+
+
+class LocalIndexSink:
+    """
+    Append documents to a local vector index (see `LocalVectorStore`).
+
+    Batches are kept apart and added to the index matrix together, at each
+    checkpoint and on close, instead of growing the matrix once per batch.
+    The index is saved every `checkpoint_every` documents, so a crash only
+    loses the documents written since the last checkpoint.
+
+    Args:
+        path: The index directory
+        embedding_model: Name of the embedding model, recorded in the manifest
+        checkpoint_every: Documents written between two saves of the index
+    """
+
+    def __init__(self, path: str, embedding_model: str = "", checkpoint_every: int = 10_000):
+        self.path = path
+        self.embedding_model = embedding_model
+        self.checkpoint_every = checkpoint_every
+        try:
+            self.store = LocalVectorStore.load(path, None)
+        except FileNotFoundError:
+            self.store = LocalVectorStore(None)
+        self.added = 0
+        self._pending: list[tuple[list[list[float]], list[str], list[dict[str, Any]]]] = []
+        self._pending_count = 0
+
+    def existing_hashes(self) -> set[str]:
+        return {document_hash(doc.page_content, doc.metadata) for doc in self.store.documents}
+
+    def write(self, texts: list[str], metadatas: list[dict[str, Any]], vectors: list[list[float]]):
+        self._pending.append((vectors, texts, metadatas))
+        self._pending_count += len(texts)
+        self.added += len(texts)
+        if self._pending_count >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _add_pending(self):
+        if not self._pending:
+            return
+        vectors = np.concatenate([np.asarray(v, dtype=np.float32) for v, _, _ in self._pending])
+        texts = [t for _, batch, _ in self._pending for t in batch]
+        metadatas = [m for _, _, batch in self._pending for m in batch]
+        self.store.add_vectors(vectors, texts, metadatas, [m["content_hash"] for m in metadatas])
+        self._pending, self._pending_count = [], 0
+
+    def checkpoint(self):
+        """Add the pending batches to the index and save it."""
+        self._add_pending()
+        self.store.save(self.path, embedding_model=self.embedding_model)
+
+    def close(self):
+        if self.added or not os.path.exists(self.path):
+            self.checkpoint()
+
+
+class SupabaseSink:
+    """
+    Upsert documents in a Supabase vector table, one request per batch.
+
+    Rows are upserted on their content, which needs a unique constraint on
+    the content column:
+
+        alter table documents add constraint documents_content_key unique (content);
+
+    A document already in the table is then left unchanged, even one written
+    by another run since the existing hashes were read.
+    """
+
+    def __init__(self, client, table_name: str = "documents"):
+        self.client = client
+        self.table_name = table_name
+
+    def existing_hashes(self) -> set[str]:
+        # Rows loaded by hand have no content hash in their metadata, their content is hashed
+        rows = iter_supabase_rows(self.client, self.table_name, columns="id, content, metadata")
+        return {document_hash(row.get("content") or "", row.get("metadata")) for row in rows}
+
+    def write(self, texts: list[str], metadatas: list[dict[str, Any]], vectors: list[list[float]]):
+        rows = [
+            {"content": text, "metadata": metadata, "embedding": vector}
+            for text, metadata, vector in zip(texts, metadatas, vectors, strict=True)
+        ]
+        self.client.table(self.table_name).upsert(rows, on_conflict="content", ignore_duplicates=True).execute()
+
+    def close(self):
+        pass
+
+
+def ingest(
+    records: Iterable[dict[str, Any]],
+    embeddings: Embeddings,
+    sink: Sink,
+    batch_size: int = 64,
+    generation_path: str | None = None,
+) -> dict[str, int]:
+    """
+    Normalize, deduplicate, embed and write Q&A records.
+
+    Records are streamed: they are embedded and written a batch at a time.
+    Records whose content is already in the sink, or earlier in the stream,
+    are skipped, so re-ingesting a file only adds its new records.
+
+    Args:
+        records: Q&A records, e.g. from `iter_jsonl`
+        embeddings: Embeds the documents
+        sink: Where documents are written, closed at the end
+        batch_size: Documents embedded and written at a time
+        generation_path: Generation file touched after writing, so the agents of other processes
+            drop their cached retrieval results (see `RetrievalCache`) and reload their local and BM25 indexes
+
+    Returns:
+        Counts of read, invalid, duplicate and added records
+    """
+    seen = sink.existing_hashes()
+    logger.info(f"{len(seen)} documents already ingested")
+    stats = {"read": 0, "invalid": 0, "duplicates": 0, "added": 0}
+    texts: list[str] = []
+    metadatas: list[dict[str, Any]] = []
+
+    def flush():
+        nonlocal texts, metadatas
+        sink.write(texts, metadatas, embeddings.embed_documents(texts))
+        stats["added"] += len(texts)
+        logger.info(f"Ingested {stats['added']} documents")
+        texts, metadatas = [], []
+
+    try:
+        for record in records:
+            stats["read"] += 1
+            document = normalize_record(record)
+            if document is None:
+                stats["invalid"] += 1
+                continue
+            content, metadata = document
+            if metadata["content_hash"] in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(metadata["content_hash"])
+            texts.append(content)
+            metadatas.append(metadata)
+            if len(texts) >= batch_size:
+                flush()
+        if texts:
+            flush()
+    finally:
+        # Keep what was written before a failure
+        sink.close()
+        if stats["added"]:
+            invalidate_all(generation_path)
+    return stats
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of task results.
+
+    Each finished task is written as one line and flushed to disk right away,
+    so a crashed run can be resumed without answering the same tasks again.
+    When a task appears several times, the last record wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tail_checked = False
+
+    def _torn_tail(self) -> bool:
+        """Whether the journal ends with a partial line, left by a crash while writing."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+    def record(self, result: dict[str, Any]):
+        """
+        Append a task result to the journal.
+
+        Args:
+            result: Result record, as returned by `the_bot.runner.run_task`
+        """
+        line = json.dumps({**result, "ts": time.time()}, ensure_ascii=False)
+        with self._lock:
+            if not self._tail_checked:
+                # End a torn last line, otherwise the record would be appended to it and lost on load
+                if self._torn_tail():
+                    line = "\n" + line
+                self._tail_checked = True
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load(self) -> dict[str, dict[str, Any]]:
+        """
+        Read the journal back.
+
+        Returns:
+            The last record of each task, keyed by task id
+        """
+        records: dict[str, dict[str, Any]] = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash while writing can leave a partial last line
+                    logger.warning(f"Skipping corrupt journal line {lineno} in {self.path}")
+                    continue
+                if record.get("task_id"):
+                    records[record["task_id"]] = record
+        return records
+
+    def completed(self) -> dict[str, dict[str, Any]]:
+        """
+        Returns:
+            The last record of each successfully answered task, keyed by task id
+        """
+        return {tid: record for tid, record in self.load().items() if record.get("status") == "ok"}
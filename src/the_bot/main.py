@@ -1,13 +1,19 @@
 import json
 import logging
 import os
+import threading
 
 import gradio as gr
 import requests
 import pandas as pd
 
-from the_bot.agents.core import Agent
+from the_bot.agents.metrics import start_metrics_server
 from the_bot.agents.utils import get_score
+from the_bot.agents.wrapper import get_agent, reload_agent
+from the_bot.api.client import GAIAApiClient
+from the_bot.api.file_cache import FileCache
+from the_bot.journal import RunJournal
+from the_bot.runner import run_tasks
 
 DEFAULT_API_URL = "https://agents-course-unit4-scoring.hf.space"
 
@@ -25,94 +31,6 @@ fh = logging.FileHandler("main.log")
 fh.setFormatter(fmt)
 logger.addHandler(fh)
 
-def debug_environment():
-    """Print which API vars are set (values redacted)."""
-    for var in [
-        "HF_TOKEN", "HUGGINGFACEHUB_API_TOKEN",
-        "OPENAI_API_KEY", "XAI_API_KEY",
-        "AGENT_MODEL_TYPE", "AGENT_MODEL_ID",
-        "AGENT_TEMPERATURE", "AGENT_VERBOSE",
-        "DASHSCOPE_API_KEY", "GEMINI_API_KEY",
-        "SUPABASE_URL", "SUPABASE_SERVICE_KEY"
-    ]:
-        status = "[SET]" if os.getenv(var) else "[NOT SET]"
-        print(f"{var}: {status}")
-
-class AgentWrapper:
-    def __init__(self):
-        # Load .env if available
-        try:
-            import dotenv
-            dotenv.load_dotenv()
-            print("Loaded .env")
-        except ImportError:
-            pass
-
-        debug_environment()
-
-        # Gather config from env
-        hf_token = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACEHUB_API_TOKEN")
-        openai_key = os.getenv("OPENAI_API_KEY")
-        xai_key = os.getenv("XAI_API_KEY")
-        dashscope_key = os.getenv("DASHSCOPE_API_KEY")
-        gemini_key = os.getenv("GEMINI_API_KEY")
-        model_type = os.getenv("AGENT_MODEL_TYPE", "HfApiModel")
-        # model_id = os.getenv("AGENT_MODEL_ID", "gpt-4o")
-        temperature = float(os.getenv("AGENT_TEMPERATURE", "0.2"))
-        verbose = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
-        system_prompt=os.getenv("SYSTEM_PROMPT")
-
-        # Decide which credentials to use
-        agent_kwargs = {
-            "model_type": model_type,
-            "temperature": temperature,
-            "executor_type": "local",
-            "verbose": verbose,
-            "tool_modules": ["the_bot.agents.tools"],
-            "system_prompt": system_prompt,
-            "supabase_url": supabase_url,
-            "supabase_service_key": supabase_service_key
-        }
-        if model_type == "groq":
-            # OpenAI | xai | dashscope
-            if dashscope_key:
-                agent_kwargs["api_key"] = dashscope_key
-                agent_kwargs["api_base"] = os.getenv("DASHSCOPE_API_BASE", "https://dashscope-intl.aliyuncs.com/compatible-mode/v1")
-                agent_kwargs["model_id"] = os.getenv("AGENT_MODEL_ID")
-            elif xai_key:
-                agent_kwargs["api_key"] = xai_key
-                agent_kwargs["api_base"] = os.getenv("XAI_API_BASE", "https://api.x.ai/v1")
-            elif openai_key:
-                agent_kwargs["api_key"] = openai_key
-                agent_kwargs["api_base"] = os.getenv("AGENT_API_BASE", None)
-            else:
-                raise RuntimeError("No API credentials found for OpenAI")
-        elif gemini_key and model_type == "google":
-            agent_kwargs["api_key"] = gemini_key
-            agent_kwargs["model_id"] = os.getenv("AGENT_MODEL_ID", "gemini-2.5-flash-preview-04-17")
-        elif hf_token and model_type == "HfApiModel":
-            agent_kwargs["api_key"] = hf_token
-            agent_kwargs["model_id"] = os.getenv("AGENT_MODEL_ID", "meta-llama/Llama-3.3-70B-Instruct")
-        else:
-            raise RuntimeError("No API credentials found for Hugging Face or OpenAI compatible services")
-
-        # Instantiate
-        logger.info(f"Initializing Agent with: {agent_kwargs}")
-        self.agent = Agent(**agent_kwargs)
-        logger.info(f"Initialized Agent: {agent_kwargs}")
-        print(f"Initialized Agent: {agent_kwargs}")
-
-    def __call__(self, question: str, file_name: str) -> str:
-        if not question.strip():
-            return "Please provide a question."
-        try:
-            return self.agent.answer_question(question, file_name)
-        except Exception as e:
-            logger.debug("Error in agent:", e)
-            return "Agent error—see logs."
-
 def run_and_submit_all(profile: gr.OAuthProfile | None):
     # Authentication check
     username = None
@@ -128,36 +46,71 @@ def run_and_submit_all(profile: gr.OAuthProfile | None):
     except Exception as e:
         return f"Failed to fetch tasks: {e}", None
 
-    # fetch files attached to tasks
-    for task in tasks:
-        if task["file_name"]:
-            resp = requests.get(f"{DEFAULT_API_URL}/files/{task['task_id']}")
-            if resp.status_code == 200:
-                with open(f"{task['file_name']}", "wb") as f:
-                    f.write(resp.content)
-            else:
-                logger.info(f"Failed to retrieve the file. Status code: {resp.status_code}")
-
-    # Instantiate agent once
-    try:
-        agent = AgentWrapper()
-    except Exception as e:
-        return f"Agent initialization failed: {e}", None
-
-    logger.debug("Agent initialized.")
+    # Answers already in the journal are reused when resuming a run
+    journal = RunJournal(os.getenv("AGENT_JOURNAL", "run_journal.jsonl"))
+    done = journal.completed() if os.getenv("AGENT_RESUME", "false").lower() == "true" else {}
+    pending = [task for task in tasks if task.get("task_id") not in done]
+    logger.info(f"{len(done)} tasks already answered in {journal.path}, {len(pending)} to run")
+
+    answered = {}
+    if pending:
+        # fetch files attached to tasks in the background, while the agent starts
+        file_cache = FileCache(
+            GAIAApiClient(DEFAULT_API_URL),
+            cache_dir=os.getenv("AGENT_FILE_CACHE", ".cache/gaia_files"),
+            max_workers=int(os.getenv("AGENT_PREFETCH_WORKERS", "4")),
+        )
+        with file_cache:
+            downloads = file_cache.prefetch(pending)
+
+            def resolve_file(task: dict) -> str:
+                download = downloads.get(task["task_id"])
+                if download is None:
+                    return task.get("file_name", "")
+                try:
+                    return download.result()
+                except Exception as e:
+                    logger.info(f"Failed to retrieve the file for task {task['task_id']}: {e}")
+                    return task.get("file_name", "")
+
+            # Reuse the warm agent, built at startup or on first use
+            try:
+                agent = get_agent()
+            except Exception as e:
+                return f"Agent initialization failed: {e}", None
+
+            logger.debug("Agent initialized.")
+
+            # A reload during the run closes this agent only once the run is over
+            with agent.session():
+                # The retrieval query holds the attachment path, only known once downloaded
+                agent.prefetch_similar([
+                    (task["question"], task.get("file_name", ""))
+                    for task in pending if task["task_id"] not in downloads
+                ])
+
+                def answer(question: str, file_name: str) -> str:
+                    return agent(question, file_name, raise_errors=True)
+
+                max_workers = int(os.getenv("AGENT_MAX_WORKERS", "1"))
+                answered = {
+                    record["task_id"]: record
+                    for record in run_tasks(
+                        answer, pending, max_workers=max_workers, on_result=journal.record, resolve_file=resolve_file
+                    )
+                }
+
+    records = [
+        done.get(task.get("task_id")) or answered[task.get("task_id")]
+        for task in tasks
+        if task.get("task_id") in done or task.get("task_id") in answered
+    ]
 
     results = []
     payload = []
-    for task in tasks:
-        tid = task.get("task_id")
-        logger.debug(f"Task ID: {tid}")
-        q = task.get("question", "")
-        logger.debug(f"Question: {q}")
-        file_name = task.get("file_name", "")
-        if not tid or not q:
-            continue
-        ans = agent(q, file_name)
-        logger.debug(f"Answer: {ans}")
+    for record in records:
+        tid, q, ans = record["task_id"], record["question"], record["answer"]
+        logger.debug(f"Task ID: {tid} ({record['status']}, {record['elapsed']:.2f}s) Answer: {ans}")
         payload.append({"task_id": tid, "submitted_answer": ans})
         results.append({"task_id": tid, "question": q, "answer": ans})
 
@@ -192,6 +145,22 @@ def run_and_submit_all(profile: gr.OAuthProfile | None):
     else:
         return "Please log in to submit.", pd.DataFrame(results), status_txt
 
+def reload_agent_config():
+    """Rebuild the warm agent after a configuration change."""
+    try:
+        agent = reload_agent()
+    except Exception as e:
+        return f"Agent reload failed: {e}"
+    return f"Agent reloaded: {agent.agent_kwargs.get('model_type')} {agent.agent_kwargs.get('model_id', '')}"
+
+def warm_up_agent():
+    """Build the warm agent ahead of the first evaluation run."""
+    try:
+        get_agent()
+        logger.info("Agent warmed up.")
+    except Exception as e:
+        logger.info(f"Agent warm-up failed, it will be retried on first use: {e}")
+
 # --- Gradio UI ---
 
 with gr.Blocks() as demo:
@@ -200,11 +169,13 @@ with gr.Blocks() as demo:
 
     gr.LoginButton()
     run_btn = gr.Button("Run Evaluation & Submit All Answers")
+    reload_btn = gr.Button("Reload Agent Configuration")
     status_out = gr.Textbox(label="Status", interactive=False)
     results_tbl = gr.DataFrame(label="Results")
     status_txt = gr.Textbox(label="Local Evaluation", interactive=False)
 
     run_btn.click(fn=run_and_submit_all, outputs=[status_out, results_tbl, status_txt])
+    reload_btn.click(fn=reload_agent_config, outputs=[status_out])
 
 if __name__ == "__main__":
     logger.info("Launching Agent Gradio app…")
@@ -227,4 +198,13 @@ if __name__ == "__main__":
         print("ℹ️  SPACE_ID environment variable not found (running locally?). Repo URL cannot be determined.")
 
     print("-"*(60 + len(" App Starting ")) + "\n")
+
+    # Prometheus metrics of the graph nodes, tools and tokens
+    if os.getenv("AGENT_METRICS_PORT"):
+        start_metrics_server(int(os.getenv("AGENT_METRICS_PORT")))
+
+    # Build the agent in the background so the UI is up while models load
+    if os.getenv("AGENT_PRELOAD", "true").lower() == "true":
+        threading.Thread(target=warm_up_agent, name="agent-warm-up", daemon=True).start()
+
     demo.launch(server_name="0.0.0.0", debug=True, share=False)
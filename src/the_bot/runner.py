@@ -0,0 +1,96 @@
+import logging
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# An answer function takes (question, file_name) and returns the answer text
+AnswerFn = Callable[[str, str], str]
+# A result callback receives each result record as soon as its task finishes
+ResultFn = Callable[[dict[str, Any]], None]
+# A file resolver maps a task to the local path of its attachment
+FileFn = Callable[[dict[str, Any]], str]
+
+
+def run_task(answer_fn: AnswerFn, task: dict[str, Any], resolve_file: FileFn | None = None) -> dict[str, Any]:
+    """
+    Answer a single task, never raising.
+
+    Args:
+        answer_fn: Callable answering a (question, file_name) pair
+        task: Task as returned by the scoring API
+        resolve_file: Optional callable returning the local path of the task attachment
+
+    Returns:
+        A result record with the task id, question, answer, status and elapsed time
+    """
+    tid = task.get("task_id")
+    question = task.get("question", "")
+    file_name = task.get("file_name", "")
+
+    start = time.perf_counter()
+    try:
+        if resolve_file is not None:
+            file_name = resolve_file(task)
+        answer = answer_fn(question, file_name)
+        status = "ok"
+    except Exception as e:
+        logger.exception(f"Task {tid} failed")
+        answer = f"Agent error: {e}"
+        status = "error"
+    elapsed = time.perf_counter() - start
+    logger.debug(f"Task {tid} answered in {elapsed:.2f}s: {answer}")
+
+    return {
+        "task_id": tid,
+        "question": question,
+        "answer": answer,
+        "status": status,
+        "elapsed": elapsed,
+    }
+
+
+def run_tasks(
+    answer_fn: AnswerFn,
+    tasks: Iterable[dict[str, Any]],
+    max_workers: int = 1,
+    on_result: ResultFn | None = None,
+    resolve_file: FileFn | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Answer a list of tasks, optionally with a bounded pool of worker threads.
+
+    Tasks without a task id or a question are skipped. A failure in one task
+    is recorded in its result and does not affect the other tasks.
+
+    Args:
+        answer_fn: Callable answering a (question, file_name) pair
+        tasks: Tasks as returned by the scoring API
+        max_workers: Number of tasks answered concurrently, 1 runs them sequentially
+        on_result: Optional callback invoked with each result as soon as its task finishes
+        resolve_file: Optional callable returning the local path of a task attachment,
+            called from the worker so that waiting for a download only delays its own task
+
+    Returns:
+        One result record per valid task, in task order
+    """
+    valid = [task for task in tasks if task.get("task_id") and task.get("question")]
+
+    def run_one(task: dict[str, Any]) -> dict[str, Any]:
+        result = run_task(answer_fn, task, resolve_file)
+        if on_result is not None:
+            try:
+                on_result(result)
+            except Exception:
+                logger.exception(f"Result callback failed for task {result['task_id']}")
+        return result
+
+    if max_workers <= 1 or len(valid) <= 1:
+        return [run_one(task) for task in valid]
+
+    logger.info(f"Running {len(valid)} tasks with {max_workers} workers")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task") as pool:
+        futures = [pool.submit(run_one, task) for task in valid]
+        return [future.result() for future in futures]
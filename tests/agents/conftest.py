@@ -0,0 +1,40 @@
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from the_bot.agents.core import Agent
+from the_bot.agents.rate_limit import RATE_LIMITERS
+from the_bot.agents.resources import REGISTRY
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Do not share embedders, vector stores or rate limiters between tests."""
+    yield
+    REGISTRY.clear()
+    RATE_LIMITERS.clear()
+
+
+@pytest.fixture
+def make_agent():
+    """
+    Build a real Agent graph against a scripted chat model and an in-memory vector store.
+
+    `respond` receives the message list sent to the model and returns the AIMessage to answer with,
+    `tools` are bound to the model and run by the graph's ToolNode.
+    """
+    def factory(respond, tools=(), documents=(), vector_store=None, **kwargs):
+        store = vector_store or InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+        if documents:
+            store.add_texts(list(documents))
+
+        llm = MagicMock()
+        llm.bind_tools.return_value = RunnableLambda(respond)
+
+        kwargs.setdefault("system_prompt", "You are a test assistant.")
+        return Agent(model_type="groq", llm=llm, vector_store=store, tools=list(tools), **kwargs)
+
+    return factory
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from the_bot.agents.cassette import Cassette, CassetteMissError
+from the_bot.agents.tools.math import add, divide
+
+
+def test_invalid_mode(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "c.jsonl"), mode="live")
+
+
+def test_replay_requires_cassette(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Cassette(str(tmp_path / "missing.jsonl"))
+
+
+def test_llm_record_then_replay(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    calls = []
+
+    def live(messages):
+        calls.append(messages)
+        return AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": "call-1"}])
+
+    recorder = Cassette(path, mode="record").wrap_llm(RunnableLambda(live))
+    recorded = recorder.invoke([HumanMessage(content="1 + 2?", id="run-1")])
+
+    player = Cassette(path).wrap_llm(RunnableLambda(lambda m: pytest.fail("live call in replay")))
+    # Message ids differ between runs and must not affect the lookup
+    replayed = player.invoke([HumanMessage(content="1 + 2?", id="run-2")])
+
+    assert len(calls) == 1
+    assert isinstance(replayed, AIMessage)
+    assert replayed.tool_calls == recorded.tool_calls
+
+
+def test_replay_miss(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    Cassette(path, mode="record").wrap_llm(RunnableLambda(lambda m: AIMessage(content="a"))).invoke(
+        [HumanMessage(content="known")]
+    )
+    player = Cassette(path).wrap_llm(RunnableLambda(lambda m: AIMessage(content="live")))
+    with pytest.raises(CassetteMissError):
+        player.invoke([HumanMessage(content="unknown")])
+
+
+def test_identical_requests_replay_in_order(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    answers = iter(["first", "second"])
+    recorder = Cassette(path, mode="record").wrap_llm(RunnableLambda(lambda m: AIMessage(content=next(answers))))
+    question = [HumanMessage(content="same")]
+    recorder.invoke(question)
+    recorder.invoke(question)
+
+    player = Cassette(path).wrap_llm(RunnableLambda(lambda m: None))
+    assert [player.invoke(question).content for _ in range(3)] == ["first", "second", "second"]
+
+
+def test_tool_record_then_replay(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    recorded_add = Cassette(path, mode="record").wrap_tool(add)
+    assert recorded_add.name == "add"
+    assert recorded_add.invoke({"a": 2, "b": 3}) == 5
+
+    replayed_add = Cassette(path).wrap_tool(add)
+    assert replayed_add.args == add.args
+    message = replayed_add.invoke({"type": "tool_call", "name": "add", "args": {"a": 2, "b": 3}, "id": "c1"})
+    assert isinstance(message, ToolMessage)
+    assert message.content == "5"
+
+
+def test_tool_errors_are_replayed(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    with pytest.raises(ValueError):
+        Cassette(path, mode="record").wrap_tool(divide).invoke({"a": 1, "b": 0})
+    with pytest.raises(RuntimeError, match="Cannot divide by zero"):
+        Cassette(path).wrap_tool(divide).invoke({"a": 1, "b": 0})
+
+
+@pytest.mark.asyncio
+async def test_async_replay_with_simulated_latency(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    await Cassette(path, mode="record").wrap_llm(RunnableLambda(lambda m: AIMessage(content="a"))).ainvoke(
+        [HumanMessage(content="q")]
+    )
+    player = Cassette(path, latency=0.05).wrap_llm(RunnableLambda(lambda m: None))
+    start = time.perf_counter()
+    assert (await player.ainvoke([HumanMessage(content="q")])).content == "a"
+    assert time.perf_counter() - start >= 0.05
+
+
+def test_agent_replays_offline(make_agent, tmp_path):
+    path = str(tmp_path / "run.jsonl")
+
+    def respond(messages):
+        if not any(isinstance(m, ToolMessage) for m in messages):
+            return AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 20, "b": 22}, "id": "call-1"}])
+        return AIMessage(content=f"Answer: {messages[-1].content}")
+
+    recorder = make_agent(respond, tools=[add], cassette_path=path, cassette_mode="record")
+    assert recorder.answer_question("What is 20 + 22?") == "42"
+
+    def offline(messages):
+        raise AssertionError("provider called in replay mode")
+
+    player = make_agent(offline, tools=[add], cassette_path=path, cassette_mode="replay")
+    assert player.answer_question("What is 20 + 22?", raise_errors=True) == "42"
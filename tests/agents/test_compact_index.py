@@ -0,0 +1,126 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from the_bot.agents import core
+from the_bot.agents.compact_index import CompactVectorStore
+from the_bot.agents.local_index import LocalVectorStore
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 64)).astype(np.float32)
+    texts = [f"Question : reference {i}\n\nFinal answer : {i}" for i in range(len(vectors))]
+    store = LocalVectorStore(DeterministicFakeEmbedding(size=64))
+    ids = [str(i) for i in range(len(texts))]
+    store.add_vectors(vectors, texts, [{"source": i} for i in ids], ids)
+    queries = rng.normal(size=(20, 64)).astype(np.float32)
+    return store, queries
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_top_k_matches_float32(corpus, dtype):
+    store, queries = corpus
+    compact = CompactVectorStore.from_store(store, dtype=dtype)
+
+    assert compact.similarity_search_by_vectors(queries, k=5) == store.similarity_search_by_vectors(queries, k=5)
+
+
+def test_int8_without_rescoring_is_close(corpus):
+    store, queries = corpus
+    compact = CompactVectorStore.from_store(store, dtype="int8", rescore=0)
+
+    recall = np.mean([
+        len({d.page_content for d in approx} & {d.page_content for d in exact}) / 10
+        for approx, exact in zip(
+            compact.similarity_search_by_vectors(queries, k=10),
+            store.similarity_search_by_vectors(queries, k=10),
+            strict=True,
+        )
+    ])
+    assert recall >= 0.9
+
+
+def test_memory_is_smaller(corpus):
+    store, _ = corpus
+    assert CompactVectorStore.from_store(store, dtype="int8").codes.nbytes * 4 == store.vectors.nbytes
+    assert CompactVectorStore.from_store(store, dtype="float16").codes.nbytes * 2 == store.vectors.nbytes
+
+
+def test_documents_are_rebuilt_from_columns():
+    store = CompactVectorStore.from_texts(
+        ["first", "second", "third"],
+        DeterministicFakeEmbedding(size=16),
+        metadatas=[{"source": "a"}, {}, {"source": "c", "level": 2}],
+    )
+    store.add_texts(["fourth ünïcode"], [{"level": 3}])
+
+    assert [doc.page_content for doc in store.iter_documents()] == ["first", "second", "third", "fourth ünïcode"]
+    assert [doc.metadata for doc in store.iter_documents()] == [
+        {"source": "a"}, {}, {"source": "c", "level": 2}, {"level": 3},
+    ]
+    assert store.similarity_search("fourth ünïcode", k=1)[0].metadata == {"level": 3}
+
+
+def test_load_rescores_from_the_memory_mapped_index(tmp_path, corpus):
+    store, queries = corpus
+    store.save(str(tmp_path / "index"))
+
+    compact = CompactVectorStore.load(str(tmp_path / "index"), store.embedding, dtype="int8")
+
+    assert isinstance(compact.full, np.memmap)
+    expected = store.similarity_search_by_vectors(queries[:3], k=3)
+    assert compact.similarity_search_by_vectors(queries[:3], k=3) == expected
+
+
+def test_load_does_not_build_documents(tmp_path, corpus, monkeypatch):
+    store, queries = corpus
+    store.save(str(tmp_path / "index"))
+    monkeypatch.setattr(LocalVectorStore, "load", MagicMock(side_effect=AssertionError("float32 store loaded")))
+
+    compact = CompactVectorStore.load(str(tmp_path / "index"), store.embedding, dtype="float16")
+
+    assert len(compact) == len(store)
+    assert compact.document(1999) == store.documents[1999]
+
+
+def test_batches_are_appended_once_before_a_read(corpus):
+    store, queries = corpus
+    compact = CompactVectorStore(store.embedding, dtype="int8")
+    for start in range(0, len(store), 100):
+        end = start + 100
+        compact.add_vectors(
+            store.vectors[start:end],
+            [doc.page_content for doc in store.documents[start:end]],
+            [doc.metadata for doc in store.documents[start:end]],
+            store.ids[start:end],
+        )
+
+    assert len(compact._pending) == 20
+    assert compact.similarity_search_by_vectors(queries, k=5) == store.similarity_search_by_vectors(queries, k=5)
+    assert compact._pending == []
+    assert len(compact.codes) == len(compact.full) == len(store)
+
+
+def test_invalid_dtype():
+    with pytest.raises(ValueError):
+        CompactVectorStore(None, dtype="int4")
+
+
+def test_agent_loads_a_quantized_index(tmp_path, monkeypatch):
+    embedding = DeterministicFakeEmbedding(size=16)
+    LocalVectorStore.from_texts(["Question : 1 + 1?\n\nFinal answer : 2"], embedding).save(str(tmp_path / "index"))
+    monkeypatch.setattr(core, "HuggingFaceEmbeddings", lambda model_name: embedding)
+    llm = MagicMock()
+    llm.bind_tools.return_value = core.RunnableLambda(lambda messages: AIMessage(content="2"))
+
+    agent = core.Agent(
+        llm=llm, vector_index_path=str(tmp_path / "index"), vector_index_dtype="int8", tools=[], system_prompt="."
+    )
+
+    assert isinstance(agent.vector_store, CompactVectorStore)
+    assert agent.answer_question("1 + 1?") == "2"
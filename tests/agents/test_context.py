@@ -0,0 +1,89 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import tool
+
+from the_bot.agents.context import ContextManager, read_tool_output, token_counter
+
+PAGE = "Mercedes Sosa discography. " * 400
+
+
+def tool_round(call_id: str, output: str) -> list:
+    return [
+        AIMessage(content="", tool_calls=[{"name": "wiki_search", "args": {"query": call_id}, "id": call_id}]),
+        ToolMessage(content=output, tool_call_id=call_id),
+    ]
+
+
+def conversation(rounds: int) -> list:
+    messages = [SystemMessage(content="You are a test assistant."), HumanMessage(content="How many albums?")]
+    for i in range(rounds):
+        messages += tool_round(f"call-{i}", PAGE)
+    return messages
+
+
+def test_token_counter_depends_on_the_provider():
+    assert token_counter("google")("a" * 400) == 100
+    assert token_counter("groq")("a" * 350) == 100
+
+
+def test_messages_within_budget_are_unchanged():
+    context = ContextManager(100_000, token_counter("groq"))
+    messages = conversation(3)
+
+    assert context.fit(messages) == messages
+
+
+def test_old_tool_outputs_are_shortened_first():
+    context = ContextManager(4000, token_counter("groq"), keep_turns=1)
+    messages = conversation(3)
+
+    fitted = context.fit(messages)
+
+    assert context.size(fitted) <= 4000
+    assert fitted[-1].content == PAGE
+    assert "read_tool_output" in fitted[3].content and "'tool-output:call-0'" in fitted[3].content
+    assert len(fitted[3].content) < 1000
+    assert fitted[3].tool_call_id == "call-0"
+    # The graph state is left as is
+    assert messages[3].content == PAGE
+
+
+def test_recent_turns_are_kept_over_budget():
+    context = ContextManager(100, token_counter("groq"), keep_turns=2)
+    messages = conversation(2)
+
+    assert context.fit(messages) == messages
+
+
+def test_read_tool_output():
+    state = {"messages": conversation(1)}
+    text = read_tool_output.func("tool-output:call-0", offset=27, length=27, state=state)
+
+    assert text.endswith("\nMercedes Sosa discography. ")
+    assert text.startswith(f"[characters 27 to 54 of {len(PAGE)}]")
+    assert read_tool_output.func("tool-output:missing", state=state).startswith("Error")
+
+
+@tool
+def wiki_search(query: str) -> str:
+    """Search Wikipedia."""
+    return PAGE
+
+
+def test_agent_reads_back_a_shortened_output(make_agent):
+    sizes = []
+
+    def respond(messages):
+        sizes.append(sum(len(str(m.content)) for m in messages))
+        done = [m for m in messages if isinstance(m, ToolMessage)]
+        if len(done) < 3:
+            call = {"name": "wiki_search", "args": {"query": str(len(done))}, "id": f"call-{len(done)}"}
+            return AIMessage(content="", tool_calls=[call])
+        if done[-1].name != "read_tool_output":
+            call = {"name": "read_tool_output", "args": {"handle": "tool-output:call-0", "length": 13}, "id": "read"}
+            return AIMessage(content="", tool_calls=[call])
+        return AIMessage(content=done[-1].content.splitlines()[-1])
+
+    agent = make_agent(respond, tools=[wiki_search], context_budget=5000, context_keep_turns=1)
+
+    assert agent.answer_question("How many albums?") == "Mercedes Sosa"
+    assert max(sizes) < 3 * len(PAGE)
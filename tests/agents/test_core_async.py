@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from the_bot.agents.tools.math import add
+
+
+def answer_from_question(messages):
+    question = next(m for m in messages if isinstance(m, HumanMessage)).content
+    return AIMessage(content=f"Answer: {question.split()[0]}")
+
+
+@pytest.mark.asyncio
+async def test_aanswer_question(make_agent):
+    agent = make_agent(answer_from_question, documents=["Question : x\n\nFinal answer : y"])
+    assert await agent.aanswer_question("Paris is the capital of?") == "Paris"
+
+
+@pytest.mark.asyncio
+async def test_aanswer_question_matches_sync(make_agent):
+    agent = make_agent(answer_from_question)
+    question = "Rome is the capital of?"
+    assert await agent.aanswer_question(question) == agent.answer_question(question)
+
+
+@pytest.mark.asyncio
+async def test_aanswer_question_with_tools(make_agent):
+    def respond(messages):
+        tool_results = [m for m in messages if isinstance(m, ToolMessage)]
+        if not tool_results:
+            return AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 2, "b": 3}, "id": "call-1"}])
+        return AIMessage(content=f"Final answer: {tool_results[-1].content}")
+
+    agent = make_agent(respond, tools=[add])
+    assert await agent.aanswer_question("What is 2 + 3?") == "5"
+
+
+@pytest.mark.asyncio
+async def test_aanswer_question_errors(make_agent):
+    def respond(messages):
+        raise RuntimeError("provider down")
+
+    agent = make_agent(respond)
+    assert "provider down" in await agent.aanswer_question("Anything?")
+    with pytest.raises(RuntimeError):
+        await agent.aanswer_question("Anything?", raise_errors=True)
+
+
+@pytest.mark.asyncio
+async def test_aanswer_questions_is_concurrent_and_ordered(make_agent):
+    in_flight = 0
+    peak = 0
+
+    async def respond(messages):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return answer_from_question(messages)
+
+    agent = make_agent(answer_from_question)
+    agent.llm_with_tools = RunnableLambda(answer_from_question, afunc=respond)
+
+    questions = [(f"Q{i} question", None) for i in range(8)]
+    answers = await agent.aanswer_questions(questions, max_concurrency=4)
+
+    assert answers == [f"Q{i}" for i in range(8)]
+    assert peak == 4
@@ -0,0 +1,88 @@
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.messages import AIMessage
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from the_bot.agents.local_index import LocalVectorStore
+from the_bot.agents.retrieval_cache import invalidate_all
+
+REFERENCES = [
+    "Question : What is the capital of France?\n\nFinal answer : Paris",
+    "Question : Who wrote Hamlet?\n\nFinal answer : Shakespeare",
+]
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.fake = DeterministicFakeEmbedding(size=16)
+        self.batches: list[list[str]] = []
+        self.queries: list[str] = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self.fake.embed_query(text)
+
+
+def answer_with_reference(messages):
+    return AIMessage(content="ok")
+
+
+def test_prefetch_embeds_the_question_set_in_one_batch(make_agent):
+    embeddings = CountingEmbeddings()
+    store = InMemoryVectorStore(embeddings)
+    store.add_texts(REFERENCES)
+    agent = make_agent(answer_with_reference, vector_store=store)
+    embeddings.batches.clear()
+
+    count = agent.prefetch_similar(
+        [("capital of France?", None), ("author of Hamlet?", ""), ("capital of France?", None)]
+    )
+
+    assert count == 2
+    assert [len(batch) for batch in embeddings.batches] == [2]
+
+    # The graph runs reuse the results instead of searching again
+    assert agent.answer_question("capital of France?") == "ok"
+    assert agent.answer_question("author of Hamlet?", "") == "ok"
+    assert embeddings.queries == []
+
+    # Questions that were not pre-retrieved are still searched
+    agent.answer_question("another question")
+    assert len(embeddings.queries) == 1
+
+
+def test_prefetch_skips_queries_already_retrieved(make_agent):
+    agent = make_agent(answer_with_reference, documents=REFERENCES)
+    assert agent.prefetch_similar([("capital of France?", None)]) == 1
+    assert agent.prefetch_similar([("capital of France?", None)]) == 0
+
+
+def test_prefetched_results_are_invalidated_by_ingestion(make_agent):
+    agent = make_agent(answer_with_reference, documents=REFERENCES)
+    agent.prefetch_similar([("capital of France?", None)])
+    query = agent._build_prompt("capital of France?")
+    assert agent._known_similar(query) is not None
+
+    invalidate_all()
+    assert agent._known_similar(query) is None
+
+
+def test_prefetch_needs_the_retrieval_cache(make_agent):
+    agent = make_agent(answer_with_reference, documents=REFERENCES, retrieval_cache_size=0)
+    assert agent.prefetch_similar([("capital of France?", None)]) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_runs_reuse_prefetched_results(make_agent):
+    store = LocalVectorStore.from_texts(REFERENCES, DeterministicFakeEmbedding(size=16))
+    agent = make_agent(answer_with_reference, vector_store=store)
+    agent.prefetch_similar([("capital of France?", None)])
+    store.similarity_search = MagicMock(side_effect=AssertionError("searched again"))
+
+    assert await agent.aanswer_question("capital of France?", raise_errors=True) == "ok"
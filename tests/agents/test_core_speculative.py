@@ -0,0 +1,125 @@
+import asyncio
+import threading
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from the_bot.agents.metrics import METRICS
+
+DOC = "Question : 1 + 1?\n\nFinal answer : 2"
+
+
+class GatedStore(InMemoryVectorStore):
+    """A vector store whose searches wait until the model has been called."""
+
+    def __init__(self):
+        super().__init__(DeterministicFakeEmbedding(size=16))
+        self.gate = threading.Event()
+        self.searched = threading.Event()
+        self.events = []
+
+    def similarity_search(self, query, k=4, **kwargs):
+        self.gate.wait(timeout=5)
+        self.events.append("search")
+        self.searched.set()
+        return super().similarity_search(query, k=k, **kwargs)
+
+    async def asimilarity_search(self, query, k=4, **kwargs):
+        await asyncio.to_thread(self.gate.wait, 5)
+        self.events.append("search")
+        return super().similarity_search(query, k=k, **kwargs)
+
+
+def make_respond(store):
+    def respond(messages):
+        store.events.append("llm")
+        store.gate.set()
+        return AIMessage(content="2")
+    return respond
+
+
+def test_first_assistant_call_does_not_wait_for_retrieval(make_agent):
+    store = GatedStore()
+    store.add_texts([DOC])
+    agent = make_agent(make_respond(store), vector_store=store, speculative_retrieval=True)
+
+    assert agent.answer_question("1 + 1?") == "2"
+    assert store.searched.wait(timeout=5)
+    assert store.events == ["llm", "search"]
+
+    # The late result filled the retrieval cache for the next run
+    assert agent.answer_question("1 + 1?") == "2"
+    assert store.events == ["llm", "search", "llm"]
+    agent.close()
+
+
+def test_async_first_assistant_call_does_not_wait_for_retrieval(make_agent):
+    store = GatedStore()
+    store.add_texts([DOC])
+    agent = make_agent(make_respond(store), vector_store=store, speculative_retrieval=True)
+
+    async def run():
+        answer = await agent.aanswer_question("1 + 1?")
+        # Let the background retrieval finish before the loop closes
+        await asyncio.sleep(0.1)
+        return answer
+
+    assert asyncio.run(run()) == "2"
+    assert store.events == ["llm", "search"]
+
+
+def outcomes():
+    return {outcome: METRICS.speculative_cache_fills.value(outcome=outcome) for outcome in ("cached", "failed")}
+
+
+def test_background_retrieval_is_counted_once_cached(make_agent):
+    store = GatedStore()
+    store.add_texts([DOC])
+    agent = make_agent(lambda messages: AIMessage(content="2"), vector_store=store, speculative_retrieval=True)
+    before = outcomes()
+
+    assert agent.answer_question("1 + 1?") == "2"
+    assert outcomes() == before
+    store.gate.set()
+    agent._retrieval_pool.shutdown(wait=True)
+    assert outcomes() == {**before, "cached": before["cached"] + 1}
+    agent.close()
+
+
+def test_failed_background_retrieval_is_counted(make_agent):
+    store = GatedStore()
+
+    def search(query, k=4, **kwargs):
+        raise ConnectionError("vector store unavailable")
+
+    store.similarity_search = search
+    agent = make_agent(lambda messages: AIMessage(content="2"), vector_store=store, speculative_retrieval=True)
+    before = outcomes()
+
+    assert agent.answer_question("1 + 1?") == "2"
+    agent._retrieval_pool.shutdown(wait=True)
+    assert outcomes() == {**before, "failed": before["failed"] + 1}
+    agent.close()
+
+
+def test_speculation_needs_the_retrieval_cache(make_agent):
+    store = GatedStore()
+    store.add_texts([DOC])
+    store.gate.set()
+    agent = make_agent(make_respond(store), vector_store=store, speculative_retrieval=True, retrieval_cache_size=0)
+
+    assert not agent.speculative_retrieval
+    assert agent.answer_question("1 + 1?") == "2"
+    assert store.events == ["search", "llm"]
+    agent.close()
+
+
+def test_retrieval_comes_first_by_default(make_agent):
+    store = GatedStore()
+    store.add_texts([DOC])
+    store.gate.set()
+    agent = make_agent(make_respond(store), vector_store=store)
+
+    assert agent.answer_question("1 + 1?") == "2"
+    assert store.events == ["search", "llm"]
@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from the_bot.agents.embedding_cache import CachedEmbeddings
+
+
+@pytest.fixture
+def model():
+    fake = DeterministicFakeEmbedding(size=8)
+    model = MagicMock(wraps=fake)
+    return model
+
+
+def test_texts_are_embedded_once(tmp_path, model):
+    cache = CachedEmbeddings(model, "fake", str(tmp_path / "cache.sqlite"))
+
+    first = cache.embed_documents(["a", "b", "a"])
+    second = cache.embed_documents(["b", "a", "c"])
+
+    assert model.embed_documents.call_args_list[0].args == (["a", "b"],)
+    assert model.embed_documents.call_args_list[1].args == (["c"],)
+    assert second[0] == pytest.approx(first[1])
+    assert second[1] == pytest.approx(first[0])
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_queries_and_documents_are_cached_separately(tmp_path, model):
+    cache = CachedEmbeddings(model, "fake", str(tmp_path / "cache.sqlite"))
+
+    cache.embed_documents(["question"])
+    cache.embed_query("question")
+    cache.embed_query("question")
+
+    assert model.embed_documents.call_count == 1
+    assert model.embed_query.call_count == 1
+
+
+def test_cache_is_shared_through_the_file(tmp_path, model):
+    path = str(tmp_path / "cache.sqlite")
+    vector = CachedEmbeddings(model, "fake", path).embed_query("question")
+
+    other = MagicMock()
+    assert CachedEmbeddings(other, "fake", path).embed_query("question") == pytest.approx(vector)
+    other.embed_query.assert_not_called()
+
+    # Another model does not reuse the entry
+    CachedEmbeddings(other, "other-model", path).embed_query("question")
+    other.embed_query.assert_called_once()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, model):
+    cache = CachedEmbeddings(model, "fake", str(tmp_path / "cache.sqlite"), max_entries=2)
+
+    cache.embed_query("a")
+    cache.embed_query("b")
+    cache.embed_query("a")  # b is now the least recently used
+    cache.embed_query("c")
+
+    assert len(cache) == 2
+    model.embed_query.reset_mock()
+    cache.embed_query("a")
+    cache.embed_query("c")
+    model.embed_query.assert_not_called()
+    cache.embed_query("b")
+    model.embed_query.assert_called_once_with("b")
@@ -0,0 +1,193 @@
+import asyncio
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from the_bot.agents.core import Agent
+from the_bot.agents.episodic import EPISODES_FILE, LOG_FILE, EpisodicMemory, LSHIndex, format_episodes, tool_trace
+
+
+@tool
+def add(a: int, b: int) -> int:
+    """Add two numbers."""
+    return a + b
+
+
+def test_lsh_finds_near_neighbours():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(500, 32))
+    index = LSHIndex(32)
+    for i, vector in enumerate(vectors):
+        index.add(str(i), vector)
+
+    hits = [index.search(vector + rng.normal(scale=0.05, size=32), k=1)[0][0] for vector in vectors[:50]]
+    assert sum(hit == str(i) for i, hit in enumerate(hits)) >= 48
+
+    index.remove("0")
+    assert len(index) == 499
+    assert index.search(vectors[0], k=1)[0][0] != "0"
+
+
+def test_recall_returns_the_similar_episode():
+    memory = EpisodicMemory(DeterministicFakeEmbedding(size=16))
+    memory.remember("What is 1 + 1?", "2", [{"tool": "add", "args": {"a": 1, "b": 1}, "result": "2"}])
+    memory.remember("Who wrote Hamlet?", "Shakespeare")
+
+    recalled = memory.recall("What is 1 + 1?", top_k=1)
+    assert [e["answer"] for e in recalled] == ["2"]
+    assert recalled[0]["trace"][0]["tool"] == "add"
+    assert recalled[0]["score"] > 0.99
+    assert memory.recall("What is 1 + 1?", top_k=1, min_score=1.01) == []
+
+
+def test_least_useful_episodes_are_evicted():
+    memory = EpisodicMemory(DeterministicFakeEmbedding(size=16), max_episodes=2)
+    memory.remember("a", "1")
+    memory.remember("b", "2")
+    memory.recall("a", top_k=1)
+    memory.remember("c", "3")
+
+    assert len(memory) == 2
+    assert sorted(e["question"] for e in memory.episodes.values()) == ["a", "c"]
+
+
+def test_new_episodes_are_kept_once_recalls_age_out():
+    memory = EpisodicMemory(DeterministicFakeEmbedding(size=16), max_episodes=2)
+    memory.remember("q1", "1")
+    memory.remember("q2", "2")
+    memory.recall("q1", top_k=1)
+    for i in range(3, 6):
+        memory.remember(f"q{i}", str(i))
+        assert f"q{i}" in [e["question"] for e in memory.episodes.values()]
+
+    assert sorted(e["question"] for e in memory.episodes.values()) == ["q4", "q5"]
+
+
+def test_snapshot_is_reloaded(tmp_path):
+    path = str(tmp_path / "memory")
+    memory = EpisodicMemory(DeterministicFakeEmbedding(size=16), path=path)
+    memory.remember("What is 1 + 1?", "2", meta={"task_id": "t1"})
+
+    reloaded = EpisodicMemory(DeterministicFakeEmbedding(size=16), path=path)
+    assert len(reloaded) == 1
+    assert reloaded.recall("What is 1 + 1?", top_k=1)[0]["meta"] == {"task_id": "t1"}
+
+    smaller = EpisodicMemory(DeterministicFakeEmbedding(size=16), max_episodes=0, path=path)
+    assert len(smaller) == 0
+
+
+def test_snapshot_vectors_are_matched_by_id(tmp_path):
+    path = str(tmp_path / "memory")
+    memory = EpisodicMemory(DeterministicFakeEmbedding(size=16), max_episodes=1, path=path, min_compaction=1)
+    memory.remember("What is 1 + 1?", "2")
+    episodes = (tmp_path / "memory" / EPISODES_FILE).read_text()
+    # Crash after the vectors of the next snapshot were written, before its episodes
+    memory.remember("Who wrote Hamlet?", "Shakespeare")
+    (tmp_path / "memory" / EPISODES_FILE).write_text(episodes)
+
+    reloaded = EpisodicMemory(DeterministicFakeEmbedding(size=16), path=path)
+    assert len(reloaded) == 0
+
+
+def test_episodes_are_appended_to_a_log_and_compacted(tmp_path):
+    path = str(tmp_path / "memory")
+    memory = EpisodicMemory(DeterministicFakeEmbedding(size=16), max_episodes=2, path=path, min_compaction=5)
+    for i in range(3):
+        memory.remember(f"q{i}", str(i))
+
+    # The third episode evicted the first, 4 records in the log
+    assert not (tmp_path / "memory" / EPISODES_FILE).exists()
+    assert len((tmp_path / "memory" / LOG_FILE).read_text().splitlines()) == 4
+    memory.remember("q3", "3")
+    assert (tmp_path / "memory" / LOG_FILE).read_text() == ""
+
+    memory.remember("q4", "4")
+    # Crash while appending a record
+    with open(tmp_path / "memory" / LOG_FILE, "a") as f:
+        f.write('{"add": {"id"')
+
+    reloaded = EpisodicMemory(DeterministicFakeEmbedding(size=16), max_episodes=2, path=path)
+    assert sorted(e["question"] for e in reloaded.episodes.values()) == ["q3", "q4"]
+    assert (tmp_path / "memory" / LOG_FILE).read_text() == ""
+
+
+def test_unverified_answers_are_labelled():
+    episodes = [
+        {"question": "What is 1 + 1?", "answer": "2", "trace": [], "verified": True},
+        {"question": "What is 2 + 2?", "answer": "5", "trace": []},
+    ]
+    text = format_episodes(episodes)
+    assert "Answer (checked against the reference): 2" in text
+    assert "Answer (not checked, may be wrong): 5" in text
+
+
+def test_tool_trace():
+    messages = [
+        AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 1}, "id": "call-1"}]),
+        ToolMessage(content="2", tool_call_id="call-1"),
+        AIMessage(content="2"),
+    ]
+    assert tool_trace(messages) == [{"tool": "add", "args": {"a": 1, "b": 1}, "result": "2"}]
+
+
+def respond_with_add(messages):
+    if not any(isinstance(m, ToolMessage) for m in messages):
+        return AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 1}, "id": "call-1"}])
+    return AIMessage(content="2")
+
+
+def test_agent_remembers_and_recalls_solved_questions(make_agent):
+    prompts = []
+
+    def respond(messages):
+        prompts.append("\n".join(str(m.content) for m in messages))
+        return respond_with_add(messages)
+
+    agent = make_agent(respond, tools=[add], episodic_memory_size=10)
+    assert agent.answer_question("What is 1 + 1?") == "2"
+    assert "Similar questions were solved before" not in prompts[0]
+
+    assert agent.answer_question("What is 1 + 1?") == "2"
+    assert "Tool: add(a=1, b=1) -> 2" in prompts[-1]
+    assert len(agent.memory) == 2
+
+
+def test_async_agent_shares_the_memory_snapshot(make_agent, tmp_path):
+    path = str(tmp_path / "memory")
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+    memory = {"tools": [add], "episodic_memory_size": 10, "episodic_memory_path": path}
+    agent = make_agent(respond_with_add, vector_store=store, **memory)
+    assert asyncio.run(agent.aanswer_question("What is 1 + 1?")) == "2"
+
+    other = make_agent(respond_with_add, vector_store=store, **memory)
+    assert other.memory is agent.memory
+    # Vectors of another embedder cannot be compared with these ones
+    assert make_agent(respond_with_add, **memory).memory is not agent.memory
+    agent.close()
+    other.close()
+
+    reloaded = make_agent(respond_with_add, **memory)
+    assert reloaded.recall("What is 1 + 1?", top_k=1)[0]["answer"] == "2"
+
+
+def test_agent_only_remembers_answers_it_can_trust(make_agent):
+    call = AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 1}, "id": "call-1"}])
+    failed = [call, ToolMessage(content="Error: broken", tool_call_id="call-1", status="error"), AIMessage(content="2")]
+    assert not Agent._answered_cleanly(failed)
+    assert not Agent._answered_cleanly([call])
+    assert Agent._answered_cleanly([call, ToolMessage(content="2", tool_call_id="call-1"), AIMessage(content="2")])
+
+    agent = make_agent(respond_with_add, tools=[add], episodic_memory_size=10)
+    assert agent.answer_question("What is 1 + 1?", reference_answer="3") == "2"
+    assert len(agent.memory) == 0
+    assert agent.answer_question("What is 1 + 1?", reference_answer="2") == "2"
+    assert [e["verified"] for e in agent.memory.episodes.values()] == [True]
+
+
+def test_memory_is_disabled_by_default(make_agent):
+    agent = make_agent(lambda messages: AIMessage(content="2"))
+    assert agent.remember("What is 1 + 1?", "2") is None
+    assert agent.recall("What is 1 + 1?") == []
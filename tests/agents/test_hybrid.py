@@ -0,0 +1,87 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from the_bot.agents.hybrid import BM25Index, HybridVectorStore, tokenize
+from the_bot.agents.local_index import LocalVectorStore
+
+REFERENCES = [
+    "Question : Under what NASA award number was the work of R. G. Arendt supported?\n\nFinal answer : 80GSFC21M0002",
+    "Question : What is the capital of France?\n\nFinal answer : Paris",
+    "Question : Review the chess position in the image. What is black's winning move?\n\nFinal answer : Rd5",
+    "Question : How many studio albums did Mercedes Sosa publish?\n\nFinal answer : 3",
+]
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Open sales_2023.xlsx, award 80GSFC21M0002") == [
+        "open", "sales_2023.xlsx", "sales", "2023", "xlsx", "award", "80gsfc21m0002",
+    ]
+
+
+def test_bm25_ranks_rare_terms_first():
+    index = BM25Index()
+    index.add(["the cat sat", "the dog sat", "the zebra"])
+
+    results = index.search("zebra sat", k=3)
+
+    assert results[0][0] == 2
+    assert {doc for doc, _ in results} == {0, 1, 2}
+    assert index.search("unknown") == []
+
+
+def test_bm25_incremental_add():
+    index = BM25Index()
+    index.add(["first document"])
+    assert index.add(["second document about arendt"]) == [1]
+    assert index.search("arendt")[0][0] == 1
+
+
+def test_hybrid_finds_exact_identifiers():
+    # The fake embedding is random, so only the keyword search can find the award number
+    store = HybridVectorStore.from_store(LocalVectorStore.from_texts(REFERENCES, DeterministicFakeEmbedding(size=16)))
+
+    docs = store.similarity_search("Which paper mentions 80GSFC21M0002?", k=1)
+
+    assert docs[0].page_content == REFERENCES[0]
+
+
+def test_hybrid_keeps_dense_matches():
+    store = HybridVectorStore.from_store(LocalVectorStore.from_texts(REFERENCES, DeterministicFakeEmbedding(size=16)))
+    assert REFERENCES[1] in [doc.page_content for doc in store.similarity_search(REFERENCES[1], k=2)]
+
+
+def test_hybrid_add_texts_updates_both_indexes():
+    dense = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+    dense.add_texts(REFERENCES[:2])
+    store = HybridVectorStore.from_store(dense)
+
+    store.add_texts([REFERENCES[2]], [{"source": "new"}])
+
+    assert len(dense.store) == 3
+    docs = store.similarity_search("winning move Rd5", k=1)
+    assert docs[0].page_content == REFERENCES[2]
+    assert docs[0].metadata == {"source": "new"}
+
+
+def test_batch_search_matches_single_searches():
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = HybridVectorStore.from_store(LocalVectorStore.from_texts(REFERENCES, embedding))
+    queries = ["award 80GSFC21M0002", "Mercedes Sosa albums"]
+
+    batch = store.similarity_search_batch(queries, embedding.embed_documents(queries), k=2)
+
+    assert batch == [store.similarity_search(query, k=2) for query in queries]
+
+
+@pytest.mark.parametrize("hybrid", [True, False])
+def test_agent_hybrid_retrieval(make_agent, hybrid):
+    agent = make_agent(lambda messages: AIMessage(content="ok"), documents=REFERENCES, hybrid_retrieval=hybrid)
+
+    assert isinstance(agent.vector_store, HybridVectorStore) is hybrid
+    if hybrid:
+        assert agent.prefetch_similar([("NASA award 80GSFC21M0002?", None)]) == 1
+        query = agent._build_prompt("NASA award 80GSFC21M0002?")
+        assert agent._known_similar(query)[0].page_content == REFERENCES[0]
+    assert agent.answer_question("NASA award 80GSFC21M0002?") == "ok"
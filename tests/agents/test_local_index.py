@@ -0,0 +1,99 @@
+import json
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from the_bot.agents.local_index import LocalVectorStore, export_supabase
+
+TEXTS = [
+    "Question : What is the capital of France?\n\nFinal answer : Paris",
+    "Question : How many legs does a spider have?\n\nFinal answer : 8",
+    "Question : Who wrote Hamlet?\n\nFinal answer : Shakespeare",
+]
+
+
+@pytest.fixture
+def embedding():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def test_search_returns_best_matches_first(embedding):
+    store = LocalVectorStore.from_texts(TEXTS, embedding, metadatas=[{"source": str(i)} for i in range(3)])
+
+    docs = store.similarity_search(TEXTS[1], k=2)
+
+    assert len(docs) == 2
+    assert docs[0].page_content == TEXTS[1]
+    assert docs[0].metadata == {"source": "1"}
+    scores = [score for _, score in store.similarity_search_with_score(TEXTS[1], k=3)]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_empty_store(embedding):
+    assert LocalVectorStore(embedding).similarity_search("anything") == []
+
+
+def test_save_and_load_memory_mapped(tmp_path, embedding):
+    store = LocalVectorStore.from_texts(TEXTS, embedding, ids=["a", "b", "c"])
+    store.save(str(tmp_path / "index"), embedding_model="fake")
+
+    loaded = LocalVectorStore.load(str(tmp_path / "index"), embedding)
+
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.ids == ["a", "b", "c"]
+    assert loaded.similarity_search(TEXTS[2], k=1)[0].page_content == TEXTS[2]
+
+
+def test_load_missing_index(tmp_path, embedding):
+    with pytest.raises(FileNotFoundError):
+        LocalVectorStore.load(str(tmp_path), embedding)
+
+
+def test_export_supabase(tmp_path, embedding):
+    rows = [
+        {"id": i, "content": text, "metadata": {"source": str(i)}, "embedding": json.dumps(embedding.embed_query(text))}
+        for i, text in enumerate(TEXTS)
+    ]
+    client = MagicMock()
+    query = client.table.return_value.select.return_value.order.return_value
+    query.range.side_effect = lambda start, end: MagicMock(
+        execute=MagicMock(return_value=MagicMock(data=rows[start:end + 1]))
+    )
+
+    count = export_supabase(client, str(tmp_path / "index"), embedding_model="fake", page_size=2)
+
+    assert count == 3
+    assert query.range.call_count == 2
+    loaded = LocalVectorStore.load(str(tmp_path / "index"), embedding)
+    docs = loaded.similarity_search(TEXTS[0], k=1)
+    assert docs[0].page_content == TEXTS[0]
+    assert docs[0].metadata == {"source": "0"}
+
+
+def test_agent_retrieves_from_local_index(tmp_path, monkeypatch, embedding):
+    from the_bot.agents import core
+
+    LocalVectorStore.from_texts(TEXTS, embedding).save(str(tmp_path / "index"))
+    monkeypatch.setattr(core, "HuggingFaceEmbeddings", lambda model_name: embedding)
+    llm = MagicMock()
+    llm.bind_tools.return_value = core.RunnableLambda(lambda messages: AIMessage(content="Paris"))
+
+    agent = core.Agent(llm=llm, vector_index_path=str(tmp_path / "index"), tools=[], system_prompt="Be brief.")
+
+    assert isinstance(agent.vector_store, LocalVectorStore)
+    assert agent.answer_question("What is the capital of France?") == "Paris"
+
+
+def test_batch_search_matches_single_searches(embedding):
+    store = LocalVectorStore.from_texts(TEXTS, embedding)
+    vectors = embedding.embed_documents([TEXTS[2], TEXTS[0]])
+
+    batch = store.similarity_search_by_vectors(vectors, k=2)
+
+    assert batch == [store.similarity_search_by_vector(vector, k=2) for vector in vectors]
+    assert batch[0][0].page_content == TEXTS[2]
+    assert batch[1][0].page_content == TEXTS[0]
@@ -0,0 +1,109 @@
+import urllib.request
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+
+from the_bot.agents.metrics import METRICS, AgentMetrics, Counter, Histogram, start_metrics_server, token_usage
+from the_bot.agents.tools.math import add, divide
+
+
+def test_counter_render():
+    counter = Counter("calls_total", "Calls.")
+    counter.inc(tool="add")
+    counter.inc(2, tool="add")
+    counter.inc(tool='say "hi"')
+    lines = counter.render()
+    assert "# TYPE calls_total counter" in lines
+    assert 'calls_total{tool="add"} 3' in lines
+    assert 'calls_total{tool="say \\"hi\\""} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, node="assistant")
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{node="assistant",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{node="assistant",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{node="assistant",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{node="assistant"} 3' in lines
+    assert 'latency_seconds_sum{node="assistant"} 5.55' in lines
+
+
+@pytest.mark.parametrize("message, expected", [
+    (AIMessage(content="", usage_metadata={"input_tokens": 10, "output_tokens": 3, "total_tokens": 13}), (10, 3)),
+    (AIMessage(content="", response_metadata={"token_usage": {"prompt_tokens": 7, "completion_tokens": 2}}), (7, 2)),
+    (AIMessage(content="", response_metadata={"usage_metadata": {"prompt_token_count": 5,
+                                                                 "candidates_token_count": 1}}), (5, 1)),
+    (AIMessage(content=""), (0, 0)),
+])
+def test_token_usage(message, expected):
+    assert token_usage(message) == expected
+
+
+def test_agent_records_node_tool_and_token_metrics(make_agent):
+    def respond(messages):
+        if not any(isinstance(m, ToolMessage) for m in messages):
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": "call-1"}],
+                usage_metadata={"input_tokens": 50, "output_tokens": 5, "total_tokens": 55},
+            )
+        return AIMessage(content="3", usage_metadata={"input_tokens": 80, "output_tokens": 1, "total_tokens": 81})
+
+    agent = make_agent(respond, tools=[add], model_id="test-model")
+    before = {
+        "assistant": METRICS.node_latency.count(node="assistant"),
+        "retriever": METRICS.node_latency.count(node="retriever"),
+        "questions": METRICS.questions.value(status="ok"),
+        "add": METRICS.tool_calls.value(tool="add"),
+        "input": METRICS.llm_tokens.value(model="test-model", direction="input"),
+        "output": METRICS.llm_tokens.value(model="test-model", direction="output"),
+    }
+
+    assert agent.answer_question("1 + 2?") == "3"
+
+    assert METRICS.node_latency.count(node="assistant") - before["assistant"] == 2
+    assert METRICS.node_latency.count(node="retriever") - before["retriever"] == 1
+    assert METRICS.questions.value(status="ok") - before["questions"] == 1
+    assert METRICS.tool_calls.value(tool="add") - before["add"] == 1
+    assert METRICS.llm_tokens.value(model="test-model", direction="input") - before["input"] == 130
+    assert METRICS.llm_tokens.value(model="test-model", direction="output") - before["output"] == 6
+
+
+def test_agent_records_errors(make_agent):
+    def respond(messages):
+        return AIMessage(content="", tool_calls=[{"name": "divide", "args": {"a": 1, "b": 0}, "id": "call-1"}])
+
+    agent = make_agent(respond, tools=[divide])
+    before = {
+        "questions": METRICS.questions.value(status="error"),
+        "tools": METRICS.node_errors.value(node="tools"),
+        "divide": METRICS.tool_errors.value(tool="divide"),
+    }
+
+    with pytest.raises(ValueError):
+        agent.answer_question("1 / 0?", raise_errors=True)
+
+    assert METRICS.questions.value(status="error") - before["questions"] == 1
+    assert METRICS.node_errors.value(node="tools") - before["tools"] == 1
+    assert METRICS.tool_errors.value(tool="divide") - before["divide"] == 1
+
+
+def test_metrics_disabled(make_agent):
+    agent = make_agent(lambda messages: AIMessage(content="ok"), metrics=False)
+    assert agent.callbacks == []
+
+
+def test_metrics_server():
+    metrics = AgentMetrics()
+    metrics.tool_calls.inc(tool="wiki_search")
+    server = start_metrics_server(0, host="127.0.0.1", metrics=metrics)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            body = response.read().decode("utf-8")
+        assert 'the_bot_tool_calls_total{tool="wiki_search"} 1' in body
+    finally:
+        server.shutdown()
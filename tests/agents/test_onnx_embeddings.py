@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.messages import AIMessage
+
+from the_bot.agents import core
+from the_bot.agents.embedding_cache import CachedEmbeddings
+from the_bot.agents.onnx_embeddings import check_parity, mean_pool
+
+
+class NoisyEmbeddings(Embeddings):
+    """The vectors of another model with noise, like a quantized copy of it."""
+
+    def __init__(self, reference: Embeddings, scale: float):
+        self.reference = reference
+        self.rng = np.random.default_rng(0)
+        self.scale = scale
+
+    def embed_documents(self, texts):
+        vectors = np.asarray(self.reference.embed_documents(texts))
+        return (vectors + self.rng.normal(scale=self.scale, size=vectors.shape)).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]])
+    mask = np.array([[1, 1, 0]])
+
+    assert mean_pool(hidden, mask).tolist() == [[2.0, 3.0]]
+
+
+def test_parity_check():
+    reference = DeterministicFakeEmbedding(size=64)
+
+    assert check_parity(NoisyEmbeddings(reference, scale=0.01), reference) > 0.98
+    with pytest.raises(ValueError, match="differ from the reference"):
+        check_parity(NoisyEmbeddings(reference, scale=1.0), reference)
+
+
+def build_agent(**kwargs):
+    llm = MagicMock()
+    llm.bind_tools.return_value = core.RunnableLambda(lambda messages: AIMessage(content="2"))
+    return core.Agent(llm=llm, tools=[], system_prompt="Be brief.", supabase_url="url", **kwargs)
+
+
+def test_agent_uses_the_onnx_backend(monkeypatch, tmp_path):
+    onnx = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(core, "HuggingFaceEmbeddings", MagicMock())
+    monkeypatch.setattr(core.OnnxEmbeddings, "from_model_name", MagicMock(return_value=onnx))
+    monkeypatch.setattr(core, "create_client", MagicMock())
+
+    agent = build_agent(embedding_backend="onnx", embedding_cache_path=str(tmp_path / "cache.sqlite"))
+
+    assert isinstance(agent.embeddings, CachedEmbeddings)
+    assert agent.embeddings.embeddings is onnx
+    assert agent.embeddings.model_name.endswith(":onnx-int8")
+    core.HuggingFaceEmbeddings.assert_not_called()
+
+
+def test_agent_falls_back_to_pytorch(monkeypatch):
+    torch = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(core, "HuggingFaceEmbeddings", lambda model_name: torch)
+    monkeypatch.setattr(core.OnnxEmbeddings, "from_model_name", MagicMock(side_effect=ImportError("no onnxruntime")))
+    monkeypatch.setattr(core, "create_client", MagicMock())
+
+    agent = build_agent(embedding_backend="onnx")
+
+    assert agent.embeddings is torch
+    with pytest.raises(ValueError, match="Invalid embedding backend"):
+        build_agent(embedding_backend="tensorrt")
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from the_bot.agents.core import Agent
+from the_bot.agents.rate_limit import RATE_LIMITERS, RateLimiter, TokenBucket, is_rate_limit_error
+
+MESSAGES = [HumanMessage(content="What is 1 + 1?")]
+
+
+class RateLimitError(Exception):
+    """Like the errors of the provider clients."""
+
+    def __init__(self, retry_after: str = "0.01"):
+        super().__init__("Error code: 429")
+        self.response = MagicMock(status_code=429, headers={"retry-after": retry_after})
+
+
+def test_rate_limit_errors_are_recognized():
+    assert is_rate_limit_error(RateLimitError())
+    assert is_rate_limit_error(type("ResourceExhausted", (Exception,), {})("quota"))
+    assert not is_rate_limit_error(ValueError("bad request"))
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(capacity=60, rate=1)
+    bucket.take(60)
+
+    assert bucket.wait(10, bucket.updated) == pytest.approx(10)
+    assert bucket.wait(10, bucket.updated + 4) == pytest.approx(6)
+    # Larger than the bucket: waits for a full bucket, not forever
+    assert bucket.wait(1000, bucket.updated) == pytest.approx(56)
+
+
+def test_requests_per_minute_are_enforced():
+    limiter = RateLimiter(rpm=2, tpm=1000)
+    limiter.acquire(10)
+    limiter.release(10)
+    limiter.acquire(10)
+    limiter.release(10)
+
+    assert limiter._try_acquire(10) == pytest.approx(30, abs=0.1)
+
+
+def test_aimd():
+    limiter = RateLimiter(rpm=600, tpm=100_000, max_concurrency=8)
+    for _ in range(40):
+        limiter.acquire(10)
+        limiter.release(10, latency=0.1)
+    assert limiter.limit == 8
+
+    limiter.acquire(10)
+    limiter.release(10, error=RateLimitError("5"))
+    assert limiter.limit == 4
+    assert limiter._try_acquire(10) == pytest.approx(5, abs=0.1)
+
+    limiter._paused_until = 0
+    limiter.acquire(10)
+    limiter.release(10, latency=2.0)
+    assert limiter.limit == pytest.approx(3.6)
+
+
+def test_concurrency_limit_is_respected():
+    limiter = RateLimiter(rpm=10_000, tpm=1_000_000, max_concurrency=2)
+    limiter.limit = 2
+    lock = threading.Lock()
+    in_flight, peak = 0, 0
+
+    def work():
+        nonlocal in_flight, peak
+        limiter.acquire(1)
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        limiter.release(1, latency=0.02)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == 2
+
+
+def test_wrapped_model_retries_after_a_429():
+    RATE_LIMITERS.enable()
+    RATE_LIMITERS.configure("groq", "fake", rpm=6000, tpm=1_000_000)
+    responses = [RateLimitError(), AIMessage(content="2", usage_metadata={
+        "input_tokens": 100, "output_tokens": 5, "total_tokens": 105})]
+
+    def respond(messages):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    llm = RATE_LIMITERS.wrap(RunnableLambda(respond), "groq", "fake")
+
+    assert llm.invoke(MESSAGES).content == "2"
+    limiter = RATE_LIMITERS.get("groq", "fake")
+    assert (limiter.throttled, limiter.in_flight) == (1, 0)
+
+
+def test_wrapped_model_async():
+    RATE_LIMITERS.enable()
+    llm = RATE_LIMITERS.wrap(RunnableLambda(lambda messages: AIMessage(content="2")), "google", "fake")
+
+    assert asyncio.run(llm.ainvoke(MESSAGES)).content == "2"
+    assert RATE_LIMITERS.get("google", "fake").requests.level < 10
+
+
+def test_cancelled_call_frees_its_slot():
+    RATE_LIMITERS.enable()
+
+    async def respond(messages):
+        await asyncio.sleep(10)
+
+    llm = RATE_LIMITERS.wrap(RunnableLambda(lambda messages: None, afunc=respond), "groq", "fake")
+
+    async def run():
+        task = asyncio.ensure_future(llm.ainvoke(MESSAGES))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    limiter = RATE_LIMITERS.get("groq", "fake")
+    assert (limiter.in_flight, limiter.throttled) == (0, 0)
+
+
+def test_models_are_unchanged_while_disabled():
+    llm = RunnableLambda(lambda messages: AIMessage(content="2"))
+    assert RATE_LIMITERS.wrap(llm, "groq", "fake") is llm
+
+
+def test_agent_calls_go_through_the_limiter(make_agent):
+    agent = make_agent(lambda messages: AIMessage(content="2"), rate_limit=True, rate_limit_rpm=100)
+
+    with patch.object(RateLimiter, "release", autospec=True, side_effect=RateLimiter.release) as release:
+        assert agent.answer_question("What is 1 + 1?") == "2"
+
+    limiter = RATE_LIMITERS.get("groq", "qwen-qwq-32b")
+    assert release.call_count == 1
+    assert limiter.requests.capacity == 100
+    assert limiter.tokens.capacity == 6_000
+
+
+def test_wrapped_models_leave_retries_to_the_limiter():
+    assert RATE_LIMITERS.client_retries(2) == 2
+    RATE_LIMITERS.enable()
+    assert RATE_LIMITERS.client_retries(2) == 0
+
+
+def test_rate_limited_agent_model_does_not_retry_on_its_own():
+    with patch("the_bot.agents.core.ChatGroq") as chat_groq:
+        Agent(model_type="groq", rate_limit=True, vector_store=MagicMock(), tools=[], system_prompt="Be brief.")
+        Agent(model_type="groq", vector_store=MagicMock(), tools=[], system_prompt="Be brief.")
+
+    assert chat_groq.call_args_list[0].kwargs["max_retries"] == 0
+    assert "max_retries" not in chat_groq.call_args_list[1].kwargs
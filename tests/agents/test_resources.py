@@ -0,0 +1,94 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from the_bot.agents import core
+from the_bot.agents.local_index import LocalVectorStore
+from the_bot.agents.resources import REGISTRY, ResourceRegistry
+
+
+def test_resources_are_shared_by_key():
+    registry = ResourceRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = registry.acquire(("model", "a"), factory)
+    second = registry.acquire(("model", "a"), factory)
+    other = registry.acquire(("model", "b"), factory)
+
+    assert first is second
+    assert other is not first
+    assert factory.call_count == 2
+    assert registry.refcount(("model", "a")) == 2
+
+
+def test_last_release_tears_down():
+    registry = ResourceRegistry()
+    resource = MagicMock()
+    registry.acquire(("client",), lambda: resource)
+    registry.acquire(("client",), lambda: resource)
+
+    registry.release(("client",))
+    resource.close.assert_not_called()
+    registry.release(("client",))
+    resource.close.assert_called_once()
+    assert ("client",) not in registry
+
+    # Acquiring again creates a new resource
+    assert registry.acquire(("client",), MagicMock) is not resource
+
+
+def test_failed_factory_does_not_keep_a_reference():
+    registry = ResourceRegistry()
+    with pytest.raises(RuntimeError):
+        registry.acquire(("model",), MagicMock(side_effect=RuntimeError("no weights")))
+    assert ("model",) not in registry
+
+
+def test_concurrent_acquire_creates_once():
+    registry = ResourceRegistry()
+    calls = []
+
+    def slow_factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.acquire(("model",), slow_factory)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+    assert registry.refcount(("model",)) == 8
+
+
+def test_agents_share_the_embedder_and_index(tmp_path, monkeypatch):
+    embedding = DeterministicFakeEmbedding(size=16)
+    LocalVectorStore.from_texts(["Question : 1 + 1?\\n\\nFinal answer : 2"], embedding).save(str(tmp_path / "index"))
+    load_model = MagicMock(return_value=embedding)
+    monkeypatch.setattr(core, "HuggingFaceEmbeddings", load_model)
+
+    def build():
+        llm = MagicMock()
+        llm.bind_tools.return_value = core.RunnableLambda(lambda messages: AIMessage(content="2"))
+        return core.Agent(llm=llm, vector_index_path=str(tmp_path / "index"), tools=[], system_prompt="Be brief.")
+
+    first, second = build(), build()
+    assert load_model.call_count == 1
+    assert first.embeddings is second.embeddings
+    assert first.vector_store is second.vector_store
+
+    first.close()
+    assert second.answer_question("1 + 1?") == "2"
+    second.close()
+    assert not any(key[0] in ("embeddings", "local_index") for key in REGISTRY._entries)
@@ -0,0 +1,92 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from the_bot.agents.resources import REGISTRY
+from the_bot.agents.response_cache import ResponseCache
+
+SETTINGS = {"provider": "groq", "model_id": "fake", "temperature": 0.0}
+MESSAGES = [HumanMessage(content="What is 1 + 1?")]
+
+
+@tool
+def add(a: int, b: int) -> int:
+    """Add two numbers."""
+    return a + b
+
+
+def test_messages_with_tool_calls_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    message = AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 1}, "id": "call-1"}])
+    key = ResponseCache.key(SETTINGS, [add], MESSAGES)
+
+    assert cache.get(key) is None
+    cache.put(key, message)
+
+    cached = ResponseCache(str(tmp_path / "responses.sqlite")).get(key)
+    assert isinstance(cached, AIMessage)
+    assert cached.tool_calls == message.tool_calls
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_key_covers_settings_tools_and_messages():
+    key = ResponseCache.key(SETTINGS, [add], MESSAGES)
+
+    assert key == ResponseCache.key(dict(SETTINGS), [add], [HumanMessage(content="What is 1 + 1?", id="other")])
+    assert key != ResponseCache.key({**SETTINGS, "temperature": 0.5}, [add], MESSAGES)
+    assert key != ResponseCache.key(SETTINGS, [], MESSAGES)
+    assert key != ResponseCache.key(SETTINGS, [add], [HumanMessage(content="What is 2 + 2?")])
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_entries=2)
+    for text in ("a", "b"):
+        cache.put(text, AIMessage(content=text))
+    cache.get("a")
+    cache.put("c", AIMessage(content="c"))
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a").content == "a"
+
+
+def respond_with_add(calls):
+    def respond(messages):
+        calls.append(messages)
+        if not any(isinstance(m, ToolMessage) for m in messages):
+            return AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 1}, "id": "call-1"}])
+        return AIMessage(content="2")
+    return respond
+
+
+def test_rerun_is_answered_from_the_cache(make_agent, tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    calls = []
+    agent = make_agent(respond_with_add(calls), tools=[add], llm_cache_path=path)
+    assert agent.answer_question("What is 1 + 1?") == "2"
+    assert len(calls) == 2
+    agent.close()
+
+    # Another process reading the same file
+    REGISTRY.clear()
+    agent = make_agent(respond_with_add(calls), tools=[add], llm_cache_path=path)
+    assert agent.answer_question("What is 1 + 1?") == "2"
+    assert asyncio.run(agent.aanswer_question("What is 1 + 1?")) == "2"
+    assert len(calls) == 2
+    assert agent.llm_cache.hits == 4
+
+
+def test_sampled_responses_can_skip_the_cache(make_agent, tmp_path):
+    calls = []
+    agent = make_agent(
+        respond_with_add(calls),
+        tools=[add],
+        temperature=0.7,
+        llm_cache_path=str(tmp_path / "responses.sqlite"),
+        llm_cache_skip_sampled=True,
+    )
+    assert agent.llm_cache is None
+    agent.answer_question("What is 1 + 1?")
+    agent.answer_question("What is 1 + 1?")
+    assert len(calls) == 4
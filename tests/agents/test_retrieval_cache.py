@@ -0,0 +1,105 @@
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from the_bot.agents.retrieval_cache import RetrievalCache, bump_generation, invalidate_all, store_generation
+from the_bot.ingest import LocalIndexSink, ingest
+
+DOC = Document(page_content="Question : 1 + 1?\n\nFinal answer : 2")
+
+
+def test_normalized_queries_share_an_entry():
+    cache = RetrievalCache()
+    cache.put("store", "  What is\n1 + 1? ", 1, [DOC])
+
+    assert cache.get("store", "What is 1 + 1?", 1) == [DOC]
+    assert cache.get("store", "What is 1 + 1?", 2) is None
+    assert cache.get("other-store", "What is 1 + 1?", 1) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_is_evicted():
+    cache = RetrievalCache(max_entries=2)
+    cache.put("store", "a", 1, [DOC])
+    cache.put("store", "b", 1, [DOC])
+    cache.get("store", "a", 1)
+    cache.put("store", "c", 1, [DOC])
+
+    assert cache.get("store", "b", 1) is None
+    assert cache.get("store", "a", 1) == [DOC]
+    assert len(cache) == 2
+
+
+def test_entries_expire():
+    cache = RetrievalCache(ttl=10)
+    with patch("the_bot.agents.retrieval_cache.time.monotonic", return_value=100.0):
+        cache.put("store", "a", 1, [DOC])
+    with patch("the_bot.agents.retrieval_cache.time.monotonic", return_value=105.0):
+        assert cache.get("store", "a", 1) == [DOC]
+    with patch("the_bot.agents.retrieval_cache.time.monotonic", return_value=111.0):
+        assert cache.get("store", "a", 1) is None
+    assert len(cache) == 0
+
+
+def test_invalidate():
+    cache, other = RetrievalCache(), RetrievalCache()
+    cache.put("store", "a", 1, [DOC])
+    cache.put("other-store", "a", 1, [DOC])
+    other.put("store", "a", 1, [DOC])
+
+    cache.invalidate("store")
+    assert cache.get("store", "a", 1) is None
+    assert cache.get("other-store", "a", 1) == [DOC]
+
+    invalidate_all()
+    assert len(cache) == len(other) == 0
+
+
+def test_ingestion_invalidates_the_caches(tmp_path):
+    cache = RetrievalCache()
+    cache.put("store", "a", 1, [DOC])
+
+    ingest([{"Question": "1 + 1?", "Final answer": "2"}], DeterministicFakeEmbedding(size=4),
+           LocalIndexSink(str(tmp_path / "index")))
+
+    assert len(cache) == 0
+
+
+def test_a_changed_generation_file_clears_the_cache(tmp_path):
+    generation = str(tmp_path / "retrieval.generation")
+    cache = RetrievalCache(generation_path=generation)
+    cache.put("store", "a", 1, [DOC])
+    assert cache.get("store", "a", 1) == [DOC]
+
+    # Touched by the ingestion of another process
+    bump_generation(generation)
+    assert cache.get("store", "a", 1) is None
+    assert len(cache) == 0
+
+
+def test_ingestion_touches_the_generation_file(tmp_path):
+    generation = str(tmp_path / "retrieval.generation")
+
+    ingest([{"Question": "1 + 1?", "Final answer": "2"}], DeterministicFakeEmbedding(size=4),
+           LocalIndexSink(str(tmp_path / "index")), generation_path=generation)
+
+    assert store_generation(generation) is not None
+
+
+def test_agent_retrieves_a_repeated_question_once(make_agent):
+    agent = make_agent(lambda messages: AIMessage(content="2"), documents=[DOC.page_content])
+    searches = []
+    search = agent.vector_store.similarity_search
+    agent.vector_store.similarity_search = lambda query, k: searches.append(query) or search(query, k=k)
+
+    assert agent.answer_question("1 + 1?") == "2"
+    assert agent.answer_question("1 + 1?") == "2"
+    assert len(searches) == 1
+
+
+def test_agent_without_cache(make_agent):
+    agent = make_agent(lambda messages: AIMessage(content="2"), retrieval_cache_size=0)
+    assert agent.retrieval_cache is None
+    assert agent.answer_question("1 + 1?") == "2"
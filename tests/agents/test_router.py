@@ -0,0 +1,170 @@
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from the_bot.agents.router import Backend, LLMRouter
+
+MESSAGES = [HumanMessage(content="What is 1 + 1?")]
+
+
+def answering(content: str, delay: float = 0.0, calls: list | None = None):
+    def respond(messages):
+        if calls is not None:
+            calls.append(content)
+        time.sleep(delay)
+        return AIMessage(content=content)
+
+    async def arespond(messages):
+        if calls is not None:
+            calls.append(content)
+        await asyncio.sleep(delay)
+        return AIMessage(content=content)
+
+    return RunnableLambda(respond, afunc=arespond)
+
+
+def failing(calls: list | None = None):
+    def fail(messages):
+        if calls is not None:
+            calls.append("failing")
+        raise ConnectionError("service unavailable")
+    return RunnableLambda(fail)
+
+
+def test_quantile():
+    backend = Backend("a", answering("a"))
+    assert backend.quantile(0.95) is None
+    for latency in range(1, 101):
+        backend.succeeded(latency / 100)
+
+    assert backend.quantile(0.95) == 0.96
+    assert backend.quantile(0.5) == 0.51
+
+
+def test_failover_on_error():
+    router = LLMRouter([Backend("a", failing()), Backend("b", answering("b"))])
+
+    assert router.invoke(MESSAGES).content == "b"
+    assert router.backends[0].failures == 1
+
+
+def test_every_backend_failing_raises():
+    router = LLMRouter([Backend("a", failing()), Backend("b", failing())])
+
+    with pytest.raises(ConnectionError):
+        router.invoke(MESSAGES)
+
+
+def test_slow_call_is_hedged():
+    router = LLMRouter([Backend("a", answering("a", delay=1.0)), Backend("b", answering("b"))], hedge_delay=0.05)
+
+    start = time.perf_counter()
+    assert router.invoke(MESSAGES).content == "b"
+    assert time.perf_counter() - start < 0.5
+
+
+def test_hedging_follows_the_p95_latency():
+    router = LLMRouter([Backend("a", answering("a", delay=0.1)), Backend("b", answering("b"))], min_samples=5)
+    for _ in range(5):
+        router.backends[0].succeeded(0.5)
+
+    assert router.invoke(MESSAGES).content == "a"
+    router.backends[0].latencies.extend([0.01] * 100)
+    assert router.invoke(MESSAGES).content == "b"
+
+
+def test_failing_backend_cools_down():
+    calls = []
+    router = LLMRouter(
+        [Backend("a", failing(calls)), Backend("b", answering("b", calls=calls))],
+        failure_threshold=2,
+        cooldown=60,
+    )
+    for _ in range(4):
+        assert router.invoke(MESSAGES).content == "b"
+
+    assert calls == ["failing", "b", "failing", "b", "b", "b"]
+
+
+def test_async_hedge_lets_the_slow_call_finish():
+    calls = []
+    router = LLMRouter(
+        [Backend("a", answering("a", delay=0.3, calls=calls)), Backend("b", answering("b", calls=calls))],
+        hedge_delay=0.05,
+    )
+
+    async def run():
+        start = time.perf_counter()
+        response = await router.ainvoke(MESSAGES)
+        elapsed = time.perf_counter() - start
+        await asyncio.gather(*router._losers)
+        return response, elapsed
+
+    response, elapsed = asyncio.run(run())
+    assert response.content == "b"
+    assert elapsed < 0.25
+    assert calls == ["a", "b"]
+    # The slow call still feeds the latency of its backend
+    assert list(router.backends[0].latencies) == [pytest.approx(0.3, abs=0.1)]
+    assert router.backends[0].failures == 0
+
+
+def test_async_hedging_keeps_the_tail_latency():
+    delays = iter([0.2 if i % 4 == 0 else 0.005 for i in range(40)])
+
+    async def respond(messages):
+        await asyncio.sleep(next(delays))
+        return AIMessage(content="a")
+
+    router = LLMRouter(
+        [Backend("a", RunnableLambda(lambda m: None, afunc=respond), window=40), Backend("b", answering("b"))],
+        hedge_quantile=0.7,
+        hedge_delay=0.05,
+        min_samples=4,
+    )
+
+    async def run():
+        for _ in range(40):
+            await router.ainvoke(MESSAGES)
+        await asyncio.gather(*router._losers)
+
+    asyncio.run(run())
+    # Every slow call was hedged, their latency is kept all the same
+    assert router.backends[0].quantile(0.95) >= 0.2
+
+
+def test_callbacks_reach_the_backends():
+    ended = []
+
+    class Handler(BaseCallbackHandler):
+        def on_llm_end(self, response, **kwargs):
+            ended.append(response)
+
+    router = LLMRouter([Backend("a", FakeListChatModel(responses=["2"]))])
+
+    assert router.as_runnable().invoke(MESSAGES, {"callbacks": [Handler()]}).content == "2"
+    assert len(ended) == 1
+    router.close()
+
+
+def test_agent_fails_over_to_a_fallback_backend(make_agent):
+    fallback = MagicMock()
+    fallback.bind_tools.return_value = RunnableLambda(lambda messages: AIMessage(content="2"))
+
+    def respond(messages):
+        raise ConnectionError("service unavailable")
+
+    agent = make_agent(
+        respond,
+        fallback_backends=[{"model_type": "google", "model_id": "fake", "llm": fallback}],
+    )
+
+    assert agent.answer_question("What is 1 + 1?", raise_errors=True) == "2"
+    assert [b.name for b in agent.router.backends] == ["groq:qwen-qwq-32b", "google:fake"]
+    agent.close()
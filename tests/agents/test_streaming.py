@@ -0,0 +1,168 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.runnables import RunnableGenerator
+from langchain_core.tools import tool
+
+from the_bot.agents.metrics import METRICS
+from the_bot.agents.rate_limit import RATE_LIMITERS
+from the_bot.agents.response_cache import ResponseCache
+from the_bot.agents.router import Backend, LLMRouter
+from the_bot.agents.streaming import astream_until_answer, marked_answer, stream_until_answer
+
+MESSAGES = [HumanMessage(content="What is 1 + 1?")]
+
+
+def streaming(pieces: list, produced: list | None = None):
+    """A chat model streaming `pieces`, recording in `produced` those that were generated."""
+    produced = produced if produced is not None else []
+
+    def chunk(piece):
+        produced.append(piece)
+        return piece if isinstance(piece, AIMessageChunk) else AIMessageChunk(content=piece)
+
+    def generate(inputs):
+        for _ in inputs:
+            pass
+        for piece in pieces:
+            yield chunk(piece)
+
+    async def agenerate(inputs):
+        async for _ in inputs:
+            pass
+        for piece in pieces:
+            yield chunk(piece)
+
+    return RunnableGenerator(generate, agenerate)
+
+
+def test_marked_answer():
+    assert marked_answer("Let me add them.\nFINAL ANSWER: 2\n") == "2"
+    assert marked_answer("final answer:  2 ", complete=True) == "2"
+    # The line may still grow while it streams
+    assert marked_answer("FINAL ANSWER: 2") is None
+    assert marked_answer("<think>FINAL ANSWER: 3\n</think>FINAL ANSWER: 2\n") == "2"
+    assert marked_answer("<think>FINAL ANSWER: 3\n") is None
+
+
+def test_stream_stops_after_the_answer_line():
+    produced = []
+    before = METRICS.stream_early_stops.value()
+    llm = streaming(["1 + 1", " is 2.\nFINAL", " ANSWER: 2", "\n", "Hope this helps", "!"], produced)
+
+    response = stream_until_answer(llm, MESSAGES)
+
+    assert response.content == "2"
+    assert produced == ["1 + 1", " is 2.\nFINAL", " ANSWER: 2", "\n"]
+    assert METRICS.stream_early_stops.value() == before + 1
+
+
+def test_tool_calls_are_streamed_to_the_end():
+    pieces = [
+        AIMessageChunk(content="", tool_call_chunks=[{"name": "add", "args": '{"a": 1,', "id": "1", "index": 0}]),
+        "FINAL ANSWER: 3\n",
+        AIMessageChunk(content="", tool_call_chunks=[{"name": None, "args": ' "b": 2}', "id": None, "index": 0}]),
+    ]
+    produced = []
+
+    response = stream_until_answer(streaming(pieces, produced), MESSAGES)
+
+    assert len(produced) == 3
+    assert [(c["name"], c["args"]) for c in response.tool_calls] == [("add", {"a": 1, "b": 2})]
+
+
+def test_response_without_answer_line_is_kept_whole():
+    response = stream_until_answer(streaming(["The answer", " is 2."]), MESSAGES)
+
+    assert isinstance(response, AIMessage)
+    assert response.content == "The answer is 2."
+
+
+def test_async_stream_stops_after_the_answer_line():
+    produced = []
+    llm = streaming(["FINAL ANSWER: 2\n", "Hope this helps!"], produced)
+
+    response = asyncio.run(astream_until_answer(llm, MESSAGES))
+
+    assert response.content == "2"
+    assert produced == ["FINAL ANSWER: 2\n"]
+
+
+def test_agent_streams_the_assistant_turns(make_agent):
+    @tool
+    def add(a: int, b: int) -> int:
+        """Add two numbers."""
+        return a + b
+
+    turns = [
+        [AIMessageChunk(content="", tool_call_chunks=[
+            {"name": "add", "args": '{"a": 1, "b": 1}', "id": "call-1", "index": 0}])],
+        ["Thanks to the tool:\n", "FINAL ANSWER: 2\n", "Anything else?"],
+    ]
+    produced = []
+    sent = []
+
+    def generate(inputs):
+        for messages in inputs:
+            sent.append(messages)
+        for piece in turns.pop(0):
+            produced.append(piece)
+            yield piece if isinstance(piece, AIMessageChunk) else AIMessageChunk(content=piece)
+
+    agent = make_agent(lambda messages: AIMessage(content="unused"), tools=[add], streaming=True)
+    agent.llm_with_tools = RunnableGenerator(generate)
+
+    assert agent.answer_question("What is 1 + 1?", raise_errors=True) == "2"
+    assert "Anything else?" not in produced
+    assert any("FINAL ANSWER:" in m.content for m in sent[0])
+    agent.close()
+
+
+def test_stream_through_the_wrappers(tmp_path):
+    RATE_LIMITERS.enable()
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    produced = []
+    router = LLMRouter([Backend("a", RATE_LIMITERS.wrap(streaming(
+        ["FINAL ANSWER: 2\n", "Hope this helps!"], produced), "groq", "fake"))])
+    llm = cache.wrap_llm(router.as_runnable(), {"model": "fake"})
+
+    assert stream_until_answer(llm, MESSAGES).content == "2"
+    assert produced == ["FINAL ANSWER: 2\n"]
+    assert RATE_LIMITERS.get("groq", "fake").in_flight == 0
+
+    # Served from the cache, stored when the stream was closed
+    assert stream_until_answer(llm, MESSAGES).content == "2"
+    assert asyncio.run(astream_until_answer(llm, MESSAGES)).content == "2"
+    assert produced == ["FINAL ANSWER: 2\n"]
+    router.close()
+    cache.close()
+
+
+def failing():
+    def fail(inputs):
+        raise ConnectionError("service unavailable")
+        yield
+
+    async def afail(inputs):
+        raise ConnectionError("service unavailable")
+        yield
+
+    return RunnableGenerator(fail, afail)
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    RATE_LIMITERS.enable()
+    produced = []
+    limited = RATE_LIMITERS.wrap(streaming(["FINAL ANSWER: 2\n", "Hope this helps!"], produced), "groq", "fake")
+    router = LLMRouter([Backend("a", failing()), Backend("b", limited)])
+
+    assert stream_until_answer(router.as_runnable(), MESSAGES).content == "2"
+    assert asyncio.run(astream_until_answer(router.as_runnable(), MESSAGES)).content == "2"
+    assert produced == ["FINAL ANSWER: 2\n"] * 2
+    assert router.backends[0].failures == 2
+    assert RATE_LIMITERS.get("groq", "fake").in_flight == 0
+    router.close()
+
+
+def test_empty_stream():
+    assert stream_until_answer(streaming([]), MESSAGES).content == ""
@@ -0,0 +1,104 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from the_bot.agents import wrapper
+
+
+@pytest.fixture(autouse=True)
+def clean_warm_agent(monkeypatch):
+    monkeypatch.setattr(wrapper, "_warm_agent", None)
+    monkeypatch.setenv("AGENT_MODEL_TYPE", "google")
+    monkeypatch.setenv("GEMINI_API_KEY", "dummy")
+    monkeypatch.delenv("AGENT_MODEL_ID", raising=False)
+    yield
+
+
+def test_agent_kwargs_from_env():
+    kwargs = wrapper.agent_kwargs_from_env()
+    assert kwargs["model_type"] == "google"
+    assert kwargs["api_key"] == "dummy"
+    assert kwargs["model_id"] == "gemini-2.5-flash-preview-04-17"
+
+
+def test_agent_kwargs_from_env_without_credentials(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY")
+    with pytest.raises(RuntimeError):
+        wrapper.agent_kwargs_from_env()
+
+
+@patch("the_bot.agents.wrapper.Agent")
+def test_get_agent_is_built_once(MockAgent):
+    first = wrapper.get_agent()
+    second = wrapper.get_agent()
+    assert first is second
+    MockAgent.assert_called_once()
+
+
+@patch("the_bot.agents.wrapper.Agent")
+def test_reload_agent_picks_up_new_config(MockAgent, monkeypatch):
+    first = wrapper.get_agent()
+    monkeypatch.setenv("AGENT_MODEL_ID", "gemini-other")
+    reloaded = wrapper.reload_agent()
+
+    assert reloaded is not first
+    assert wrapper.get_agent() is reloaded
+    assert reloaded.agent_kwargs["model_id"] == "gemini-other"
+
+
+@patch("the_bot.agents.wrapper.Agent")
+def test_reload_agent_closes_previous_agent(MockAgent):
+    MockAgent.side_effect = lambda **kwargs: MagicMock()
+    first = wrapper.get_agent()
+    reloaded = wrapper.reload_agent()
+
+    first.agent.close.assert_called_once()
+    reloaded.agent.close.assert_not_called()
+
+
+@patch("the_bot.agents.wrapper.Agent")
+def test_reload_during_a_run_closes_the_previous_agent_after_it(MockAgent):
+    MockAgent.side_effect = lambda **kwargs: MagicMock()
+    first = wrapper.get_agent()
+    closed_during_run = []
+
+    def answer_question(question, file_name, raise_errors=False):
+        wrapper.reload_agent()
+        closed_during_run.append(first.agent.close.called)
+        return "2"
+
+    first.agent.answer_question.side_effect = answer_question
+
+    assert first("What is 1 + 1?", "") == "2"
+    assert closed_during_run == [False]
+    first.agent.close.assert_called_once()
+    assert wrapper.get_agent() is not first
+
+
+@patch("the_bot.agents.wrapper.Agent")
+def test_reload_between_two_calls_of_a_run_keeps_the_agent_open(MockAgent):
+    MockAgent.side_effect = lambda **kwargs: MagicMock()
+    agent = wrapper.get_agent()
+
+    def answer_question(question, file_name, raise_errors=False):
+        if agent.agent.close.called:
+            raise RuntimeError("Agent is closed")
+        return "2"
+
+    agent.agent.answer_question.side_effect = answer_question
+
+    with agent.session():
+        assert agent("What is 1 + 1?", "", raise_errors=True) == "2"
+        wrapper.reload_agent()
+        assert agent("What is 1 + 1?", "", raise_errors=True) == "2"
+        agent.agent.close.assert_not_called()
+    agent.agent.close.assert_called_once()
+
+
+@patch("the_bot.agents.wrapper.Agent")
+def test_failed_reload_keeps_previous_agent(MockAgent, monkeypatch):
+    first = wrapper.get_agent()
+    monkeypatch.delenv("GEMINI_API_KEY")
+    with pytest.raises(RuntimeError):
+        wrapper.reload_agent()
+    assert wrapper.get_agent() is first
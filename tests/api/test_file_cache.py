@@ -0,0 +1,77 @@
+import os
+import threading
+
+import pytest
+
+from the_bot.api.file_cache import FileCache
+
+
+class FakeClient:
+    def __init__(self, files):
+        self.files = files
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def iter_file(self, task_id, chunk_size=64 * 1024, timeout=None):
+        with self.lock:
+            self.calls.append(task_id)
+        data = self.files[task_id]
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+
+@pytest.fixture
+def client():
+    return FakeClient({
+        "t1": b"a,b\n1,2\n" * 1000,
+        "t2": b"\x89PNG fake image",
+        "t3": b"\x89PNG fake image",
+    })
+
+
+def test_fetch_streams_to_content_addressed_path(tmp_path, client):
+    with FileCache(client, cache_dir=str(tmp_path), chunk_size=7) as cache:
+        path = cache.fetch("t1", "t1.csv")
+
+    assert os.path.basename(path) == "t1.csv"
+    assert os.path.dirname(path).startswith(str(tmp_path / "objects"))
+    with open(path, "rb") as f:
+        assert f.read() == client.files["t1"]
+    # No partial downloads are left behind
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".part")]
+
+
+def test_cache_is_reused_across_instances(tmp_path, client):
+    with FileCache(client, cache_dir=str(tmp_path)) as cache:
+        first = cache.fetch("t1", "t1.csv")
+    with FileCache(client, cache_dir=str(tmp_path)) as cache:
+        assert cache.path_for("t1") == first
+        assert cache.fetch("t1", "t1.csv") == first
+    assert client.calls == ["t1"]
+
+
+def test_identical_content_shares_an_object(tmp_path, client):
+    with FileCache(client, cache_dir=str(tmp_path)) as cache:
+        p2 = cache.fetch("t2", "image.png")
+        p3 = cache.fetch("t3", "image.png")
+    assert p2 == p3
+
+
+def test_prefetch_only_tasks_with_files(tmp_path, client):
+    tasks = [
+        {"task_id": "t1", "file_name": "t1.csv"},
+        {"task_id": "t2", "file_name": "t2.png"},
+        {"task_id": "t4", "file_name": ""},
+    ]
+    with FileCache(client, cache_dir=str(tmp_path), max_workers=2) as cache:
+        downloads = cache.prefetch(tasks)
+        assert set(downloads) == {"t1", "t2"}
+        assert downloads["t2"].result().endswith("t2.png")
+
+
+def test_failed_download_is_not_indexed(tmp_path, client):
+    with FileCache(client, cache_dir=str(tmp_path)) as cache:
+        with pytest.raises(KeyError):
+            cache.fetch("missing", "missing.txt")
+        assert cache.path_for("missing") is None
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".part")]
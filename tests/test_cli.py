@@ -0,0 +1,92 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+
+from the_bot.cli import cli, load_tasks, run_in_processes
+from the_bot.journal import RunJournal
+
+
+def write_tasks(path, tasks):
+    path.write_text("\n".join(json.dumps(t) for t in tasks) + "\n", encoding="utf-8")
+
+
+TASKS = [
+    {"task_id": "t1", "question": "first question", "file_name": ""},
+    {"task_id": "t2", "question": "second question", "file_name": "data.csv"},
+    {"task_id": "t3", "question": "", "file_name": ""},
+]
+
+
+def test_load_tasks_from_jsonl(tmp_path):
+    path = tmp_path / "tasks.jsonl"
+    write_tasks(path, TASKS)
+    assert [t["task_id"] for t in load_tasks(str(path), "http://unused")] == ["t1", "t2", "t3"]
+
+
+def fake_answer(question, file_name, raise_errors=False):
+    return f"{question.split()[0]}:{file_name}"
+
+
+@patch("the_bot.cli.get_agent", return_value=MagicMock(side_effect=fake_answer))
+def test_run_writes_journal(mock_get_agent, tmp_path):
+    tasks_path, output = tmp_path / "tasks.jsonl", tmp_path / "answers.jsonl"
+    write_tasks(tasks_path, TASKS)
+
+    result = CliRunner().invoke(cli, [
+        "run", "--input", str(tasks_path), "--output", str(output),
+        "--threads", "2", "--file-cache", str(tmp_path / "cache"),
+    ])
+
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    answers = {r["task_id"]: r["answer"] for r in records}
+    assert answers == {"t1": "first:", "t2": "second:data.csv"}
+    assert all("elapsed" in r for r in records)
+    mock_get_agent.return_value.prefetch_similar.assert_called_once_with(
+        [("first question", ""), ("second question", "data.csv")]
+    )
+
+
+@patch("the_bot.cli.get_agent", return_value=MagicMock(side_effect=fake_answer))
+def test_run_resume_skips_answered_tasks(mock_get_agent, tmp_path):
+    tasks_path, output = tmp_path / "tasks.jsonl", tmp_path / "answers.jsonl"
+    write_tasks(tasks_path, TASKS)
+    output.write_text(json.dumps({"task_id": "t1", "question": "first question", "answer": "cached",
+                                  "status": "ok", "elapsed": 1.0}) + "\n")
+
+    result = CliRunner().invoke(cli, [
+        "run", "--input", str(tasks_path), "--output", str(output), "--resume",
+        "--file-cache", str(tmp_path / "cache"),
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert "1 already answered, 1 to run" in result.output
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["task_id"] for r in records] == ["t1", "t2"]
+
+
+def _no_agent():
+    """Worker initializer of the process tests, which need no agent."""
+
+
+def _answer_or_crash(task):
+    # Run in a spawned worker: "crash" kills it like the OOM killer would
+    if task["question"] == "crash":
+        os._exit(1)
+    return {"task_id": task["task_id"], "question": task["question"], "answer": task["question"].upper(),
+            "status": "ok", "elapsed": 0.0}
+
+
+def test_dead_worker_only_fails_its_task(tmp_path):
+    tasks = [{"task_id": f"t{i}", "question": q} for i, q in enumerate(["a", "b", "crash", "c", "d"])]
+    journal = RunJournal(str(tmp_path / "answers.jsonl"))
+
+    results = run_in_processes(tasks, {}, 2, journal, initializer=_no_agent, answer_task=_answer_or_crash)
+
+    assert [r["status"] for r in results] == ["ok", "ok", "error", "ok", "ok"]
+    assert [r["answer"] for r in results if r["status"] == "ok"] == ["A", "B", "C", "D"]
+    records = journal.load()
+    assert set(records) == {"t0", "t1", "t2", "t3", "t4"}
+    assert set(journal.completed()) == {"t0", "t1", "t3", "t4"}
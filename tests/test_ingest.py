@@ -0,0 +1,143 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from click.testing import CliRunner
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from the_bot.agents import core
+from the_bot.agents.local_index import LocalVectorStore
+from the_bot.agents.retrieval_cache import GENERATION_FILE
+from the_bot.cli import cli
+from the_bot.ingest import LocalIndexSink, SupabaseSink, ingest, iter_jsonl, normalize_record
+
+RECORDS = [
+    {"task_id": "t1", "Question": "What is  the capital\r\nof France? ", "Final answer": "Paris"},
+    {"task_id": "t2", "question": "Who wrote Hamlet?", "answer": "Shakespeare"},
+    {"task_id": "t3", "Question": "Missing answer"},
+    {"task_id": "t1-copy", "Question": "What is the capital\nof France?", "Final answer": "Paris"},
+]
+
+
+def write_jsonl(path, records):
+    path.write_text("\n".join(json.dumps(r) for r in records) + "\n", encoding="utf-8")
+
+
+def test_normalize_record():
+    content, metadata = normalize_record(RECORDS[0])
+    assert content == "Question : What is the capital\nof France?\n\nFinal answer : Paris"
+    assert metadata["source"] == "t1"
+    assert normalize_record(RECORDS[3])[1]["content_hash"] == metadata["content_hash"]
+    assert normalize_record(RECORDS[2]) is None
+
+
+def test_iter_jsonl_skips_invalid_lines(tmp_path):
+    path = tmp_path / "records.jsonl"
+    path.write_text('{"Question": "q", "Final answer": "a"}\nnot json\n\n[1, 2]\n', encoding="utf-8")
+    assert list(iter_jsonl(str(path))) == [{"Question": "q", "Final answer": "a"}]
+
+
+def test_ingest_is_incremental(tmp_path):
+    embeddings = MagicMock(wraps=DeterministicFakeEmbedding(size=16))
+    path = str(tmp_path / "index")
+
+    stats = ingest(RECORDS, embeddings, LocalIndexSink(path), batch_size=1)
+    assert stats == {"read": 4, "invalid": 1, "duplicates": 1, "added": 2}
+    assert embeddings.embed_documents.call_count == 2
+
+    more = RECORDS + [{"task_id": "t4", "Question": "1 + 1?", "Final answer": "2"}]
+    stats = ingest(more, embeddings, LocalIndexSink(path), batch_size=10)
+    assert stats == {"read": 5, "invalid": 1, "duplicates": 3, "added": 1}
+    assert embeddings.embed_documents.call_args.args == (["Question : 1 + 1?\n\nFinal answer : 2"],)
+
+    store = LocalVectorStore.load(path, DeterministicFakeEmbedding(size=16))
+    assert len(store) == 3
+    assert store.similarity_search("Question : Who wrote Hamlet?\n\nFinal answer : Shakespeare", k=1)[0].metadata[
+        "source"
+    ] == "t2"
+
+
+def test_failed_batch_keeps_written_documents(tmp_path):
+    embeddings = MagicMock(wraps=DeterministicFakeEmbedding(size=16))
+    embeddings.embed_documents.side_effect = [[[1.0] * 16], RuntimeError("out of memory")]
+    path = str(tmp_path / "index")
+
+    with pytest.raises(RuntimeError):
+        ingest(RECORDS, embeddings, LocalIndexSink(path), batch_size=1)
+
+    assert len(LocalVectorStore.load(path, None)) == 1
+
+
+def test_batches_are_added_to_the_index_at_checkpoints(tmp_path):
+    path = str(tmp_path / "index")
+    sink = LocalIndexSink(path, checkpoint_every=4)
+
+    with patch.object(LocalVectorStore, "add_vectors", autospec=True, side_effect=LocalVectorStore.add_vectors) as add:
+        for i in range(5):
+            sink.write([f"doc {i}"], [{"content_hash": str(i)}], [[float(i), 1.0]])
+        # Saved at the checkpoint, before close
+        assert len(LocalVectorStore.load(path, None)) == 4
+        sink.close()
+
+    assert add.call_count == 2
+    assert len(LocalVectorStore.load(path, None)) == 5
+
+
+def test_supabase_sink_upserts_batches():
+    client = MagicMock()
+    query = client.table.return_value.select.return_value.order.return_value
+    query.range.return_value.execute.return_value.data = [
+        {"id": 1, "content": "", "metadata": {"content_hash": normalize_record(RECORDS[1])[1]["content_hash"]}},
+        # Loaded by hand, without a content hash
+        {"id": 2, "content": "Question : 1 + 1?\n\nFinal answer : 2 ", "metadata": {}},
+    ]
+    records = RECORDS + [{"Question": "1 + 1?", "Final answer": "2"}]
+
+    stats = ingest(records, DeterministicFakeEmbedding(size=4), SupabaseSink(client), batch_size=10)
+
+    assert stats["added"] == 1
+    upsert = client.table.return_value.upsert
+    assert upsert.call_args.kwargs == {"on_conflict": "content", "ignore_duplicates": True}
+    rows = upsert.call_args.args[0]
+    assert [row["metadata"]["source"] for row in rows] == ["t1"]
+    assert len(rows[0]["embedding"]) == 4
+
+
+def test_running_agent_reloads_the_index_after_an_ingestion(tmp_path, monkeypatch):
+    embedding = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(core, "HuggingFaceEmbeddings", lambda model_name: embedding)
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "index")
+    ingest(RECORDS[:1], embedding, LocalIndexSink(path), generation_path=GENERATION_FILE)
+    llm = MagicMock()
+    llm.bind_tools.return_value = core.RunnableLambda(lambda messages: AIMessage(content="ok"))
+    agent = core.Agent(llm=llm, vector_index_path=path, hybrid_retrieval=True, tools=[], system_prompt="Be brief.")
+    other = core.Agent(llm=llm, vector_index_path=path, hybrid_retrieval=True, tools=[], system_prompt="Be brief.")
+    hamlet = "Question : Who wrote Hamlet?\n\nFinal answer : Shakespeare"
+    assert agent._retrieve_similar(hamlet)[0].metadata["source"] == "t1"
+
+    ingest(RECORDS[1:2], embedding, LocalIndexSink(path), generation_path=GENERATION_FILE)
+
+    assert agent._retrieve_similar(hamlet)[0].metadata["source"] == "t2"
+    assert agent.vector_store.similarity_search("Hamlet", k=1)[0].metadata["source"] == "t2"
+    assert len(agent.vector_store.dense) == 2
+    # The other agent gets the stores already reloaded
+    other._refresh_stores()
+    assert other.vector_store is agent.vector_store
+    agent.close()
+    other.close()
+
+
+@patch("langchain_huggingface.HuggingFaceEmbeddings", return_value=DeterministicFakeEmbedding(size=16))
+def test_ingest_command(mock_embeddings, tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_EMBEDDING_CACHE", str(tmp_path / "embeddings.sqlite"))
+    # The command touches the generation file under .cache
+    monkeypatch.chdir(tmp_path)
+    records = tmp_path / "records.jsonl"
+    write_jsonl(records, RECORDS)
+
+    result = CliRunner().invoke(cli, ["ingest", str(records), "--index-path", str(tmp_path / "index")])
+
+    assert result.exit_code == 0, result.output
+    assert "2 added, 1 already ingested or duplicated, 1 invalid" in result.output
@@ -0,0 +1,66 @@
+from the_bot.journal import RunJournal
+from the_bot.runner import run_tasks
+
+
+def test_record_and_load(tmp_path):
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    journal.record({"task_id": "t1", "answer": "a", "status": "ok", "elapsed": 1.5})
+    journal.record({"task_id": "t2", "answer": "err", "status": "error", "elapsed": 0.1})
+
+    records = journal.load()
+    assert set(records) == {"t1", "t2"}
+    assert records["t1"]["answer"] == "a"
+    assert records["t1"]["elapsed"] == 1.5
+    assert "ts" in records["t1"]
+
+
+def test_load_missing_file(tmp_path):
+    assert RunJournal(str(tmp_path / "missing.jsonl")).load() == {}
+
+
+def test_last_record_wins(tmp_path):
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    journal.record({"task_id": "t1", "answer": "boom", "status": "error"})
+    journal.record({"task_id": "t1", "answer": "fixed", "status": "ok"})
+    assert journal.load()["t1"]["answer"] == "fixed"
+
+
+def test_completed_excludes_failures(tmp_path):
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    journal.record({"task_id": "t1", "answer": "a", "status": "ok"})
+    journal.record({"task_id": "t2", "answer": "err", "status": "error"})
+    assert set(journal.completed()) == {"t1"}
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = RunJournal(str(path))
+    journal.record({"task_id": "t1", "answer": "a", "status": "ok"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"task_id": "t2", "ans')
+    assert set(journal.load()) == {"t1"}
+
+
+def test_record_after_a_torn_last_line_is_kept(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    RunJournal(str(path)).record({"task_id": "t1", "answer": "a", "status": "ok"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"task_id": "t2", "ans')
+
+    # The resumed run appends to the torn journal
+    journal = RunJournal(str(path))
+    journal.record({"task_id": "t2", "answer": "b", "status": "ok"})
+    journal.record({"task_id": "t3", "answer": "c", "status": "ok"})
+
+    records = journal.load()
+    assert set(records) == {"t1", "t2", "t3"}
+    assert records["t2"]["answer"] == "b"
+
+
+def test_run_tasks_writes_journal(tmp_path):
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    tasks = [{"task_id": f"t{i}", "question": f"q{i}"} for i in range(4)]
+    run_tasks(lambda q, f: q.upper(), tasks, max_workers=2, on_result=journal.record)
+    records = journal.load()
+    assert len(records) == 4
+    assert records["t3"]["answer"] == "Q3"
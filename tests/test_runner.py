@@ -0,0 +1,70 @@
+import threading
+import time
+
+from the_bot.runner import run_task, run_tasks
+
+TASKS = [
+    {"task_id": "t1", "question": "q1", "file_name": ""},
+    {"task_id": "t2", "question": "q2", "file_name": "f2.xlsx"},
+    {"task_id": "t3", "question": "q3", "file_name": ""},
+]
+
+
+def echo(question, file_name):
+    return f"{question}|{file_name}"
+
+
+def test_run_task_success():
+    result = run_task(echo, TASKS[1])
+    assert result["task_id"] == "t2"
+    assert result["answer"] == "q2|f2.xlsx"
+    assert result["status"] == "ok"
+    assert result["elapsed"] >= 0
+
+
+def test_run_task_failure_is_isolated():
+    def boom(question, file_name):
+        raise RuntimeError("provider down")
+
+    result = run_task(boom, TASKS[0])
+    assert result["status"] == "error"
+    assert "provider down" in result["answer"]
+
+
+def test_run_tasks_skips_invalid_tasks():
+    tasks = TASKS + [{"task_id": "", "question": "q"}, {"task_id": "t4", "question": ""}]
+    results = run_tasks(echo, tasks)
+    assert [r["task_id"] for r in results] == ["t1", "t2", "t3"]
+
+
+def test_run_tasks_concurrent_keeps_order():
+    def slow(question, file_name):
+        # First task is the slowest, so completion order differs from task order
+        time.sleep(0.1 if question == "q1" else 0.01)
+        return question
+
+    results = run_tasks(slow, TASKS, max_workers=3)
+    assert [r["answer"] for r in results] == ["q1", "q2", "q3"]
+
+
+def test_run_tasks_concurrent_runs_in_parallel():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def wait_for_all(question, file_name):
+        # Only succeeds if the three tasks are in flight at the same time
+        barrier.wait()
+        return question
+
+    results = run_tasks(wait_for_all, TASKS, max_workers=3)
+    assert all(r["status"] == "ok" for r in results)
+
+
+def test_run_tasks_concurrent_isolates_failures():
+    def flaky(question, file_name):
+        if question == "q2":
+            raise ValueError("bad task")
+        return question
+
+    results = run_tasks(flaky, TASKS, max_workers=2)
+    assert [r["status"] for r in results] == ["ok", "error", "ok"]
+    assert results[0]["answer"] == "q1"